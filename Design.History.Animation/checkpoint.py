@@ -0,0 +1,134 @@
+#Description-Checkpoint manifest for resuming history animations
+
+# The manifest lives next to the History_Animation_<filename>/ output folder
+# and records, per completed timeline item, the frame counter, camera and the
+# checksums of the files written for it. A resumed run skips every item
+# whose frames are still on disk and verify.
+
+import hashlib, json, os, threading
+
+def fileChecksum(file):
+    sha = hashlib.sha256()
+    with open(file, 'rb') as fh:
+        for block in iter(lambda: fh.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class Checkpoint:
+    def __init__(self, file, indices, settings):
+        # indices: timeline indices of the planned items the run renders, in
+        # order; skipped timeline items are not among them.
+        # settings: the render parameters a checkpoint is only valid for.
+        self._file = file
+        self._indices = list(indices)
+        self._settings = settings
+        self._items = []
+        self._incomplete = False
+        self._lock = threading.Lock()
+
+    @property
+    def file(self):
+        return self._file
+
+    @property
+    def lastIndex(self):
+        '''Timeline index of the last completed item, or None.'''
+        return self._items[-1]['index'] if self._items else None
+
+    @property
+    def num(self):
+        '''Frame counter after the last completed item.'''
+        return self._items[-1]['num'] if self._items else 0
+
+    @property
+    def camera(self):
+        '''(eye, target, upVector) after the last completed item, or None.'''
+        return self._items[-1]['camera'] if self._items else None
+
+    def load(self):
+        '''Load the manifest and keep the leading items whose frames verify.
+        Returns the number of items kept.'''
+        self._items = []
+        try:
+            with open(self._file, 'r') as fh:
+                manifest = json.load(fh)
+        except (OSError, ValueError):
+            return 0
+        if manifest.get('settings') != self._settings:
+            return 0
+        directory = os.path.dirname(self._file)
+        for position, item in enumerate(manifest.get('items', [])):
+            # Only a prefix of the planned items is valid.
+            if position >= len(self._indices) or item['index'] != self._indices[position]:
+                break
+            try:
+                verified = all(fileChecksum(os.path.join(directory, name)) == checksum
+                               for name, checksum in item['frames'].items())
+            except OSError:
+                verified = False
+            if not verified:
+                break
+            self._items.append(item)
+        return len(self._items)
+
+    def reset(self):
+        with self._lock:
+            self._items = []
+            self._incomplete = False
+            if os.path.exists(self._file):
+                os.remove(self._file)
+
+    def itemCompleted(self, index, num, files, camera):
+        '''Record a completed timeline item once its files are on disk. Items
+        have to complete in the planned order without gaps; an item out of order
+        stops the recording, so a resume renders again from the last item
+        recorded before it.'''
+        directory = os.path.dirname(self._file)
+        with self._lock:
+            if self._incomplete:
+                return
+            position = len(self._items)
+            if position >= len(self._indices) or index != self._indices[position]:
+                self._incomplete = True
+                return
+            frames = {}
+            try:
+                for file in files:
+                    frames[os.path.relpath(file, directory).replace(os.sep, '/')] = fileChecksum(file)
+            except OSError:
+                # A frame failed to save; stop recording so a resume renders this
+                # item again.
+                self._incomplete = True
+                return
+            self._items.append({'index': index, 'num': num, 'camera': camera, 'frames': frames})
+            self._save()
+
+    def _save(self):
+        manifest = {'settings': self._settings, 'items': self._items}
+        with open(self._file + '.tmp', 'w') as fh:
+            json.dump(manifest, fh)
+        os.replace(self._file + '.tmp', self._file)
+
+
+if __name__ == '__main__':
+    import tempfile
+    folder = tempfile.mkdtemp()
+    frame = os.path.join(folder, 'frame.png')
+    with open(frame, 'wb') as fh:
+        fh.write(b'frame')
+    # Items 0, 2 and 4 are sketches and not planned.
+    planned = [1, 3, 5, 6]
+    checkpoint = Checkpoint(os.path.join(folder, 'checkpoint.json'), planned, {'start': 0})
+    checkpoint.itemCompleted(1, 10, [frame], None)
+    checkpoint.itemCompleted(3, 20, [], None)
+    resumed = Checkpoint(checkpoint.file, planned, {'start': 0})
+    assert resumed.load() == 2 and resumed.lastIndex == 3 and resumed.num == 20
+    # Out of order: 6 before 5 stops the recording at 3.
+    checkpoint.itemCompleted(6, 40, [], None)
+    checkpoint.itemCompleted(5, 30, [], None)
+    assert checkpoint.lastIndex == 3
+    assert Checkpoint(checkpoint.file, planned, {'start': 0}).load() == 2
+    # A changed plan keeps only the items it still starts with.
+    assert Checkpoint(checkpoint.file, [1, 2, 3], {'start': 0}).load() == 1
+    print('ok')
@@ -1,7 +1,8 @@
 #Author-Amanda Ghassaei
 #Description-Turn your Fusion360 design history timeline into an animation
 
-import adsk.core, adsk.fusion, traceback, math, os
+import adsk.core, adsk.fusion, traceback, math, os, shutil, tempfile, time
+from . import checkpoint, contact_sheet, feature_animators, frame_plan, frame_writer, mesh_cache, mesh_export, parameter_batch, render_cache, shard_coordinator, video_encoder
 
 app = adsk.core.Application.get()
 if app:
@@ -29,6 +30,8 @@ class CommandExecuteHandler(adsk.core.CommandEventHandler):
                     timelapse.outputPath = input.value
                 elif input.id == 'saveObj':
                     timelapse.saveObj = input.value
+                elif input.id == 'meshFormat':
+                    timelapse.meshFormat = input.selectedItem.name
                 elif input.id == 'width':
                     timelapse.width = input.value
                 elif input.id == 'height':
@@ -38,12 +41,56 @@ class CommandExecuteHandler(adsk.core.CommandEventHandler):
                     timelapse.end = input.valueTwo
                 elif input.id == 'interpolationFrames':
                     timelapse.interpolationFrames = input.value
+                elif input.id == 'frameAllocation':
+                    timelapse.frameAllocation = input.selectedItem.name
+                elif input.id == 'frameBudget':
+                    timelapse.frameBudget = input.value
+                elif input.id == 'minFrames':
+                    timelapse.minFrames = input.value
+                elif input.id == 'maxFrames':
+                    timelapse.maxFrames = input.value
                 elif input.id == 'rotate':
                     timelapse.rotate = input.value
                 elif input.id == 'framesPerRotation':
                     timelapse.framesPerRotation = input.value
                 elif input.id == 'finalFrames':
                     timelapse.finalFrames = input.value
+                elif input.id == 'writerThreads':
+                    timelapse.writerThreads = input.value
+                elif input.id == 'videoFormat':
+                    timelapse.videoFormat = input.selectedItem.name
+                elif input.id == 'frameRate':
+                    timelapse.frameRate = input.value
+                elif input.id == 'videoCrf':
+                    timelapse.videoCrf = input.value
+                elif input.id == 'videoBitrate':
+                    timelapse.videoBitrate = input.value
+                elif input.id == 'keepFrames':
+                    timelapse.keepFrames = input.value
+                elif input.id == 'resume':
+                    timelapse.resume = input.value
+                elif input.id == 'duplicateFrames':
+                    timelapse.duplicateFrames = input.selectedItem.name
+                elif input.id == 'renderCache':
+                    timelapse.renderCache = input.value
+                elif input.id == 'renderCacheFolder':
+                    timelapse.renderCacheFolder = input.value
+                elif input.id == 'renderCacheSize':
+                    timelapse.renderCacheSize = input.value
+                elif input.id == 'preview':
+                    timelapse.preview = input.value
+                elif input.id == 'previewFrames':
+                    timelapse.previewFrames = input.value
+                elif input.id == 'previewScale':
+                    timelapse.previewScale = input.value
+                elif input.id == 'dryRun':
+                    timelapse.dryRun = input.value
+                elif input.id == 'shards':
+                    timelapse.shards = input.value
+                elif input.id == 'shardFile':
+                    timelapse.shardFile = input.value
+                elif input.id == 'shardIndex':
+                    timelapse.shardIndex = input.value
 
             timelapse.collectFrames()
 
@@ -87,7 +134,10 @@ class CommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             # File params.
             inputs.addStringValueInput('filename', 'Filename', timelapse.filename)
             inputs.addStringValueInput('outputPath', 'Output Path', timelapse.outputPath)
-            inputs.addBoolValueInput('saveObj', 'Save .obj Files', True, '', timelapse.saveObj)
+            inputs.addBoolValueInput('saveObj', 'Save Mesh Files', True, '', timelapse.saveObj)
+            meshFormatInput = inputs.addDropDownCommandInput('meshFormat', 'Mesh Format', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for meshFormat in mesh_export.exporters:
+                meshFormatInput.listItems.add(meshFormat, meshFormat == timelapse.meshFormat)
             inputs.addIntegerSpinnerCommandInput('width', 'Image Width (px)', 1, max_int, 1, timelapse.width)
             inputs.addIntegerSpinnerCommandInput('height', 'Image Height (px)', 1, max_int, 1, timelapse.height)
             # Animation params.
@@ -95,9 +145,47 @@ class CommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             inputs.itemById('range').valueOne = timelapse.start
             inputs.itemById('range').valueTwo = timelapse.end
             inputs.addIntegerSpinnerCommandInput('interpolationFrames', 'Frames per Operation', 1, max_int, 1, timelapse.interpolationFrames)
+            frameAllocationInput = inputs.addDropDownCommandInput('frameAllocation', 'Frame Allocation', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for mode in ('Fixed', 'Adaptive'):
+                frameAllocationInput.listItems.add(mode, mode == timelapse.frameAllocation)
+            frameAllocationInput.tooltip = 'Adaptive splits the frame budget across operations in proportion to how much each changes the design.'
+            inputs.addIntegerSpinnerCommandInput('frameBudget', 'Frame Budget (0 = Frames per Operation each)', 0, max_int, 1, timelapse.frameBudget)
+            inputs.addIntegerSpinnerCommandInput('minFrames', 'Min Frames per Operation', 1, max_int, 1, timelapse.minFrames)
+            inputs.addIntegerSpinnerCommandInput('maxFrames', 'Max Frames per Operation', 1, max_int, 1, timelapse.maxFrames)
             inputs.addBoolValueInput('rotate', 'Should Rotate Design', True, '', timelapse.rotate)
             inputs.addIntegerSpinnerCommandInput('framesPerRotation', 'Frames per Rotation', 1, max_int, 1, timelapse.framesPerRotation)
             inputs.addIntegerSpinnerCommandInput('finalFrames', 'Num Final Frames', 0, max_int, 1, timelapse.finalFrames)
+            # Output params.
+            inputs.addIntegerSpinnerCommandInput('writerThreads', 'Writer Threads', 0, 16, 1, timelapse.writerThreads)
+            # Video params.
+            videoFormatInput = inputs.addDropDownCommandInput('videoFormat', 'Encode Video', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for videoFormat in video_encoder.videoFormats:
+                videoFormatInput.listItems.add(videoFormat, videoFormat == timelapse.videoFormat)
+            videoFormatInput.tooltip = 'MP4 needs ffmpeg on the PATH and falls back to APNG without it.'
+            inputs.addIntegerSpinnerCommandInput('frameRate', 'Frame Rate', 1, 240, 1, timelapse.frameRate)
+            inputs.addIntegerSpinnerCommandInput('videoCrf', 'Video CRF', 0, 51, 1, timelapse.videoCrf)
+            inputs.addIntegerSpinnerCommandInput('videoBitrate', 'Video Bitrate (kbps, 0 = CRF)', 0, max_int, 100, timelapse.videoBitrate)
+            inputs.addBoolValueInput('keepFrames', 'Keep Frame Images', True, '', timelapse.keepFrames)
+            inputs.addBoolValueInput('resume', 'Resume From Checkpoint', True, '', timelapse.resume)
+            duplicateFramesInput = inputs.addDropDownCommandInput('duplicateFrames', 'Repeated Frames', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for mode in ('Render', 'Hardlink', 'Frame Index'):
+                duplicateFramesInput.listItems.add(mode, mode == timelapse.duplicateFrames)
+            duplicateFramesInput.tooltip = 'How to output frames whose camera and model did not change since the previous frame.'
+            renderCacheInput = inputs.addBoolValueInput('renderCache', 'Reuse Cached Frames', True, '', timelapse.renderCache)
+            renderCacheInput.tooltip = 'Link frames rendered before from the same saved document version, parameters and camera instead of rendering them again.'
+            inputs.addStringValueInput('renderCacheFolder', 'Frame Cache Folder', timelapse.renderCacheFolder)
+            inputs.addIntegerSpinnerCommandInput('renderCacheSize', 'Frame Cache Size (MB)', 1, max_int, 100, timelapse.renderCacheSize)
+            previewInput = inputs.addBoolValueInput('preview', 'Preview Contact Sheet', True, '', timelapse.preview)
+            previewInput.tooltip = 'Render a sample of the frames at low resolution into one image, then optionally the full animation.'
+            inputs.addIntegerSpinnerCommandInput('previewFrames', 'Preview Frames', 1, 1000, 1, timelapse.previewFrames)
+            inputs.addIntegerSpinnerCommandInput('previewScale', 'Preview Scale Down', 1, 64, 1, timelapse.previewScale)
+            dryRunInput = inputs.addBoolValueInput('dryRun', 'Dry Run', True, '', timelapse.dryRun)
+            dryRunInput.tooltip = 'Only plan the animation and report its frame count, without rendering.'
+            # Parallel rendering params.
+            shardsInput = inputs.addIntegerSpinnerCommandInput('shards', 'Parallel Shards', 1, 64, 1, timelapse.shards)
+            shardsInput.tooltip = 'With more than one shard, only write a shard spec file; render each shard from it in its own Fusion instance.'
+            inputs.addStringValueInput('shardFile', 'Shard Spec File', timelapse.shardFile)
+            inputs.addIntegerSpinnerCommandInput('shardIndex', 'Shard Index', 0, 63, 1, timelapse.shardIndex)
 
         except:
             if ui:
@@ -111,16 +199,43 @@ class HistoryTimelapse:
         self._filename = dataFile.name
         self._outputPath = os.path.expanduser("~/Desktop/")
         self._saveObj = False
+        self._meshFormat = 'obj'
         self._timeline = design.timeline
         self._width = 2000
         self._height = 2000
         self._start = 1
         self._end = self._timeline.markerPosition
         self._interpolationFrames = 5
+        self._frameAllocation = 'Fixed'
+        self._frameBudget = 0
+        self._minFrames = 1
+        self._maxFrames = 50
         self._rotate = True
         self._framesPerRotation = 500
         self._finalFrames = 0
+        self._writerThreads = 2
+        self._videoFormat = 'None'
+        self._frameRate = 30
+        self._videoCrf = 20
+        self._videoBitrate = 0
+        self._keepFrames = False
+        self._resume = False
+        self._duplicateFrames = 'Hardlink'
+        self._renderCache = False
+        self._renderCacheFolder = os.path.expanduser('~/.fusion_render_cache/')
+        self._renderCacheSize = 2048
+        self._preview = False
+        self._previewFrames = 24
+        self._previewScale = 8
+        self._dryRun = False
+        self._shards = 1
+        self._shardFile = ''
+        self._shardIndex = 0
         self._design = design
+        self._meshCache = None
+        self._frameCache = None
+        self._timelineKeys = None
+        self._framePlan = None
 
     # Properties.
     @property
@@ -144,6 +259,13 @@ class HistoryTimelapse:
     def saveObj(self, value):
         self._saveObj = value
 
+    @property
+    def meshFormat(self):
+        return self._meshFormat
+    @meshFormat.setter
+    def meshFormat(self, value):
+        self._meshFormat = value
+
     @property
     def timeline(self):
         return self._timeline
@@ -183,6 +305,40 @@ class HistoryTimelapse:
     def interpolationFrames(self, value):
         self._interpolationFrames = value
 
+    @property
+    def frameAllocation(self):
+        return self._frameAllocation
+    @frameAllocation.setter
+    def frameAllocation(self, value):
+        self._frameAllocation = value
+
+    @property
+    def frameBudget(self):
+        return self._frameBudget
+    @frameBudget.setter
+    def frameBudget(self, value):
+        if value < 0:
+            value = 0
+        self._frameBudget = value
+
+    @property
+    def minFrames(self):
+        return self._minFrames
+    @minFrames.setter
+    def minFrames(self, value):
+        if value < 1:
+            value = 1
+        self._minFrames = value
+
+    @property
+    def maxFrames(self):
+        return self._maxFrames
+    @maxFrames.setter
+    def maxFrames(self, value):
+        if value < 1:
+            value = 1
+        self._maxFrames = value
+
     @property
     def rotate(self):
         return self._rotate
@@ -206,24 +362,349 @@ class HistoryTimelapse:
             value = 0
         self._finalFrames = value
 
+    @property
+    def writerThreads(self):
+        return self._writerThreads
+    @writerThreads.setter
+    def writerThreads(self, value):
+        if value < 0:
+            value = 0
+        self._writerThreads = value
+
+    @property
+    def videoFormat(self):
+        return self._videoFormat
+    @videoFormat.setter
+    def videoFormat(self, value):
+        self._videoFormat = value
+
+    @property
+    def frameRate(self):
+        return self._frameRate
+    @frameRate.setter
+    def frameRate(self, value):
+        if value < 1:
+            value = 1
+        self._frameRate = value
+
+    @property
+    def videoCrf(self):
+        return self._videoCrf
+    @videoCrf.setter
+    def videoCrf(self, value):
+        self._videoCrf = value
+
+    @property
+    def videoBitrate(self):
+        return self._videoBitrate
+    @videoBitrate.setter
+    def videoBitrate(self, value):
+        self._videoBitrate = value
+
+    @property
+    def keepFrames(self):
+        return self._keepFrames
+    @keepFrames.setter
+    def keepFrames(self, value):
+        self._keepFrames = value
+
+    @property
+    def resume(self):
+        return self._resume
+    @resume.setter
+    def resume(self, value):
+        self._resume = value
+
+    @property
+    def duplicateFrames(self):
+        return self._duplicateFrames
+    @duplicateFrames.setter
+    def duplicateFrames(self, value):
+        self._duplicateFrames = value
+
+    @property
+    def renderCache(self):
+        return self._renderCache
+    @renderCache.setter
+    def renderCache(self, value):
+        self._renderCache = value
+
+    @property
+    def renderCacheFolder(self):
+        return self._renderCacheFolder
+    @renderCacheFolder.setter
+    def renderCacheFolder(self, value):
+        self._renderCacheFolder = value
+
+    @property
+    def renderCacheSize(self):
+        return self._renderCacheSize
+    @renderCacheSize.setter
+    def renderCacheSize(self, value):
+        if value < 1:
+            value = 1
+        self._renderCacheSize = value
+
+    @property
+    def preview(self):
+        return self._preview
+    @preview.setter
+    def preview(self, value):
+        self._preview = value
+
+    @property
+    def previewFrames(self):
+        return self._previewFrames
+    @previewFrames.setter
+    def previewFrames(self, value):
+        if value < 1:
+            value = 1
+        self._previewFrames = value
+
+    @property
+    def previewScale(self):
+        return self._previewScale
+    @previewScale.setter
+    def previewScale(self, value):
+        if value < 1:
+            value = 1
+        self._previewScale = value
+
+    @property
+    def dryRun(self):
+        return self._dryRun
+    @dryRun.setter
+    def dryRun(self, value):
+        self._dryRun = value
+
+    @property
+    def shards(self):
+        return self._shards
+    @shards.setter
+    def shards(self, value):
+        if value < 1:
+            value = 1
+        self._shards = value
+
+    @property
+    def shardFile(self):
+        return self._shardFile
+    @shardFile.setter
+    def shardFile(self, value):
+        self._shardFile = value
+
+    @property
+    def shardIndex(self):
+        return self._shardIndex
+    @shardIndex.setter
+    def shardIndex(self, value):
+        self._shardIndex = value
+
     @property
     def design(self):
         return self._design
 
-    def isNumericExtent(self, extent):
-        classname = type(extent).__name__
-        # ui.messageBox(classname)
-        if classname == 'DistanceExtentDefinition':
-            return True
-        if classname == 'SymmetricExtentDefinition':
-            return True
-        if classname == 'AngleExtentDefinition':
-            return True
-        return False
+    # Render settings shared by all shards of a parallel render.
+    shardSettings = ('filename', 'outputPath', 'saveObj', 'meshFormat', 'width', 'height', 'start', 'end',
+                     'interpolationFrames', 'frameAllocation', 'frameBudget', 'minFrames', 'maxFrames',
+                     'rotate', 'framesPerRotation', 'finalFrames', 'duplicateFrames')
+
+    def classifyItem(self, i):
+        '''(entity, animator) of timeline item i, or None if it is skipped'''
+        try:
+            # Get feature at current timeline index.
+            item = self.timeline.item(i)
+
+            # If item is suppressed, ignore.
+            if item.isSuppressed:
+                return None
+            # If item is group, ignore.
+            if item.isGroup:
+                return None
+            # # If item has an error, ignore.
+            # TODO: Move is throwing error here.
+            # if item.healthState == 2: # ErrorFeatureHealthState
+            #     return None
+
+            entity = item.entity
+            # TODO: Move TimelineObject is not working properly here.
+            if not entity:
+                return None
+            animator = feature_animators.animatorFor(type(entity).__name__)
+            if not animator:
+                return None
+            return entity, animator
+        except:
+            return None
+
+    def framePlan(self, start, end):
+        '''Plan the frames of the items from start to end, reusing the last
+        plan while the timeline and its planned parameters are unchanged'''
+        key = (start, end, self.interpolationFrames, self.finalFrames, self.frameAllocation,
+               self.frameBudget, self.minFrames, self.maxFrames, self.timeline.count)
+        if self._framePlan and self._framePlan.isCurrent(key):
+            return self._framePlan
+        classified = []
+        for i in range(start, end):
+            entityAnimator = self.classifyItem(i)
+            if entityAnimator:
+                classified.append((i,) + entityAnimator)
+
+        # Frames each rendered item animates over.
+        rendered = [(i, entity, animator) for i, entity, animator in classified if animator.rendered]
+        if self.frameAllocation == 'Adaptive':
+            budget = self.frameBudget or self.interpolationFrames * len(rendered)
+            weights = frame_plan.magnitudeWeights([self.featureMagnitude(entity, animator) for _, entity, animator in rendered])
+            counts = frame_plan.allocateFrames(weights, budget, self.minFrames, max(self.minFrames, self.maxFrames))
+        else:
+            counts = [self.interpolationFrames] * len(rendered)
+        itemFrames = dict(zip([i for i, _, _ in rendered], counts))
+
+        items = []
+        for i, entity, animator in classified:
+            interpolationFrames = itemFrames.get(i, 0)
+            frames = interpolationFrames
+            if animator.rendered and i == end - 1:
+                frames += self.finalFrames
+            item = frame_plan.PlanItem(i, entity, type(entity).__name__, frames, animator, interpolationFrames)
+            if interpolationFrames:
+                item = self.planItem(item, interpolationFrames)
+            items.append(item)
+        self._framePlan = frame_plan.FramePlan(key, items)
+        return self._framePlan
+
+    def planItem(self, item, interpolationFrames):
+        '''Let the item's animator plan it. An animator failing on an unusual
+        entity falls back to fading the item in, and failing that to frames
+        of the unchanged item, so the item keeps its frames either way.'''
+        for animator in (item.animator, feature_animators.FadeInAnimator(), feature_animators.defaultAnimator):
+            planned = frame_plan.PlanItem(item.index, item.entity, item.classname, item.frames, animator, interpolationFrames)
+            try:
+                animator.plan(planned, interpolationFrames)
+                return planned
+            except:
+                pass
+        return planned
+
+    def featureMagnitude(self, entity, animator):
+        try:
+            return animator.magnitude(entity)
+        except:
+            return None
+
+    def reportPlan(self, plan):
+        lines = ['{}: {} items, {} frames'.format(classname, items, frames)
+                 for classname, (items, frames) in sorted(plan.summary().items())]
+        total = plan.totalFrames
+        lines.append('Total: {} frames ({:.1f} s at {} fps)'.format(total, total / self.frameRate, self.frameRate))
+        ui.messageBox('\n'.join(lines))
+
+    def writeShardSpec(self):
+        '''Split the render into shards and write the spec file each shard
+        render reads its timeline range, frame numbers and camera from'''
+        outputFolder = self.outputPath + 'History_Animation_' + self.filename + '/'
+        specFile = self.outputPath + 'History_Animation_' + self.filename + '.shards.json'
+        viewport = app.activeViewport
+        viewport.fit()
+        camera = viewport.camera
+        spec = {
+            'filename': self.filename,
+            'outputFolder': outputFolder,
+            'framesPerRotation': self.framesPerRotation if self.rotate else 0,
+            'camera': [[p.x, p.y, p.z] for p in (camera.eye, camera.target, camera.upVector)],
+            'viewExtents': camera.viewExtents,
+            'settings': {name: getattr(self, name) for name in self.shardSettings},
+            'shards': shard_coordinator.planShards(self.framePlan(self.start - 1, self.end).itemFrames(), self.shards),
+        }
+        os.makedirs(outputFolder, exist_ok=True)
+        shard_coordinator.writeSpec(specFile, spec)
+        ui.messageBox('Wrote {} shards to {}.\nRender each shard with this file as Shard Spec File and its Shard Index, '
+                      'in separate Fusion instances on copies of this design.'.format(len(spec['shards']), specFile))
 
     def collectFrames(self):
+        if self.dryRun:
+            self.reportPlan(self.framePlan(self.start - 1, self.end))
+            return
+        if self.preview:
+            self.renderPreview()
+            return
+        self.renderAnimation()
+
+    def renderPreview(self):
+        '''Render a sample of the planned frames at low resolution into a
+        contact sheet, then offer to render the same plan in full'''
+        plan = self.framePlan(self.start - 1, self.end)
+        sample = contact_sheet.sampleFrames(plan.totalFrames, self.previewFrames)
+        sheetFile = self.outputPath + 'History_Animation_' + self.filename + '_preview.png'
+        previewFolder = tempfile.mkdtemp(prefix='preview_')
+        # Leave the design and camera as they were for the full render.
+        markerPosition = self.timeline.markerPosition
+        camera = app.activeViewport.camera
+        writer = frame_writer.FrameWriter(0)
+        try:
+            bitmaps = self.renderFrames(writer, preview=(set(sample), previewFolder))
+            saved = contact_sheet.writeContactSheet(sheetFile, bitmaps)
+        finally:
+            ui.progressBar.hide()
+            writer.close()
+            shutil.rmtree(previewFolder, ignore_errors=True)
+            self.timeline.markerPosition = markerPosition
+            app.activeViewport.camera = camera
+
+        if not saved:
+            ui.messageBox('Failed saving the preview contact sheet.')
+            return
+        result = ui.messageBox('Saved {} of {} frames to {}.\nRender the full animation now?'.format(
+                               len(bitmaps), plan.totalFrames, sheetFile), 'Preview',
+                               adsk.core.MessageBoxButtonTypes.YesNoButtonType,
+                               adsk.core.MessageBoxIconTypes.QuestionIconType)
+        if result == adsk.core.DialogResults.DialogYes:
+            self.renderAnimation()
+
+    def renderAnimation(self):
+        shard = None
+        if self.shardFile:
+            # Render one shard of a parallel render with the spec's settings.
+            spec = shard_coordinator.readSpec(self.shardFile)
+            for name, value in spec['settings'].items():
+                setattr(self, name, value)
+            shard = dict(spec['shards'][self.shardIndex], camera=spec['camera'], viewExtents=spec['viewExtents'],
+                         folder=shard_coordinator.shardFolder(spec['outputFolder'], self.shardIndex))
+        elif self.shards > 1:
+            self.writeShardSpec()
+            return
+
+        # Frames are persisted by a writer pool while the next one renders.
+        writer = frame_writer.FrameWriter(self.writerThreads)
+        # Finished frames are streamed into the video, if one is requested.
+        # Shards only render frames; encode the merged sequence afterwards.
+        encoder = None if shard else video_encoder.createEncoder(
+            self.videoFormat, self.outputPath + 'History_Animation_' + self.filename,
+            self.frameRate, self.videoCrf, self.videoBitrate, self.keepFrames)
+        try:
+            self.renderFrames(writer, encoder, shard)
+        finally:
+            ui.progressBar.hide()
+            try:
+                writer.close()
+            finally:
+                if encoder:
+                    encoder.close()
+
+        if shard:
+            files = [name for name in os.listdir(shard['folder']) if name != 'done.json']
+            shard_coordinator.markShardDone(self.shardFile, self.shardIndex, files)
+            # The last shard to finish merges all of them.
+            if shard_coordinator.mergeShards(self.shardFile):
+                ui.messageBox('All shards finished and merged.')
+
+    def renderFrames(self, writer, encoder=None, shard=None, preview=None):
         start = self.start - 1 # Zero index the start value.
         end = self.end
+        # A shard renders part of the range, numbering its frames from startNum.
+        stop = shard['end'] if shard else end
+        if shard:
+            start = shard['start']
         width = self.width
         height = self.height
         filename = self.filename
@@ -234,6 +715,18 @@ class HistoryTimelapse:
         interpolationFrames = self.interpolationFrames
         framesPerRotation = self.framesPerRotation if self.rotate else 0
         finalFrames = self.finalFrames
+        duplicateFrames = self.duplicateFrames
+        outputFolder = outputPath + 'History_Animation_' + filename + '/'
+        checkpointFile = outputPath + 'History_Animation_' + filename + '.checkpoint.json'
+
+        # A preview renders only the sampled frame numbers, small, as bitmaps
+        # for the contact sheet, and leaves the output folder alone.
+        sample = None
+        previewFiles = []
+        if preview:
+            sample, previewFolder = preview
+            width, height = contact_sheet.scaledSize(width, height, self.previewScale)
+            saveObj = False
 
         viewport = app.activeViewport
         viewport.fit()
@@ -242,206 +735,275 @@ class HistoryTimelapse:
         num = 0
         startingAngle = None
 
-        for i in range(start, end):
-            try:
-                # Get feature at current timeline index.
-                item = timeline.item(i)
+        if shard:
+            outputFolder = shard['folder'] + '/'
+            checkpointFile = outputPath + 'History_Animation_' + filename + '.shard_{}.checkpoint.json'.format(shard['index'])
+            os.makedirs(outputFolder, exist_ok=True)
+            num = shard['startNum']
+            # Start from the shared camera, rotated as far as the preceding shards rotate it.
+            eye, target, upVector = shard['camera']
+            eye = shard_coordinator.rotateEye(eye, num, framesPerRotation)
+            camera.eye = adsk.core.Point3D.create(*eye)
+            camera.target = adsk.core.Point3D.create(*target)
+            camera.upVector = adsk.core.Vector3D.create(*upVector)
+            camera.viewExtents = shard['viewExtents']
+            viewport.camera = camera
 
-                # If item is suppressed, ignore.
-                if item.isSuppressed:
-                    continue
-                # If item is group, ignore.
-                if item.isGroup:
-                    continue
-                # # If item has an error, ignore.
-                # TODO: Move is throwing error here.
-                # if item.healthState == 2: # ErrorFeatureHealthState
-                #     continue
+        plan = self.framePlan(self.start - 1, end)
+        items = [item for item in plan.items if start <= item.index < stop]
 
-                entity = item.entity
-                # TODO: Move TimelineObject is not working properly here.
-                if not entity:
-                    continue
-                classname = type(entity).__name__
+        # The checkpoint manifest sits next to the output folder. When resuming,
+        # skip every item whose frames verify and restore counter and camera.
+        frameCheckpoint = checkpoint.Checkpoint(checkpointFile, [item.index for item in items], {
+            'start': start,
+            'end': end,
+            'stop': stop,
+            'interpolationFrames': interpolationFrames,
+            'frameAllocation': [self.frameAllocation, self.frameBudget, self.minFrames, self.maxFrames],
+            'framesPerRotation': framesPerRotation,
+            'finalFrames': finalFrames,
+            'width': width,
+            'height': height,
+            'meshFormat': self.meshFormat if saveObj else None,
+            'duplicateFrames': duplicateFrames,
+        })
+        resumeIndex = None
+        # A video stream can't be resumed, and its intermediate frames are deleted.
+        if self.resume and not encoder and not preview and frameCheckpoint.load():
+            resumeIndex = frameCheckpoint.lastIndex
+            num = frameCheckpoint.num
+            eye, target, upVector = frameCheckpoint.camera
+            camera = viewport.camera
+            camera.eye = adsk.core.Point3D.create(*eye)
+            camera.target = adsk.core.Point3D.create(*target)
+            camera.upVector = adsk.core.Vector3D.create(*upVector)
+            viewport.camera = camera
+        elif not preview:
+            frameCheckpoint.reset()
 
-                # Some operations should be ignored as they can't be easily animated.
-                # TODO: feature handling list is not exhaustive, just what I frequently use.
-                if classname == 'Occurrence':
-                    continue
-                    # # We only allow a fade in for Occurrence if this is the first item inserted into the design.
-                    # if i > 0:
-                    #     continue
-                    # # And if insert operation not immediately folled by a joint.
-                    # nextItem = type(timeline.item(i + 1).entity).__name__
-                    # if nextItem == 'Joint':
-                    #     continue
-                # If item is sketch, ignore.
-                if classname == 'Sketch':
-                    continue
-                if classname == 'ConstructionPlane':
-                    continue
-                if classname == 'ConstructionAxis':
-                    continue
-                if classname == 'ConstructionPoint':
-                    continue
-                if classname == 'ThreadFeature':
-                    continue
-                if classname == 'Combine':
-                    continue
-                # ui.messageBox(classname)
-            except:
+        # Frames whose model (and, for images, camera) state matches the previous
+        # frame are not rendered again but repeated as a hardlink or through
+        # the frame index, which maps repeated frame files to rendered ones.
+        frameIndexFile = outputFolder + 'frame_index.json'
+        if resumeIndex is not None:
+            frameIndex = frame_writer.readFrameIndex(frameIndexFile)
+        else:
+            frameIndex = {}
+            if os.path.exists(frameIndexFile) and not preview:
+                os.remove(frameIndexFile)
+        previousImage = None
+        previousMesh = None
+
+        # Untouched bodies keep their meshes across frames.
+        self._meshCache = mesh_cache.MeshCache(self.meshBody) if saveObj else None
+        # Frames rendered by earlier runs are reused from the frame cache.
+        self._frameCache = None
+        if self.renderCache and not preview:
+            self._frameCache = render_cache.RenderCache(self.renderCacheFolder, self.renderCacheSize * 1024 * 1024)
+            self._timelineKeys = self.timelineKeys(self._frameCache)
+
+        # Progress over the frames this run renders, with an ETA.
+        totalFrames = sum(item.frames for item in items if resumeIndex is None or item.index > resumeIndex)
+        if sample is not None:
+            totalFrames = len(sample)
+        progressBar = ui.progressBar
+        progressBar.show('Rendering frame %v of %m', 0, totalFrames, True)
+        renderStart = time.time()
+        rendered = 0
+        # Camera rotation steps since the last rendered frame.
+        rotationSteps = 0
+
+        for item in items:
+            i = item.index
+            if resumeIndex is not None and i <= resumeIndex:
                 continue
+            entity = item.entity
 
             # Set marker position.
             timeline.markerPosition = i + 1
-
-            # Get parameters to interpolate.
-            interpolatedParameters = []
-            stepSizes = []
-            stepOffsets = []
-            alphaComponents = []
-            if classname == 'ExtrudeFeature':
-                if self.isNumericExtent(entity.extentOne):
-                    param = entity.extentOne.distance
-                    interpolatedParameters.append(param)
-                    stepSizes.append(param.value / interpolationFrames)
-                    stepOffsets.append(0)
-                # At the very least we can fade it in if it's a new body/component.
-                elif entity.operation == 3 or entity.operation == 4: # NewBodyFeatureOperation or NewComponentFeatureOperation.
-                    bodies = entity.bodies
-                    for body in bodies:
-                        alphaComponents.append(body)
-                if entity.hasTwoExtents:
-                    # Handle side 2.
-                    if self.isNumericExtent(entity.extentTwo):
-                        param = entity.extentTwo.distance
-                        interpolatedParameters.append(param)
-                        stepSizes.append(param.value / interpolationFrames)
-                        stepOffsets.append(0)
-                    # At the very least we can fade it in if it's a new body/component.
-                    elif entity.operation == 3 or entity.operation == 4: # NewBodyFeatureOperation or NewComponentFeatureOperation.
-                        bodies = entity.bodies
-                        for body in bodies:
-                            alphaComponents.append(body)
-            # if classname == 'OffsetFacesFeature': # TODO: unable to get extent parameter from this operation.
-            if classname == 'Move':
-                # TODO: implement this.
+            if self._meshCache:
+                self._meshCache.advance(timeline, i + 1)
+            if not item.frames:
+                # Checkpoint it anyway; the checkpoint takes the planned items
+                # in order and without gaps.
+                if not encoder and not preview:
+                    camera = viewport.camera
+                    cameraState = [[p.x, p.y, p.z] for p in (camera.eye, camera.target, camera.upVector)]
+                    writer.after(frameCheckpoint.itemCompleted, i, num, [], cameraState)
                 continue
-            if classname == 'RevolveFeature':
-                if self.isNumericExtent(entity.extentDefinition):
-                    param = entity.extentDefinition.angle
-                    interpolatedParameters.append(param)
-                    stepSizes.append(param.value / interpolationFrames)
-                    # ui.messageBox(str(param.value / interpolationFrames))
-                    stepOffsets.append(0)
-            # if classname == 'FilletFeature' or classname == 'ChamferFeature': # TODO: unable to get extent parameter from this operation.
-            if classname == 'Joint':
-                # This usually happens after occurrence, fade in the component.
-                # Need to break link first so that opacity changes aren't
-                # applied to all linked components - this is irreversible.
-                # TODO: If the occurrence is not the top level component of the linked component, this may throw an error.
-                if entity.occurrenceOne:
-                    try:
-                        if entity.occurrenceOne.isReferencedComponent:
-                            entity.occurrenceOne.breakLink()
-                    except:
-                        pass
-                    alphaComponents.append(entity.occurrenceOne.component)
-            if classname == 'Occurrence':
-                try:
-                    if entity.isReferencedComponent:
-                        entity.breakLink()
-                except:
-                    pass
-                alphaComponents.append(entity.component)
-            if classname == 'RectangularPatternFeature':
-                if entity.quantityOne:
-                    param = entity.quantityOne
-                    if param.value != 1:
-                        interpolatedParameters.append(param)
-                        stepSize = int(param.value / interpolationFrames)
-                        if stepSize < 1:
-                            stepSize = 1
-                        stepSizes.append(stepSize)
-                        stepOffsets.append(0)
-                        if entity.distanceOne:
-                            dist = entity.distanceOne
-                            interpolatedParameters.append(dist)
-                            distStepSize = dist.value / (param.value - 1)
-                            # ui.messageBox(str(distStepSize))
-                            stepSizes.append(distStepSize * stepSize)
-                            stepOffsets.append(-distStepSize)
-                if entity.quantityTwo:
-                    param = entity.quantityTwo
-                    if param.value != 1:
-                        interpolatedParameters.append(param)
-                        stepSize = int(param.value / interpolationFrames)
-                        stepSizes.append(stepSize)
-                        stepOffsets.append(0)
-                        if entity.distanceTwo:
-                            dist = entity.distanceTwo
-                            interpolatedParameters.append(dist)
-                            distStepSize = dist.value / (param.value - 1)
-                            stepSizes.append(distStepSize * stepSize)
-                            stepOffsets.append(-distStepSize)
-            # Save original values and expressions.
-            originalValues = [param.value for param in interpolatedParameters]
+
+            # Parameters to interpolate come from the plan.
+            interpolatedParameters = item.parameters
+            alphaComponents = item.animator.fadeComponents(item)
+            # Save original expressions and opacities.
             originalExpressions = [param.expression for param in interpolatedParameters]
             originalAlphas = [comp.opacity for comp in alphaComponents]
-            # Calc number of interpolation frames for this feature.
-            _interpolationFrames = interpolationFrames if (i < end - 1) else (interpolationFrames + finalFrames)
-            for j in range(_interpolationFrames):
-                # Interpolate parameters.
-                for k in range(len(interpolatedParameters)):
-                    value = stepSizes[k] * (j + 1) + stepOffsets[k]
-                    if abs(value) > abs(originalValues[k]):
-                        value = originalValues[k]
-                    # ui.messageBox(str(value))
-                    interpolatedParameters[k].value = value
-                    # Force a recompute (needed for symmetric Revolves for some reason?).
-                    if classname == 'RevolveFeature':
-                        entity.extentDefinition.isSymmetric = entity.extentDefinition.isSymmetric
+            frameFiles = []
+            for j in range(item.frames):
+                rotationSteps += 1
+                if sample is not None and num not in sample:
+                    num += 1
+                    continue
+                frameValues = item.frameValues(j)
+                # Interpolate parameters, recomputing the model once per frame.
+                with parameter_batch.ParameterBatch(self.design) as batch:
+                    for k in range(len(interpolatedParameters)):
+                        batch.set(interpolatedParameters[k], frameValues[k])
+                    batch.refresh(item.animator.refresh, entity)
                 for k in range(len(alphaComponents)):
-                    value = originalAlphas[k] * (j + 1) / interpolationFrames
+                    value = originalAlphas[k] * (j + 1) / item.interpolationFrames
                     if abs(value) > abs(originalAlphas[k]):
                         value = originalAlphas[k]
                     # ui.messageBox(str(value))
+                    frameValues.append(value)
                     alphaComponents[k].opacity = value
+                modelState = (i, tuple(frameValues))
+                # A rotating camera changes every frame.
+                imageState = modelState if framesPerRotation == 0 else None
 
-                # Rotate camera around y axis.
+                # Rotate camera around y axis, past any frames a preview skipped.
                 if framesPerRotation > 0:
-                    angle = math.pi * 2.0 / framesPerRotation
                     camera = viewport.camera
                     eye = camera.eye
-                    cos = math.cos(angle)
-                    sin = math.sin(angle)
-                    camera.eye = adsk.core.Point3D.create(eye.x * cos + eye.z * sin, eye.y, - eye.x * sin + eye.z * cos)
+                    eye = shard_coordinator.rotateEye([eye.x, eye.y, eye.z], rotationSteps, framesPerRotation)
+                    camera.eye = adsk.core.Point3D.create(*eye)
                     # Set camera property to trigger update.
                     viewport.camera = camera
+                rotationSteps = 0
 
                 # Save image.
-                outputFilename = outputPath + 'History_Animation_' + filename + '/' + filename + '_' + str(num)
-                success = app.activeViewport.saveAsImageFile(outputFilename + '.png', width, height)
-                if not success:
-                    ui.messageBox('Failed saving viewport image.')
-
-                # Save obj file if requested
-                if saveObj:
-                    success = self.saveObjFile(outputFilename + '.obj')
+                outputFilename = outputFolder + filename + '_' + str(num)
+                if preview:
+                    previewFile = os.path.join(previewFolder, '{}.bmp'.format(num))
+                    if viewport.saveAsImageFile(previewFile, width, height):
+                        previewFiles.append(previewFile)
+                elif duplicateFrames != 'Render' and imageState is not None and previousImage and previousImage[0] == imageState:
+                    if encoder:
+                        writer.after(encoder.addFrame, num, previousImage[1])
+                    else:
+                        self.repeatFrame(writer, previousImage[1], outputFilename + '.png', frameIndex, frameFiles)
+                else:
+                    success = self.renderImage(writer, outputFilename + '.png', width, height, modelState)
                     if not success:
-                        ui.messageBox('Failed saving obj file.')
+                        ui.messageBox('Failed saving viewport image.')
+                    elif encoder:
+                        writer.after(encoder.addFrame, num, outputFilename + '.png')
+                    frameFiles.append(outputFilename + '.png')
+                    previousImage = (imageState, outputFilename + '.png') if success else None
+
+                # Save mesh file if requested
+                meshFilename = outputFilename + '.' + self.meshFormat.lower()
+                if saveObj and duplicateFrames != 'Render' and previousMesh and previousMesh[0] == modelState:
+                    self.repeatFrame(writer, previousMesh[1], meshFilename, frameIndex, frameFiles)
+                elif saveObj:
+                    # Only the bodies of the animated feature changed shape.
+                    if interpolatedParameters:
+                        self._meshCache.invalidateEntity(entity)
+                    success = self.saveMeshFile(outputFilename, writer)
+                    if not success:
+                        ui.messageBox('Failed saving mesh file.')
+                    frameFiles.append(meshFilename)
+                    previousMesh = (modelState, meshFilename) if success else None
 
                 num += 1
+                rendered += 1
+                remaining = (time.time() - renderStart) / rendered * (totalFrames - rendered)
+                progressBar.message = 'Rendering frame %v of %m, about {:.0f} min left'.format(remaining / 60)
+                progressBar.progressValue = rendered
+                adsk.doEvents()
 
-            # Reset parameters.
-            for k in range(len(interpolatedParameters)):
-                interpolatedParameters[k].value = originalValues[k]
-                interpolatedParameters[k].expression = originalExpressions[k]
+            # Reset parameters; the expression restores the original value.
+            with parameter_batch.ParameterBatch(self.design) as batch:
+                for k in range(len(interpolatedParameters)):
+                    batch.setExpression(interpolatedParameters[k], originalExpressions[k])
+            if self._meshCache and interpolatedParameters:
+                self._meshCache.invalidateEntity(entity)
             for k in range(len(alphaComponents)):
                 alphaComponents[k].opacity = originalAlphas[k]
 
-    def saveObjFile(self, file):
-        '''Export an .obj file from the root component'''
+            if preview:
+                continue
+
+            if duplicateFrames == 'Frame Index' and frameIndex:
+                writer.after(frame_writer.writeFrameIndex, frameIndexFile, dict(frameIndex))
+
+            # Checkpoint the item once all of its files are written.
+            if not encoder:
+                camera = viewport.camera
+                cameraState = [[p.x, p.y, p.z] for p in (camera.eye, camera.target, camera.upVector)]
+                writer.after(frameCheckpoint.itemCompleted, i, num, frameFiles, cameraState)
+
+        return previewFiles
+
+    def timelineKeys(self, cache):
+        '''Cache key of the model at each marker position: keys[m] chains the
+        type, name, suppression and parameter expressions of the timeline
+        items before m onto the document's user parameters'''
+        document = app.activeDocument
+        design = self.design
+        expressions = {}
+        for param in design.allParameters:
+            try:
+                token = param.createdBy.entityToken
+            except:
+                # User parameters aren't created by a timeline item.
+                continue
+            expressions.setdefault(token, []).append([param.name, param.expression])
+        keys = [cache.key(document.dataFile.id if document.dataFile else document.name,
+                          [[param.name, param.expression] for param in design.userParameters])]
+        timeline = self.timeline
+        for i in range(timeline.count):
+            item = timeline.item(i)
+            try:
+                entity = item.entity
+                itemKey = [type(entity).__name__, item.name, item.isSuppressed, expressions.get(entity.entityToken, [])]
+            except:
+                itemKey = [item.name, item.isSuppressed]
+            keys.append(cache.key(keys[-1], itemKey))
+        return keys
+
+    def renderImage(self, writer, file, width, height, frameState):
+        '''Save the viewport image to file, linking it from the frame cache if
+        it was rendered before and adding new renders to the cache'''
+        viewport = app.activeViewport
+        cache = self._frameCache
+        if not cache:
+            return writer.saveImage(viewport, file, width, height)
+        camera = viewport.camera
+        key = cache.key(self._timelineKeys[self.timeline.markerPosition], frameState,
+                        [[p.x, p.y, p.z] for p in (camera.eye, camera.target, camera.upVector)],
+                        camera.viewExtents, width, height)
+        if cache.fetch(key, file):
+            return True
+        if not writer.saveImage(viewport, file, width, height):
+            return False
+        # Store once written, before a video encoder removes the frame.
+        writer.after(cache.store, key, file)
+        return True
+
+    def repeatFrame(self, writer, source, target, frameIndex, frameFiles):
+        '''Output target as a repeat of the already saved source frame file'''
+        if self.duplicateFrames == 'Frame Index':
+            frameIndex[os.path.basename(target)] = os.path.basename(source)
+            # Don't leave a stale file from an earlier run under this name.
+            if os.path.exists(target):
+                os.remove(target)
+        else:
+            # Link once the source file has been written.
+            writer.after(frame_writer.linkFrame, source, target)
+            frameFiles.append(target)
+
+    def meshBody(self, body):
+        '''Triangulate a body into MeshData'''
+        mesher = body.meshManager.createMeshCalculator()
+        mesher.setQuality(
+            adsk.fusion.TriangleMeshQualityOptions.NormalQualityTriangleMesh
+        )
+        return mesh_export.MeshData.fromTriangleMesh(mesher.calculate())
+
+    def saveMeshFile(self, file, writer=None):
+        '''Export a mesh file in meshFormat from the root component, writing
+        it in the background if a writer is given'''
         try:
             adsk.doEvents()
             bodies = []
@@ -452,49 +1014,20 @@ class HistoryTimelapse:
                 for body in occurrence.bRepBodies:
                     bodies.append(body)
 
-            meshes = []
-            for body in bodies:
-                mesher = body.meshManager.createMeshCalculator()
-                mesher.setQuality(
-                    adsk.fusion.TriangleMeshQualityOptions.NormalQualityTriangleMesh
-                )
-                mesh = mesher.calculate()
-                meshes.append(mesh)
-
-            triangle_count = 0
-            vert_count = 0
-            for mesh in meshes:
-                triangle_count += mesh.triangleCount
-                vert_count += mesh.nodeCount
-
-            # Write the mesh to OBJ
-            with open(file, 'w') as fh:
-                fh.write('# WaveFront *.obj file\n')
-                fh.write(f'# Vertices: {vert_count}\n')
-                fh.write(f'# Triangles : {triangle_count}\n\n')
-
-                for mesh in meshes:
-                    verts = mesh.nodeCoordinates
-                    for pt in verts:
-                        fh.write(f'v {pt.x} {pt.y} {pt.z}\n')
-                for mesh in meshes:
-                    for vec in mesh.normalVectors:
-                        fh.write(f'vn {vec.x} {vec.y} {vec.z}\n')
-
-                index_offset = 0
-                for mesh in meshes:
-                    mesh_tri_count = mesh.triangleCount
-                    indices = mesh.nodeIndices
-                    for t in range(mesh_tri_count):
-                        i0 = indices[t * 3] + 1 + index_offset
-                        i1 = indices[t * 3 + 1] + 1 + index_offset
-                        i2 = indices[t * 3 + 2] + 1 + index_offset
-                        fh.write(f'f {i0}//{i0} {i1}//{i1} {i2}//{i2}\n')
-                    index_offset += mesh.nodeCount
-
-                fh.write(f'\n# End of file')
-                return True
+            if self._meshCache:
+                meshes = self._meshCache.meshes(bodies)
+            else:
+                meshes = [self.meshBody(body) for body in bodies]
+
+            if writer:
+                size = sum(mesh.nbytes for mesh in meshes)
+                writer.submit(mesh_export.writeMeshes, file, meshes, self.meshFormat, size=size)
+            else:
+                mesh_export.writeMeshes(file, meshes, self.meshFormat)
+            return True
 
+        except frame_writer.FrameWriterError:
+            raise
         except Exception as ex:
             return False
 
@@ -0,0 +1,227 @@
+#Description-Feature animators of the history animation, keyed by entity type
+
+# Each timeline entity type maps to an animator that decides how the item
+# is animated: which parameters grow from zero, what fades in and how many
+# frames it gets. Items are classified with one lookup in `animators`;
+# types mapped to None are skipped and unregistered types get the default
+# animator, which only renders the item's frames. Register animators for
+# more feature types with registerAnimator.
+
+import math
+
+def isNumericExtent(extent):
+    classname = type(extent).__name__
+    return classname in ('DistanceExtentDefinition', 'SymmetricExtentDefinition', 'AngleExtentDefinition')
+
+def isNewBody(entity):
+    # NewBodyFeatureOperation or NewComponentFeatureOperation.
+    return entity.operation == 3 or entity.operation == 4
+
+
+class FeatureAnimator:
+    '''Renders the item's frames without changing it.'''
+    # Whether the item gets frames at all, or only moves the marker.
+    rendered = True
+
+    def magnitude(self, entity):
+        '''(kind, value) of how much the feature changes the model, e.g.
+        ('length', cm), ('angle', rad) or ('count', instances); None if
+        unknown. Used to allocate frames adaptively.'''
+        return None
+
+    def plan(self, item, interpolationFrames):
+        '''Add the parameters to interpolate to the plan item and set fadeIn.'''
+        pass
+
+    def fadeComponents(self, item):
+        '''Bodies and components to fade in, once the marker is past the item.'''
+        return []
+
+    def refresh(self, entity):
+        '''Called after setting a frame's parameter values.'''
+        pass
+
+
+class FadeInAnimator(FeatureAnimator):
+    '''Fades in the bodies of features creating new bodies.'''
+    def plan(self, item, interpolationFrames):
+        if isNewBody(item.entity):
+            item.fadeIn = True
+
+    def fadeComponents(self, item):
+        return [body for body in item.entity.bodies] if item.fadeIn else []
+
+
+class ExtrudeAnimator(FadeInAnimator):
+    def magnitude(self, entity):
+        extents = [entity.extentOne, entity.extentTwo] if entity.hasTwoExtents else [entity.extentOne]
+        distances = [abs(extent.distance.value) for extent in extents if isNumericExtent(extent)]
+        return ('length', sum(distances)) if distances else None
+
+    def plan(self, item, interpolationFrames):
+        entity = item.entity
+        extents = [entity.extentOne]
+        if entity.hasTwoExtents:
+            # Handle side 2.
+            extents.append(entity.extentTwo)
+        for extent in extents:
+            if isNumericExtent(extent):
+                param = extent.distance
+                item.addParameter(param, param.value / interpolationFrames)
+            # At the very least we can fade it in if it's a new body/component.
+            elif isNewBody(entity):
+                item.fadeIn = True
+
+
+class RevolveAnimator(FeatureAnimator):
+    def magnitude(self, entity):
+        extent = entity.extentDefinition
+        return ('angle', abs(extent.angle.value)) if isNumericExtent(extent) else None
+
+    def plan(self, item, interpolationFrames):
+        extent = item.entity.extentDefinition
+        if isNumericExtent(extent):
+            param = extent.angle
+            item.addParameter(param, param.value / interpolationFrames)
+
+    def refresh(self, entity):
+        # Force a recompute (needed for symmetric Revolves for some reason?).
+        entity.extentDefinition.isSymmetric = entity.extentDefinition.isSymmetric
+
+
+def _planPattern(item, quantity, spacing, spacingStep, interpolationFrames, minStep=1):
+    # Grow the instance count, stretching the pattern extent with it so the
+    # existing instances keep their positions.
+    stepSize = int(quantity.value / interpolationFrames)
+    if stepSize < minStep:
+        stepSize = minStep
+    item.addParameter(quantity, stepSize)
+    if spacing:
+        item.addParameter(spacing, spacingStep * stepSize, -spacingStep)
+
+class RectangularPatternAnimator(FeatureAnimator):
+    def magnitude(self, entity):
+        if not entity.quantityOne:
+            return None
+        return ('count', entity.quantityOne.value * (entity.quantityTwo.value if entity.quantityTwo else 1))
+
+    def plan(self, item, interpolationFrames):
+        entity = item.entity
+        if entity.quantityOne and entity.quantityOne.value != 1:
+            param = entity.quantityOne
+            dist = entity.distanceOne
+            _planPattern(item, param, dist, dist.value / (param.value - 1) if dist else 0, interpolationFrames)
+        if entity.quantityTwo and entity.quantityTwo.value != 1:
+            param = entity.quantityTwo
+            dist = entity.distanceTwo
+            _planPattern(item, param, dist, dist.value / (param.value - 1) if dist else 0, interpolationFrames, 0)
+
+class CircularPatternAnimator(FeatureAnimator):
+    def magnitude(self, entity):
+        return ('count', entity.quantity.value) if entity.quantity else None
+
+    def plan(self, item, interpolationFrames):
+        entity = item.entity
+        param = entity.quantity
+        if not param or param.value == 1:
+            return
+        angle = entity.totalAngle
+        # A full circle spaces its instances by a whole division; a partial
+        # pattern places the last one at the total angle.
+        full = abs(abs(angle.value) - math.pi * 2.0) < 1e-9
+        spacing = angle.value / (param.value if full else param.value - 1)
+        _planPattern(item, param, angle, spacing, interpolationFrames)
+
+
+class EdgeSetAnimator(FeatureAnimator):
+    '''Grows the sizes of fillet and chamfer edge sets.'''
+    sizes = ('radius', 'distance', 'distanceOne', 'distanceTwo')
+
+    def magnitude(self, entity):
+        values = [abs(getattr(edgeSet, name).value) for edgeSet in entity.edgeSets
+                  for name in self.sizes if getattr(edgeSet, name, None)]
+        return ('length', max(values)) if values else None
+
+    def plan(self, item, interpolationFrames):
+        for edgeSet in item.entity.edgeSets:
+            for name in self.sizes:
+                param = getattr(edgeSet, name, None)
+                if param:
+                    item.addParameter(param, param.value / interpolationFrames)
+
+class ShellAnimator(FeatureAnimator):
+    def magnitude(self, entity):
+        return ('length', sum(abs(param.value) for param in (entity.insideThickness, entity.outsideThickness) if param))
+
+    def plan(self, item, interpolationFrames):
+        entity = item.entity
+        for param in (entity.insideThickness, entity.outsideThickness):
+            if param and param.value:
+                item.addParameter(param, param.value / interpolationFrames)
+
+class SweepAnimator(FadeInAnimator):
+    def plan(self, item, interpolationFrames):
+        # Sweep along the path from its start.
+        param = item.entity.distanceOne
+        if param:
+            item.addParameter(param, param.value / interpolationFrames)
+        else:
+            super().plan(item, interpolationFrames)
+
+
+class JointAnimator(FeatureAnimator):
+    def plan(self, item, interpolationFrames):
+        item.fadeIn = bool(item.entity.occurrenceOne)
+
+    def fadeComponents(self, item):
+        # This usually happens after occurrence, fade in the component.
+        # Need to break link first so that opacity changes aren't
+        # applied to all linked components - this is irreversible.
+        # TODO: If the occurrence is not the top level component of the linked component, this may throw an error.
+        occurrence = item.entity.occurrenceOne
+        try:
+            if occurrence.isReferencedComponent:
+                occurrence.breakLink()
+        except:
+            pass
+        return [occurrence.component]
+
+class MarkerOnlyAnimator(FeatureAnimator):
+    '''Moves the marker past the item without rendering frames.'''
+    rendered = False
+
+
+defaultAnimator = FeatureAnimator()
+
+# Some operations should be ignored as they can't be easily animated.
+animators = {
+    # We only fade in Occurrence through the Joint that follows it.
+    'Occurrence': None,
+    'Sketch': None,
+    'ConstructionPlane': None,
+    'ConstructionAxis': None,
+    'ConstructionPoint': None,
+    'ThreadFeature': None,
+    'Combine': None,
+    # The marker steps past a Move without frames of its own.
+    'Move': MarkerOnlyAnimator(),
+    'ExtrudeFeature': ExtrudeAnimator(),
+    'RevolveFeature': RevolveAnimator(),
+    'RectangularPatternFeature': RectangularPatternAnimator(),
+    'CircularPatternFeature': CircularPatternAnimator(),
+    'FilletFeature': EdgeSetAnimator(),
+    'ChamferFeature': EdgeSetAnimator(),
+    'ShellFeature': ShellAnimator(),
+    'LoftFeature': FadeInAnimator(),
+    'SweepFeature': SweepAnimator(),
+    'Joint': JointAnimator(),
+}
+
+def registerAnimator(classname, animator):
+    '''Animate entities of type classname with animator, or skip them if
+    animator is None.'''
+    animators[classname] = animator
+
+def animatorFor(classname):
+    '''The animator of an entity type, or None if it is skipped.'''
+    return animators.get(classname, defaultAnimator)
@@ -0,0 +1,123 @@
+#Description-Frame plan of a history animation
+
+# A planning pass walks the timeline once and records, per animated item,
+# its classname, the parameters it interpolates with their step sizes and
+# its frame count. The total frame count is then known before anything
+# renders (progress, ETA, dry runs, sharding), and an unchanged design can
+# reuse the plan across renders. Frames can be allocated adaptively, from a
+# total budget in proportion to how much each feature changes.
+
+class PlanItem:
+    '''One timeline item of the plan'''
+    def __init__(self, index, entity, classname, frames, animator=None, interpolationFrames=None):
+        self.index = index
+        self.entity = entity
+        self.classname = classname
+        # The feature animator planning and animating the item.
+        self.animator = animator
+        # Number of frames rendered for the item; 0 only moves the marker.
+        self.frames = frames
+        # Frames over which the item animates; the rest repeat its end state.
+        self.interpolationFrames = frames if interpolationFrames is None else interpolationFrames
+        self.parameters = []
+        self.stepSizes = []
+        self.stepOffsets = []
+        self.originalValues = []
+        # Whether bodies or components of the item fade in.
+        self.fadeIn = False
+
+    def addParameter(self, param, stepSize, stepOffset=0):
+        self.parameters.append(param)
+        self.stepSizes.append(stepSize)
+        self.stepOffsets.append(stepOffset)
+        self.originalValues.append(param.value)
+
+    def frameValues(self, j):
+        '''Parameter values of frame j, never past the original values.'''
+        values = []
+        for k in range(len(self.parameters)):
+            value = self.stepSizes[k] * (j + 1) + self.stepOffsets[k]
+            if abs(value) > abs(self.originalValues[k]):
+                value = self.originalValues[k]
+            values.append(value)
+        return values
+
+
+class FramePlan:
+    def __init__(self, key, items):
+        # key: the timeline and render settings the plan was built for.
+        self.key = key
+        self.items = items
+
+    @property
+    def totalFrames(self):
+        return sum(item.frames for item in self.items)
+
+    def itemFrames(self):
+        '''(timeline index, number of frames) of every planned item.'''
+        return [(item.index, item.frames) for item in self.items]
+
+    def isCurrent(self, key):
+        '''Whether the plan still applies: same key and no planned parameter
+        changed since it was built.'''
+        if key != self.key:
+            return False
+        try:
+            return all(param.value == value for item in self.items
+                       for param, value in zip(item.parameters, item.originalValues))
+        except Exception:
+            return False
+
+    def summary(self):
+        '''Number of animated items and frames per classname.'''
+        counts = {}
+        for item in self.items:
+            if item.frames:
+                items, frames = counts.get(item.classname, (0, 0))
+                counts[item.classname] = (items + 1, frames + item.frames)
+        return counts
+
+
+def magnitudeWeights(magnitudes):
+    '''Allocation weights from per item (kind, value) magnitudes. Values are
+    relative to the largest of their kind (lengths, angles, counts), and
+    unmeasured (None) items get the mean weight.'''
+    largest = {}
+    for magnitude in magnitudes:
+        if magnitude and magnitude[1] > 0:
+            kind, value = magnitude
+            largest[kind] = max(largest.get(kind, 0), value)
+    weights = [magnitude[1] / largest[magnitude[0]] if magnitude and magnitude[1] > 0 else None
+               for magnitude in magnitudes]
+    measured = [weight for weight in weights if weight is not None]
+    mean = sum(measured) / len(measured) if measured else 1.0
+    return [mean if weight is None else weight for weight in weights]
+
+def allocateFrames(weights, budget, minFrames, maxFrames):
+    '''Split budget frames across items in proportion to weights, with each
+    item getting between minFrames and maxFrames. Returns frame counts that
+    add up to the budget, unless the clamps don't allow it.'''
+    count = len(weights)
+    frames = [None] * count
+    free = list(range(count))
+    remaining = budget
+    shares = {}
+    # Clamp the items whose share falls outside the limits and share the
+    # rest of the budget among the others, until none is clamped.
+    while free:
+        total = sum(weights[k] for k in free)
+        shares = {k: remaining * weights[k] / total if total else remaining / len(free) for k in free}
+        clamped = [k for k in free if not minFrames <= shares[k] <= maxFrames]
+        if not clamped:
+            break
+        for k in clamped:
+            frames[k] = minFrames if shares[k] < minFrames else maxFrames
+            remaining -= frames[k]
+        free = [k for k in free if frames[k] is None]
+    # Round down, then hand the leftover frames to the largest remainders.
+    for k in free:
+        frames[k] = int(shares[k])
+    leftover = remaining - sum(frames[k] for k in free)
+    for k in sorted(free, key=lambda k: frames[k] - shares[k])[:max(0, int(round(leftover)))]:
+        frames[k] += 1
+    return frames
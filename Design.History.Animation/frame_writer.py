@@ -0,0 +1,233 @@
+#Description-Background writer pool for animation frames
+
+# The main thread renders a frame and hands the slow part of persisting it
+# (PNG compression, mesh formatting, disk writes) to a small pool of writer
+# threads, so rendering frame N+1 overlaps with writing frame N.
+
+import collections, json, os, shutil, struct, tempfile, threading, traceback, zlib
+
+class FrameWriterError(Exception):
+    pass
+
+class FrameWriter:
+    '''Bounded pool of background threads that persist frames.
+
+    submit() blocks while maxPending jobs or maxBytes of job data are
+    outstanding, so rendering can't run ahead of the disk. The first job
+    error is raised as FrameWriterError from the next submit() or close().
+    With threads=0 jobs run synchronously in submit().'''
+    def __init__(self, threads=2, maxPending=8, maxBytes=512 * 1024 * 1024):
+        self._maxPending = max(1, maxPending)
+        self._maxBytes = maxBytes
+        self._jobs = collections.deque()
+        self._condition = threading.Condition()
+        self._pending = 0
+        self._pendingBytes = 0
+        # Jobs are numbered in submit order; _doneThrough is the count of the
+        # leading jobs that have all finished.
+        self._submitted = 0
+        self._done = set()
+        self._doneThrough = 0
+        self._callbacks = collections.deque()
+        # Held while taking callbacks off the queue and running them, so they
+        # run one at a time and in submit order whichever thread runs them.
+        self._callbackLock = threading.RLock()
+        self._error = None
+        self._closed = False
+        self._scratch = None
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(max(0, threads))]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def threads(self):
+        return len(self._threads)
+
+    def submit(self, job, *args, size=0):
+        '''Queue job(*args); size is the memory/disk held until it finishes.'''
+        if not self._threads:
+            try:
+                job(*args)
+            except Exception:
+                raise FrameWriterError('Failed writing frame:\n{}'.format(traceback.format_exc()))
+            return
+        with self._condition:
+            self._raiseError()
+            # Backpressure: wait for room, but always admit a job into an empty queue.
+            while self._pending and (self._pending >= self._maxPending or self._pendingBytes + size > self._maxBytes):
+                self._condition.wait()
+                self._raiseError()
+            self._jobs.append((self._submitted, job, args, size))
+            self._submitted += 1
+            self._pending += 1
+            self._pendingBytes += size
+            self._condition.notify_all()
+
+    def after(self, callback, *args):
+        '''Run callback(*args) once every job submitted so far has finished.'''
+        if not self._threads:
+            callback(*args)
+            return
+        with self._condition:
+            self._raiseError()
+            self._callbacks.append((self._submitted, callback, args))
+        # Callbacks queued earlier may still be waiting to run; this runs them
+        # and, if its jobs are done already, this one after them.
+        self._runCallbacks()
+        with self._condition:
+            self._raiseError()
+
+    def saveImage(self, viewport, file, width, height):
+        '''Render the viewport to file. With writer threads the render is
+        staged as an uncompressed bitmap and compressed to PNG in the pool.'''
+        if not self._threads or not file.lower().endswith('.png'):
+            # file may be a hardlink to a cached or repeated frame; unlink it
+            # rather than render through it.
+            if os.path.exists(file):
+                os.remove(file)
+            return viewport.saveAsImageFile(file, width, height)
+        if self._scratch is None:
+            self._scratch = tempfile.mkdtemp(prefix='frames_')
+        stagingFile = os.path.join(self._scratch, os.path.basename(file)[:-4] + '.bmp')
+        if not viewport.saveAsImageFile(stagingFile, width, height):
+            return False
+        self.submit(bmpToPng, stagingFile, file, True, size=os.path.getsize(stagingFile))
+        return True
+
+    def close(self):
+        '''Wait for all queued jobs, stop the threads and raise any job error.'''
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self._scratch:
+            shutil.rmtree(self._scratch, ignore_errors=True)
+            self._scratch = None
+        self._raiseError()
+
+    def _raiseError(self):
+        if self._error:
+            raise FrameWriterError('Failed writing frame:\n{}'.format(self._error))
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._jobs and not self._closed:
+                    self._condition.wait()
+                if not self._jobs:
+                    return
+                seq, job, args, size = self._jobs.popleft()
+                failed = self._error is not None
+            try:
+                # Once a job failed, drain the queue without running the rest.
+                if not failed:
+                    job(*args)
+            except Exception:
+                with self._condition:
+                    if self._error is None:
+                        self._error = traceback.format_exc()
+            finally:
+                with self._condition:
+                    self._pending -= 1
+                    self._pendingBytes -= size
+                    self._done.add(seq)
+                    while self._doneThrough in self._done:
+                        self._done.remove(self._doneThrough)
+                        self._doneThrough += 1
+                    self._condition.notify_all()
+            self._runCallbacks()
+
+    def _runCallbacks(self):
+        with self._callbackLock:
+            with self._condition:
+                ready = []
+                while self._callbacks and self._callbacks[0][0] <= self._doneThrough:
+                    ready.append(self._callbacks.popleft())
+                failed = self._error is not None
+            if failed:
+                return
+            for _, callback, args in ready:
+                try:
+                    callback(*args)
+                except Exception:
+                    with self._condition:
+                        if self._error is None:
+                            self._error = traceback.format_exc()
+                    return
+
+
+def _pngChunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+def readBitmap(bmpFile):
+    '''Read an uncompressed 24/32 bit bitmap as (width, height, rows), the
+    rows being top down RGB bytes.'''
+    with open(bmpFile, 'rb') as fh:
+        data = fh.read()
+    if data[:2] != b'BM':
+        raise ValueError('Not a bitmap: {}'.format(bmpFile))
+    offset = struct.unpack_from('<I', data, 10)[0]
+    width, height, _, bitsPerPixel, compression = struct.unpack_from('<iiHHI', data, 18)
+    if bitsPerPixel not in (24, 32) or compression not in (0, 3):
+        raise ValueError('Unsupported bitmap format: {}'.format(bmpFile))
+    channels = bitsPerPixel // 8
+    stride = (width * channels + 3) & ~3
+    rows = []
+    for r in range(abs(height)):
+        # Bitmaps with positive height are stored bottom up.
+        start = offset + (abs(height) - 1 - r if height > 0 else r) * stride
+        row = data[start:start + width * channels]
+        rgb = bytearray(width * 3)
+        rgb[0::3] = row[2::channels]
+        rgb[1::3] = row[1::channels]
+        rgb[2::3] = row[0::channels]
+        rows.append(rgb)
+    return width, abs(height), rows
+
+def writePng(pngFile, width, height, rows):
+    '''Write top down RGB rows as a PNG.'''
+    raw = bytearray((width * 3 + 1) * height)
+    for r, rgb in enumerate(rows):
+        start = r * (width * 3 + 1)
+        raw[start + 1:start + 1 + width * 3] = rgb
+    png = (b'\x89PNG\r\n\x1a\n' +
+           _pngChunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) +
+           _pngChunk(b'IDAT', zlib.compress(bytes(raw), 6)) +
+           _pngChunk(b'IEND', b''))
+    os.makedirs(os.path.dirname(pngFile) or '.', exist_ok=True)
+    # Write next to the target and rename, so a frame on disk is always complete.
+    with open(pngFile + '.tmp', 'wb') as fh:
+        fh.write(png)
+    os.replace(pngFile + '.tmp', pngFile)
+
+def bmpToPng(bmpFile, pngFile, removeBmp=False):
+    '''Compress an uncompressed 24/32 bit bitmap to an RGB PNG.'''
+    writePng(pngFile, *readBitmap(bmpFile))
+    if removeBmp:
+        os.remove(bmpFile)
+
+
+def linkFrame(source, target):
+    '''Materialize a repeated frame as a hardlink to source (or a copy where
+    the filesystem has no hardlinks).'''
+    if os.path.exists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+def writeFrameIndex(file, frameIndex):
+    '''Write the {repeated frame: rendered frame} file name map as JSON.'''
+    with open(file + '.tmp', 'w') as fh:
+        json.dump(dict(frameIndex), fh, indent=1, sort_keys=True)
+    os.replace(file + '.tmp', file)
+
+def readFrameIndex(file):
+    try:
+        with open(file, 'r') as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return {}
@@ -0,0 +1,85 @@
+#Description-Per-body mesh cache for the design history animation
+
+# Keeps the triangulated MeshData of every body across frames, keyed by the
+# body's entity token, and tracks the timeline marker position the cached
+# meshes belong to. Only bodies touched by a timeline feature are re-meshed;
+# the MeshData of untouched bodies is reused together with its serialized
+# blocks (see MeshData.block).
+
+# Timeline entities that never change body geometry.
+geometryFreeTypes = {'Sketch', 'ConstructionPlane', 'ConstructionAxis', 'ConstructionPoint'}
+
+def _tokens(body):
+    # Bodies in occurrences are proxies with their own entity token; features
+    # report the native body, so keep both.
+    try:
+        native = body.nativeObject
+    except:
+        native = None
+    return body.entityToken, (native.entityToken if native else body.entityToken)
+
+class MeshCache:
+    def __init__(self, meshBody):
+        # meshBody(body) -> MeshData, called for bodies missing from the cache.
+        self._meshBody = meshBody
+        self._meshes = {}
+        self._markerPosition = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def markerPosition(self):
+        return self._markerPosition
+
+    def clear(self):
+        self._meshes = {}
+
+    def invalidateEntity(self, entity):
+        '''Drop the bodies a timeline entity creates or modifies. Entities whose
+        bodies can't be determined (joints, moves, occurrences) clear the cache.'''
+        if type(entity).__name__ in geometryFreeTypes:
+            return
+        try:
+            tokens = set()
+            for body in entity.bodies:
+                tokens.update(_tokens(body))
+        except:
+            self.clear()
+            return
+        self._meshes = {key: value for key, value in self._meshes.items()
+                        if key not in tokens and value[1] not in tokens}
+
+    def advance(self, timeline, markerPosition):
+        '''Invalidate bodies affected by every timeline item rolled forwards or
+        back over since the last call.'''
+        previous = self._markerPosition
+        self._markerPosition = markerPosition
+        if previous is None or previous == markerPosition:
+            return
+        for i in range(min(previous, markerPosition), max(previous, markerPosition)):
+            try:
+                entity = timeline.item(i).entity
+            except:
+                entity = None
+            if entity is None:
+                self.clear()
+                return
+            self.invalidateEntity(entity)
+
+    def meshes(self, bodies):
+        '''Return MeshData for bodies, meshing only the ones not cached.'''
+        meshes = []
+        seen = {}
+        for body in bodies:
+            token, nativeToken = _tokens(body)
+            cached = self._meshes.get(token)
+            if cached is None:
+                cached = (self._meshBody(body), nativeToken)
+                self.misses += 1
+            else:
+                self.hits += 1
+            seen[token] = cached
+            meshes.append(cached[0])
+        # Forget bodies that no longer exist.
+        self._meshes = seen
+        return meshes
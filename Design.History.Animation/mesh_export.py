@@ -0,0 +1,341 @@
+#Description-Mesh exporters for the design history animation
+
+# Every exporter takes a list of MeshData blocks (flat coordinate, normal and
+# index buffers as returned by the Fusion mesh calculator) and writes them to
+# a single file. Binary formats are packed with array/bytearray slice
+# operations so the cost per triangle stays in C, not in the Python loop.
+
+import array, json, os, struct, sys, tempfile, time
+
+_littleEndian = sys.byteorder == 'little'
+
+
+class MeshData:
+    '''Flat mesh buffers: xyz coordinates, xyz normals and triangle node indices.'''
+    def __init__(self, coordinates, normals, indices):
+        self.coordinates = array.array('d', coordinates)
+        self.normals = array.array('d', normals)
+        self.indices = array.array('I', indices)
+        self._blocks = {}
+
+    @property
+    def nodeCount(self):
+        return len(self.coordinates) // 3
+
+    @property
+    def triangleCount(self):
+        return len(self.indices) // 3
+
+    @property
+    def nbytes(self):
+        return sum(len(a) * a.itemsize for a in (self.coordinates, self.normals, self.indices))
+
+    def block(self, key, build, variant=None):
+        '''Return build() memoized under key, so a mesh kept across frames
+        reuses its serialized output. Only the latest variant (e.g. index
+        offset) of each key is kept.'''
+        cached = self._blocks.get(key)
+        if cached is None or cached[0] != variant:
+            cached = (variant, build())
+            self._blocks[key] = cached
+        return cached[1]
+
+    @classmethod
+    def fromTriangleMesh(cls, mesh):
+        '''Copy the buffers out of an adsk.fusion.TriangleMesh.'''
+        # Use the double buffers so text output matches Point3D values exactly.
+        return cls(mesh.nodeCoordinatesAsDouble, mesh.normalVectorsAsDouble, mesh.nodeIndices)
+
+
+def _toBytes(arr):
+    # Binary formats below are all little endian.
+    if not _littleEndian:
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    return arr.tobytes()
+
+def _offsetIndices(indices, offset):
+    if offset == 0:
+        return indices
+    return array.array('I', map(offset.__add__, indices))
+
+def _interleave(blocks, recordSize, unit=1):
+    # Interleave equally sized byte columns into fixed size records, copying
+    # unit bytes (1 or 2) at a time. blocks is a list of
+    # (byteOffsetInRecord, columnBytes, columnWidth).
+    typecode = 'B' if unit == 1 else 'H'
+    count = len(blocks[0][1]) // blocks[0][2]
+    out = array.array(typecode, bytes(recordSize * count))
+    for offset, data, width in blocks:
+        column = array.array(typecode, data)
+        for u in range(width // unit):
+            out[offset // unit + u::recordSize // unit] = column[u::width // unit]
+    return bytearray(out.tobytes())
+
+
+# Rows formatted per % operation when writing text .obj blocks.
+objChunkRows = 20000
+
+def _formatObjBlock(rowFormat, values, columns):
+    # Format values a whole chunk of rows at a time: one % operation on a
+    # repeated row format instead of one f-string per row.
+    rows = len(values) // columns
+    chunks = []
+    for start in range(0, rows, objChunkRows):
+        count = min(objChunkRows, rows - start)
+        chunk = values[start * columns:(start + count) * columns]
+        chunks.append((rowFormat * count) % tuple(chunk))
+    return ''.join(chunks)
+
+def _objFaces(mesh, indexOffset):
+    indices = _offsetIndices(mesh.indices, indexOffset + 1)
+    # Every index is written twice (vertex//normal).
+    pairs = array.array('I', bytes(2 * indices.itemsize * len(indices)))
+    pairs[0::2] = indices
+    pairs[1::2] = indices
+    return _formatObjBlock('f %d//%d %d//%d %d//%d\n', pairs, 6)
+
+def writeObj(file, meshes):
+    '''Write meshes as a text Wavefront .obj file.'''
+    triangleCount = sum(mesh.triangleCount for mesh in meshes)
+    vertCount = sum(mesh.nodeCount for mesh in meshes)
+    with open(file, 'w') as fh:
+        fh.write('# WaveFront *.obj file\n')
+        fh.write(f'# Vertices: {vertCount}\n')
+        fh.write(f'# Triangles : {triangleCount}\n\n')
+
+        # %r matches the f-string formatting of floats exactly.
+        for mesh in meshes:
+            fh.write(mesh.block('obj v', lambda: _formatObjBlock('v %r %r %r\n', mesh.coordinates, 3)))
+        for mesh in meshes:
+            fh.write(mesh.block('obj vn', lambda: _formatObjBlock('vn %r %r %r\n', mesh.normals, 3)))
+
+        indexOffset = 0
+        for mesh in meshes:
+            fh.write(mesh.block('obj f', lambda: _objFaces(mesh, indexOffset), indexOffset))
+            indexOffset += mesh.nodeCount
+
+        fh.write(f'\n# End of file')
+
+def _writeObjPerElement(file, meshes):
+    # Reference writer with one write per element; kept to check writeObj
+    # output and as the benchmark baseline.
+    triangleCount = sum(mesh.triangleCount for mesh in meshes)
+    vertCount = sum(mesh.nodeCount for mesh in meshes)
+    with open(file, 'w') as fh:
+        fh.write('# WaveFront *.obj file\n')
+        fh.write(f'# Vertices: {vertCount}\n')
+        fh.write(f'# Triangles : {triangleCount}\n\n')
+
+        for mesh in meshes:
+            coords = mesh.coordinates
+            for n in range(mesh.nodeCount):
+                fh.write(f'v {coords[n * 3]} {coords[n * 3 + 1]} {coords[n * 3 + 2]}\n')
+        for mesh in meshes:
+            normals = mesh.normals
+            for n in range(len(normals) // 3):
+                fh.write(f'vn {normals[n * 3]} {normals[n * 3 + 1]} {normals[n * 3 + 2]}\n')
+
+        indexOffset = 0
+        for mesh in meshes:
+            indices = mesh.indices
+            for t in range(mesh.triangleCount):
+                i0 = indices[t * 3] + 1 + indexOffset
+                i1 = indices[t * 3 + 1] + 1 + indexOffset
+                i2 = indices[t * 3 + 2] + 1 + indexOffset
+                fh.write(f'f {i0}//{i0} {i1}//{i1} {i2}//{i2}\n')
+            indexOffset += mesh.nodeCount
+
+        fh.write(f'\n# End of file')
+
+
+def _stlTriangles(mesh):
+    # 50 byte records: normal (3f, left zero), 3 vertices (9f), attribute (H).
+    # All fields are 2 byte aligned so records are packed 16 bits at a time.
+    coords = array.array('f', mesh.coordinates)
+    corners = []
+    for c in range(3):
+        corners.append(array.array('f', map(coords[c::3].__getitem__, mesh.indices)))
+    floats = array.array('f', bytes(36 * mesh.triangleCount))
+    for v in range(3):
+        for c in range(3):
+            floats[v * 3 + c::9] = corners[c][v::3]
+    return _interleave([(12, _toBytes(floats), 36)], 50, unit=2)
+
+def writeStl(file, meshes):
+    '''Write meshes as a binary .stl file.'''
+    triangleCount = sum(mesh.triangleCount for mesh in meshes)
+    with open(file, 'wb') as fh:
+        fh.write(b'Fusion 360 design history animation'.ljust(80, b'\0'))
+        fh.write(struct.pack('<I', triangleCount))
+        for mesh in meshes:
+            fh.write(mesh.block('stl', lambda: _stlTriangles(mesh)))
+
+
+def _plyVertices(mesh):
+    vertex = array.array('f', bytes(24 * mesh.nodeCount))
+    vertex[0::6] = array.array('f', mesh.coordinates[0::3])
+    vertex[1::6] = array.array('f', mesh.coordinates[1::3])
+    vertex[2::6] = array.array('f', mesh.coordinates[2::3])
+    if len(mesh.normals) == len(mesh.coordinates):
+        vertex[3::6] = array.array('f', mesh.normals[0::3])
+        vertex[4::6] = array.array('f', mesh.normals[1::3])
+        vertex[5::6] = array.array('f', mesh.normals[2::3])
+    return _toBytes(vertex)
+
+def _plyFaces(mesh, indexOffset):
+    indices = _toBytes(_offsetIndices(mesh.indices, indexOffset))
+    faces = _interleave([(1, indices, 12)], 13)
+    faces[0::13] = b'\x03' * mesh.triangleCount
+    return faces
+
+def writePly(file, meshes):
+    '''Write meshes as a binary little endian .ply file with vertex normals.'''
+    vertCount = sum(mesh.nodeCount for mesh in meshes)
+    triangleCount = sum(mesh.triangleCount for mesh in meshes)
+    header = ('ply\n'
+              'format binary_little_endian 1.0\n'
+              f'element vertex {vertCount}\n'
+              'property float x\nproperty float y\nproperty float z\n'
+              'property float nx\nproperty float ny\nproperty float nz\n'
+              f'element face {triangleCount}\n'
+              'property list uchar uint vertex_indices\n'
+              'end_header\n')
+    with open(file, 'wb') as fh:
+        fh.write(header.encode('ascii'))
+        for mesh in meshes:
+            fh.write(mesh.block('ply v', lambda: _plyVertices(mesh)))
+        indexOffset = 0
+        for mesh in meshes:
+            fh.write(mesh.block('ply f', lambda: _plyFaces(mesh, indexOffset), indexOffset))
+            indexOffset += mesh.nodeCount
+
+
+def writeGlb(file, meshes):
+    '''Write meshes as a single binary glTF 2.0 (.glb) mesh.'''
+    positions = array.array('f')
+    normals = array.array('f')
+    indices = array.array('I')
+    hasNormals = all(len(mesh.normals) == len(mesh.coordinates) for mesh in meshes)
+    for mesh in meshes:
+        indices.extend(_offsetIndices(mesh.indices, len(positions) // 3))
+        positions.extend(mesh.block('f32 v', lambda: array.array('f', mesh.coordinates)))
+        if hasNormals:
+            normals.extend(mesh.block('f32 vn', lambda: array.array('f', mesh.normals)))
+    vertCount = len(positions) // 3
+
+    bufferViews = []
+    accessors = []
+    attributes = {}
+    blobs = []
+    offset = 0
+    def addView(data, target):
+        nonlocal offset
+        bufferViews.append({'buffer': 0, 'byteOffset': offset, 'byteLength': len(data), 'target': target})
+        blobs.append(data)
+        offset += len(data)
+        return len(bufferViews) - 1
+
+    if vertCount:
+        view = addView(_toBytes(positions), 34962) # ARRAY_BUFFER
+        accessors.append({'bufferView': view, 'componentType': 5126, 'count': vertCount, 'type': 'VEC3',
+                          'min': [min(positions[c::3]) for c in range(3)],
+                          'max': [max(positions[c::3]) for c in range(3)]})
+        attributes['POSITION'] = len(accessors) - 1
+        if hasNormals:
+            view = addView(_toBytes(normals), 34962)
+            accessors.append({'bufferView': view, 'componentType': 5126, 'count': vertCount, 'type': 'VEC3'})
+            attributes['NORMAL'] = len(accessors) - 1
+    primitive = {'attributes': attributes, 'mode': 4}
+    if len(indices):
+        view = addView(_toBytes(indices), 34963) # ELEMENT_ARRAY_BUFFER
+        accessors.append({'bufferView': view, 'componentType': 5125, 'count': len(indices), 'type': 'SCALAR'})
+        primitive['indices'] = len(accessors) - 1
+
+    binChunk = b''.join(blobs)
+    binChunk += b'\0' * (-len(binChunk) % 4)
+    gltf = {
+        'asset': {'version': '2.0', 'generator': 'Design History Animation'},
+        'scene': 0,
+        'scenes': [{'nodes': [0]}],
+        'nodes': [{'mesh': 0}],
+        'meshes': [{'primitives': [primitive] if attributes else []}],
+        'accessors': accessors,
+        'bufferViews': bufferViews,
+        'buffers': [{'byteLength': len(binChunk)}],
+    }
+    jsonChunk = json.dumps(gltf, separators=(',', ':')).encode('utf-8')
+    jsonChunk += b' ' * (-len(jsonChunk) % 4)
+
+    length = 12 + 8 + len(jsonChunk) + (8 + len(binChunk) if binChunk else 0)
+    with open(file, 'wb') as fh:
+        fh.write(struct.pack('<4sII', b'glTF', 2, length))
+        fh.write(struct.pack('<II', len(jsonChunk), 0x4E4F534A))
+        fh.write(jsonChunk)
+        if binChunk:
+            fh.write(struct.pack('<II', len(binChunk), 0x004E4942))
+            fh.write(binChunk)
+
+
+# Registered exporters, keyed by format name (also used as file extension).
+exporters = {
+    'obj': writeObj,
+    'stl': writeStl,
+    'ply': writePly,
+    'glb': writeGlb,
+}
+
+def registerExporter(name, writer):
+    '''Register writer(file, meshes) for the given format name.'''
+    exporters[name.lower()] = writer
+
+def writeMeshes(file, meshes, meshFormat='obj'):
+    '''Write meshes to file + '.' + meshFormat using the registered exporter.'''
+    writer = exporters.get(meshFormat.lower())
+    if not writer:
+        raise ValueError('Unknown mesh format: {}'.format(meshFormat))
+    writer(file + '.' + meshFormat.lower(), meshes)
+
+
+def standInMesh(rows, cols):
+    '''Build a rows x cols triangulated grid to stand in for a Fusion mesh.'''
+    coordinates = array.array('d')
+    normals = array.array('d')
+    for r in range(rows + 1):
+        for c in range(cols + 1):
+            coordinates.extend((c * 0.1, r * 0.1, (r * c % 7) * 0.01))
+            normals.extend((0.0, 0.0, 1.0))
+    indices = array.array('I')
+    for r in range(rows):
+        for c in range(cols):
+            n = r * (cols + 1) + c
+            indices.extend((n, n + 1, n + cols + 1, n + 1, n + cols + 2, n + cols + 1))
+    return MeshData(coordinates, normals, indices)
+
+def benchmark(rows=300, cols=300, meshCount=2, directory=None):
+    '''Time every registered exporter on stand-in meshes and report speedup
+    over the per-element obj writer.'''
+    meshes = [standInMesh(rows, cols) for _ in range(meshCount)]
+    triangleCount = sum(mesh.triangleCount for mesh in meshes)
+    directory = directory or tempfile.mkdtemp()
+    timings = {}
+    startTime = time.perf_counter()
+    _writeObjPerElement(os.path.join(directory, 'reference.obj'), meshes)
+    timings['reference'] = time.perf_counter() - startTime
+    for name in exporters:
+        startTime = time.perf_counter()
+        writeMeshes(os.path.join(directory, 'bench'), meshes, name)
+        timings[name] = time.perf_counter() - startTime
+    with open(os.path.join(directory, 'reference.obj'), 'rb') as fh:
+        reference = fh.read()
+    with open(os.path.join(directory, 'bench.obj'), 'rb') as fh:
+        identical = fh.read() == reference
+    print(f'{triangleCount} triangles, {meshCount} meshes, obj identical to reference: {identical}')
+    for name, seconds in timings.items():
+        size = os.path.getsize(os.path.join(directory, name + '.obj' if name == 'reference' else 'bench.' + name))
+        print(f'{name}: {seconds:.3f}s, {size} bytes, {timings["reference"] / seconds:.1f}x vs reference obj')
+    return timings
+
+
+if __name__ == '__main__':
+    benchmark()
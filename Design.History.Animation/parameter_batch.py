@@ -0,0 +1,138 @@
+#Description-Batched parameter updates with one recompute per frame
+
+# Every parameter value set on a design recomputes the model, so a frame
+# interpolating both extents of an extrude, or the quantities and spacings
+# of a pattern, used to recompute up to four times. A ParameterBatch
+# stages a frame's values with compute deferred and recomputes once when
+# it is committed.
+
+class ParameterBatch:
+    def __init__(self, design):
+        self._design = design
+        self._staged = []
+        self._refreshes = []
+
+    def set(self, param, value):
+        '''Stage param.value = value.'''
+        self._staged.append((param, 'value', value))
+
+    def setExpression(self, param, expression):
+        '''Stage param.expression = expression.'''
+        self._staged.append((param, 'expression', expression))
+
+    def refresh(self, callback, *args):
+        '''Run callback(*args) after the staged values are set, before the
+        recompute (e.g. to touch a feature that needs it).'''
+        self._refreshes.append((callback, args))
+
+    def commit(self):
+        '''Set all staged values and recompute once. Values that didn't
+        change are not set again, and nothing recomputes if none changed.'''
+        staged, self._staged = self._staged, []
+        refreshes, self._refreshes = self._refreshes, []
+        changed = [(param, name, value) for param, name, value in staged if getattr(param, name) != value]
+        if not changed:
+            return
+        design = self._design
+        deferred = design.isComputeDeferred
+        design.isComputeDeferred = True
+        try:
+            for param, name, value in changed:
+                setattr(param, name, value)
+            for callback, args in refreshes:
+                callback(*args)
+        finally:
+            # Leaving deferred compute recomputes the model once.
+            design.isComputeDeferred = deferred
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        if excType is None:
+            self.commit()
+        else:
+            self._staged = []
+            self._refreshes = []
+        return False
+
+
+class StandInDesign:
+    '''Counts recomputes like a Fusion design: every parameter change
+    recomputes unless compute is deferred, leaving deferral recomputes.'''
+    def __init__(self):
+        self.computes = 0
+        self._deferred = False
+        self._pending = False
+
+    @property
+    def isComputeDeferred(self):
+        return self._deferred
+    @isComputeDeferred.setter
+    def isComputeDeferred(self, value):
+        if self._deferred and not value and self._pending:
+            self.computes += 1
+            self._pending = False
+        self._deferred = value
+
+    def changed(self):
+        if self._deferred:
+            self._pending = True
+        else:
+            self.computes += 1
+
+class StandInParameter:
+    def __init__(self, design, value):
+        self._design = design
+        self._value = value
+
+    @property
+    def value(self):
+        return self._value
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self._design.changed()
+
+class StandInExtent:
+    def __init__(self, design):
+        self._design = design
+        self._symmetric = True
+
+    @property
+    def isSymmetric(self):
+        return self._symmetric
+    @isSymmetric.setter
+    def isSymmetric(self, value):
+        self._symmetric = value
+        self._design.changed()
+
+
+def check(frames=10):
+    '''Interpolate four stand-in parameters plus the revolve refresh per
+    frame, one parameter at a time and batched, and count recomputes.'''
+    counts = {}
+    for mode in ('per parameter', 'batched'):
+        design = StandInDesign()
+        parameters = [StandInParameter(design, 10.0) for _ in range(4)]
+        extent = StandInExtent(design)
+        for j in range(frames):
+            values = [value * (j + 1) / frames for value in (10.0, 5.0, 4.0, 2.0)]
+            if mode == 'batched':
+                with ParameterBatch(design) as batch:
+                    for param, value in zip(parameters, values):
+                        batch.set(param, value)
+                    batch.refresh(setattr, extent, 'isSymmetric', extent.isSymmetric)
+            else:
+                for param, value in zip(parameters, values):
+                    param.value = value
+                extent.isSymmetric = extent.isSymmetric
+        counts[mode] = design.computes / frames
+    return counts
+
+
+if __name__ == '__main__':
+    counts = check()
+    for mode, perFrame in counts.items():
+        print('{}: {:.1f} recomputes per frame'.format(mode, perFrame))
+    assert counts['batched'] == 1, counts
@@ -0,0 +1,165 @@
+#Description-Split a history animation into shards rendered in parallel
+
+# The coordinator splits the timeline range into contiguous shards with
+# roughly equal frame counts and fixes each shard's first global frame
+# number up front, so frame numbers and the camera rotation stay continuous
+# across shards. Each shard renders into its own folder (in a separate
+# Fusion instance, or a headless process with a stand-in renderer) and
+# mergeShards moves the results into one contiguous sequence.
+
+import concurrent.futures, json, math, os, shutil
+
+def planShards(itemFrames, shardCount):
+    '''Split itemFrames, a list of (timelineIndex, frameCount) in timeline
+    order, into at most shardCount contiguous shards of similar frame count.
+    Returns a list of dicts with the shard's items, startNum and frameCount.'''
+    items = [(index, count) for index, count in itemFrames if count > 0]
+    total = sum(count for _, count in items)
+    shardCount = max(1, min(shardCount, len(items)))
+    shards = []
+    num = 0
+    pending = []
+    for position, (index, count) in enumerate(items):
+        pending.append((index, count))
+        # Close the shard once it reaches its share of the frames, leaving at
+        # least one item for each remaining shard.
+        remainingShards = shardCount - len(shards) - 1
+        target = total * (len(shards) + 1) / shardCount
+        if remainingShards > 0 and (num + sum(c for _, c in pending) >= target or len(items) - position - 1 == remainingShards):
+            shards.append(pending)
+            num += sum(c for _, c in pending)
+            pending = []
+    if pending:
+        shards.append(pending)
+
+    plan = []
+    num = 0
+    for k, shardItems in enumerate(shards):
+        frameCount = sum(count for _, count in shardItems)
+        plan.append({
+            'index': k,
+            'items': [index for index, _ in shardItems],
+            # Timeline range rendered by the shard (zero based, end exclusive).
+            'start': shardItems[0][0],
+            'end': shardItems[-1][0] + 1,
+            'startNum': num,
+            'frameCount': frameCount,
+        })
+        num += frameCount
+    return plan
+
+def rotateEye(eye, frames, framesPerRotation):
+    '''Rotate eye about the y axis by frames rotation steps.'''
+    if not framesPerRotation:
+        return list(eye)
+    angle = math.pi * 2.0 * frames / framesPerRotation
+    cos, sin = math.cos(angle), math.sin(angle)
+    return [eye[0] * cos + eye[2] * sin, eye[1], - eye[0] * sin + eye[2] * cos]
+
+def shardFolder(outputFolder, index):
+    return os.path.join(outputFolder, 'shard_{}'.format(index))
+
+
+def mergeLockFile(outputFolder):
+    return os.path.join(outputFolder, 'merge.lock')
+
+def writeSpec(file, spec):
+    _writeJson(file, spec)
+    # A new spec is merged anew.
+    if os.path.exists(mergeLockFile(spec['outputFolder'])):
+        os.remove(mergeLockFile(spec['outputFolder']))
+
+def _writeJson(file, data):
+    # Write next to the target and rename, so readers never see half a file.
+    with open(file + '.tmp', 'w') as fh:
+        json.dump(data, fh, indent=1)
+    os.replace(file + '.tmp', file)
+
+def readSpec(file):
+    with open(file, 'r') as fh:
+        return json.load(fh)
+
+def markShardDone(specFile, index, files):
+    '''Record the files a finished shard wrote (relative to its folder).'''
+    spec = readSpec(specFile)
+    _writeJson(os.path.join(shardFolder(spec['outputFolder'], index), 'done.json'), sorted(files))
+
+def mergeShards(specFile):
+    '''Once every shard is done, move all shard outputs into the output
+    folder. Returns True if merged, False while shards are still running or
+    when another process merges them.'''
+    spec = readSpec(specFile)
+    outputFolder = spec['outputFolder']
+    doneFiles = []
+    for shard in spec['shards']:
+        folder = shardFolder(outputFolder, shard['index'])
+        try:
+            with open(os.path.join(folder, 'done.json'), 'r') as fh:
+                doneFiles.append((folder, json.load(fh)))
+        except (OSError, ValueError):
+            return False
+    # Shards finishing together can all find every shard done; only the one
+    # that creates the lock file merges.
+    try:
+        os.close(os.open(mergeLockFile(outputFolder), os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+    frameIndex = {}
+    for folder, files in doneFiles:
+        for name in files:
+            if name == 'frame_index.json':
+                with open(os.path.join(folder, name), 'r') as fh:
+                    frameIndex.update(json.load(fh))
+            else:
+                os.replace(os.path.join(folder, name), os.path.join(outputFolder, name))
+        shutil.rmtree(folder, ignore_errors=True)
+    if frameIndex:
+        with open(os.path.join(outputFolder, 'frame_index.json'), 'w') as fh:
+            json.dump(frameIndex, fh, indent=1, sort_keys=True)
+    return True
+
+
+def runShards(specFile, renderShard, processes=None):
+    '''Render every shard of specFile with renderShard(specFile, index) in
+    separate processes, then merge. renderShard must be a picklable,
+    module level function that returns the list of files it wrote.'''
+    spec = readSpec(specFile)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = {pool.submit(renderShard, specFile, shard['index']): shard['index'] for shard in spec['shards']}
+        for future in concurrent.futures.as_completed(futures):
+            markShardDone(specFile, futures[future], future.result())
+    return mergeShards(specFile)
+
+
+def standInRender(specFile, index):
+    '''Headless stand-in renderer: writes one small file per frame under its
+    global frame number, holding the rotated camera eye for that frame.'''
+    spec = readSpec(specFile)
+    shard = spec['shards'][index]
+    folder = shardFolder(spec['outputFolder'], index)
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for n in range(shard['startNum'], shard['startNum'] + shard['frameCount']):
+        name = '{}_{}.png'.format(spec['filename'], n)
+        eye = rotateEye(spec['camera'][0], n + 1, spec['framesPerRotation'])
+        with open(os.path.join(folder, name), 'w') as fh:
+            json.dump({'num': n, 'eye': eye}, fh)
+        files.append(name)
+    return files
+
+
+if __name__ == '__main__':
+    import tempfile
+    outputFolder = tempfile.mkdtemp()
+    itemFrames = [(i, 0 if i % 4 == 0 else 5) for i in range(40)] + [(40, 25)]
+    spec = {'filename': 'standIn', 'outputFolder': outputFolder, 'framesPerRotation': 50,
+            'camera': [[0.0, 0.0, 10.0], [0.0, 0.0, 0.0], [0.0, 1.0, 0.0]],
+            'shards': planShards(itemFrames, 4)}
+    specFile = os.path.join(outputFolder, 'spec.json')
+    writeSpec(specFile, spec)
+    runShards(specFile, standInRender)
+    total = sum(count for _, count in itemFrames)
+    names = set(os.listdir(outputFolder))
+    contiguous = all('standIn_{}.png'.format(n) in names for n in range(total))
+    print('shards:', [(shard['startNum'], shard['frameCount']) for shard in spec['shards']])
+    print('frames:', total, 'contiguous:', contiguous)
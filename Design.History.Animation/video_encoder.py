@@ -0,0 +1,155 @@
+#Description-Video encoding stage for animation frames
+
+# Streams finished PNG frames into a video instead of leaving thousands of
+# numbered images on disk. Frames are piped into a local ffmpeg process, or
+# written as an animated PNG when ffmpeg isn't available. Each intermediate
+# PNG is deleted once encoded, so only the frames still in the writer pool
+# exist on disk at any time.
+
+import os, shutil, struct, subprocess, sys, threading, zlib
+
+videoFormats = ('None', 'MP4', 'APNG')
+
+
+class _OrderedEncoder:
+    '''Encodes frames strictly in index order, whatever order the writer
+    threads finish them in. Subclasses provide _encode(file), which encodes
+    one frame, and _finish(), which closes the video.'''
+    def __init__(self, keepFrames):
+        self._keepFrames = keepFrames
+        self._next = 0
+        self._pending = {}
+        self._previous = None
+        self._lock = threading.Lock()
+
+    def addFrame(self, index, file):
+        '''Queue frame file as frame number index. A file may be added again
+        for repeated frames; it is kept until a different file follows it.'''
+        with self._lock:
+            self._pending[index] = file
+            while self._next in self._pending:
+                self._encodeNext(self._pending.pop(self._next))
+
+    def close(self):
+        '''Encode frames left behind a missing index and finish the video.'''
+        with self._lock:
+            for index in sorted(self._pending):
+                self._encodeNext(self._pending.pop(index))
+            self._release(None)
+            self._finish()
+
+    def _encodeNext(self, file):
+        self._encode(file)
+        self._release(file)
+        self._next += 1
+
+    def _release(self, file):
+        if self._previous and self._previous != file and not self._keepFrames:
+            try:
+                os.remove(self._previous)
+            except OSError:
+                pass
+        self._previous = file
+
+
+class FfmpegEncoder(_OrderedEncoder):
+    '''Pipes PNG frames into an ffmpeg H.264 encode.'''
+    def __init__(self, file, ffmpeg, frameRate, crf=20, bitrate=0, keepFrames=False):
+        super().__init__(keepFrames)
+        rate = ['-b:v', '{}k'.format(bitrate)] if bitrate > 0 else ['-crf', str(crf)]
+        command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'image2pipe', '-framerate', str(frameRate), '-i', '-',
+                   '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2'] + rate + [file]
+        # Don't flash a console window on Windows.
+        flags = 0x08000000 if sys.platform == 'win32' else 0
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.PIPE, creationflags=flags)
+
+    def _encode(self, file):
+        with open(file, 'rb') as fh:
+            data = fh.read()
+        try:
+            self._process.stdin.write(data)
+        except OSError:
+            self._process.kill()
+            raise RuntimeError('ffmpeg stopped: {}'.format(self._process.stderr.read().decode(errors='replace')))
+
+    def _finish(self):
+        _, errors = self._process.communicate()
+        if self._process.returncode != 0:
+            raise RuntimeError('ffmpeg failed: {}'.format(errors.decode(errors='replace')))
+
+
+def _pngChunk(kind, data):
+    chunk = kind + data
+    return struct.pack('>I', len(data)) + chunk + struct.pack('>I', zlib.crc32(chunk) & 0xffffffff)
+
+def _readPngChunks(file):
+    with open(file, 'rb') as fh:
+        data = fh.read()
+    if data[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('Not a PNG file: {}'.format(file))
+    chunks = []
+    offset = 8
+    while offset < len(data):
+        length, kind = struct.unpack_from('>I4s', data, offset)
+        chunks.append((kind, data[offset + 8:offset + 8 + length]))
+        offset += 12 + length
+    return chunks
+
+class ApngEncoder(_OrderedEncoder):
+    '''Pure Python animated PNG writer; frames are copied without re-encoding.'''
+    def __init__(self, file, frameRate, keepFrames=False):
+        super().__init__(keepFrames)
+        self._fh = open(file, 'wb')
+        self._frameRate = int(frameRate)
+        self._header = None
+        self._actlOffset = 0
+        self._frames = 0
+        self._sequence = 0
+
+    def _encode(self, file):
+        chunks = _readPngChunks(file)
+        header = b''.join(data for kind, data in chunks if kind == b'IHDR')
+        image = b''.join(data for kind, data in chunks if kind == b'IDAT')
+        if self._header is None:
+            self._header = header
+            self._fh.write(b'\x89PNG\r\n\x1a\n' + _pngChunk(b'IHDR', header))
+            # Palette and colour chunks of the first frame apply to all.
+            for kind, data in chunks:
+                if kind not in (b'IHDR', b'IDAT', b'IEND', b'acTL', b'fcTL', b'fdAT'):
+                    self._fh.write(_pngChunk(kind, data))
+            self._actlOffset = self._fh.tell()
+            self._fh.write(_pngChunk(b'acTL', struct.pack('>II', 0, 0)))
+        elif header != self._header:
+            raise ValueError('Frame size or format changed: {}'.format(file))
+        width, height = struct.unpack_from('>II', header)
+        self._fh.write(_pngChunk(b'fcTL', struct.pack('>IIIIIHHBB', self._sequence, width, height, 0, 0,
+                                                      1, self._frameRate, 0, 0)))
+        self._sequence += 1
+        if self._frames == 0:
+            self._fh.write(_pngChunk(b'IDAT', image))
+        else:
+            self._fh.write(_pngChunk(b'fdAT', struct.pack('>I', self._sequence) + image))
+            self._sequence += 1
+        self._frames += 1
+
+    def _finish(self):
+        if self._header is not None:
+            self._fh.write(_pngChunk(b'IEND', b''))
+            # Now that the frame count is known, fill in the animation control chunk.
+            self._fh.seek(self._actlOffset)
+            self._fh.write(_pngChunk(b'acTL', struct.pack('>II', self._frames, 0)))
+        self._fh.close()
+
+
+def createEncoder(videoFormat, file, frameRate, crf=20, bitrate=0, keepFrames=False, ffmpeg='ffmpeg'):
+    '''Create the encoder for videoFormat writing file + extension, or None.
+    MP4 falls back to APNG if ffmpeg can't be found.'''
+    if videoFormat == 'MP4':
+        path = shutil.which(ffmpeg)
+        if path:
+            return FfmpegEncoder(file + '.mp4', path, frameRate, crf, bitrate, keepFrames)
+        videoFormat = 'APNG'
+    if videoFormat == 'APNG':
+        return ApngEncoder(file + '.apng', frameRate, keepFrames)
+    return None
@@ -0,0 +1,194 @@
+#Description-Box specs for the batch mode of the finger joint box
+
+# A batch file lists one box per CSV row or JSON object, with any of the
+# dialog's fields: name, boxtype, length, width, height, thickness,
+# fingersL, fingersW, fingersH, overhang and units (mm by default). Missing
+# fields take the dialog's defaults. Specs that repeat reuse the panel
+# outlines computed for the first one, and every box's build time or
+# failure goes into a report. A JSON batch file can also export the flat
+# pattern of all boxes, with an "export" object next to "boxes":
+# {"format": "svg" or "dxf", "sheetWidth", "sheetHeight", "kerf", "spacing",
+#  "units", "folder"}. With "assembly": true the boxes are built as one
+# assembly in which identical panels share a component (panel_assembly).
+
+import csv, json, os, time
+from . import finger_geometry, flat_pattern
+
+# Dialog defaults, in cm (Fusion's internal unit).
+defaults = {
+    'boxtype': 'Closed',
+    'length': 12.0,
+    'width': 8.0,
+    'height': 6.0,
+    'thickness': 0.5,
+    'fingersL': 6,
+    'fingersW': 4,
+    'fingersH': 4,
+    'overhang': 0.05,
+}
+
+# Centimeters per unit.
+units = {'mm': 0.1, 'cm': 1.0, 'm': 100.0, 'in': 2.54}
+
+lengths = ('length', 'width', 'height', 'thickness', 'overhang')
+counts = ('fingersL', 'fingersW', 'fingersH')
+
+def readSpecs(file):
+    '''Rows of a .csv or .json batch file as dicts. A JSON file holds a list
+    of objects, or an object with the list under "boxes".'''
+    if os.path.splitext(file)[1].lower() == '.json':
+        with open(file) as f:
+            specs = json.load(f)
+        if isinstance(specs, dict):
+            specs = specs.get('boxes', [])
+        return [dict(spec) for spec in specs]
+    with open(file, newline='') as f:
+        return [{key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+                for row in csv.DictReader(f)]
+
+def boxSpec(row):
+    '''Complete, validated box spec in cm from a batch row. Raises ValueError.'''
+    scale = units.get(str(row.get('units', 'mm')).strip().lower())
+    if scale is None:
+        raise ValueError('Unknown units {!r}'.format(row['units']))
+    spec = dict(defaults)
+    boxtype = str(row.get('boxtype', spec['boxtype'])).strip().capitalize()
+    if boxtype not in ('Open', 'Closed'):
+        raise ValueError('Box type must be Open or Closed, not {!r}'.format(row['boxtype']))
+    spec['boxtype'] = boxtype
+    for name in lengths:
+        if name in row:
+            spec[name] = float(row[name]) * scale
+    for name in counts:
+        if name in row:
+            spec[name] = int(float(row[name]))
+    for name in ('length', 'width', 'height', 'thickness'):
+        if spec[name] <= 0:
+            raise ValueError('{} must be positive'.format(name))
+    if min(spec[name] for name in counts) < 1:
+        raise ValueError('Every edge needs at least one finger')
+    if spec['overhang'] < 0:
+        raise ValueError('overhang must not be negative')
+    if min(spec['length'], spec['width'], spec['height']) <= 2 * spec['thickness']:
+        raise ValueError('The box is too small for its thickness')
+    return spec
+
+def exportSettings(file):
+    '''Flat pattern settings of a JSON batch file in cm, or None.'''
+    if os.path.splitext(file)[1].lower() != '.json':
+        return None
+    with open(file) as f:
+        batch = json.load(f)
+    export = batch.get('export') if isinstance(batch, dict) else None
+    if not export:
+        return None
+    scale = units.get(str(export.get('units', 'mm')).lower())
+    if scale is None:
+        raise ValueError('Unknown units {!r}'.format(export['units']))
+    kerf = float(export.get('kerf', 0.2)) * scale
+    return {
+        'format': str(export.get('format', 'svg')).lower(),
+        'sheetWidth': float(export.get('sheetWidth', 600)) * scale,
+        'sheetHeight': float(export.get('sheetHeight', 400)) * scale,
+        'kerf': kerf,
+        'spacing': float(export['spacing']) * scale if 'spacing' in export else kerf + 0.2,
+        'folder': export.get('folder') or os.path.splitext(file)[0] + '_flat',
+    }
+
+def assemblyMode(file):
+    '''Whether a JSON batch file asks for a shared panel assembly.'''
+    if os.path.splitext(file)[1].lower() != '.json':
+        return False
+    with open(file) as f:
+        batch = json.load(f)
+    return isinstance(batch, dict) and bool(batch.get('assembly'))
+
+def specKey(spec):
+    return tuple(spec[name] for name in sorted(defaults))
+
+
+class PanelCache:
+    '''Panel outlines by spec, computed once per distinct spec.'''
+    def __init__(self):
+        self._panels = {}
+        self.hits = 0
+
+    def panels(self, spec):
+        '''(panels, whether they came from the cache)'''
+        key = specKey(spec)
+        if key in self._panels:
+            self.hits += 1
+            return self._panels[key], True
+        panels = finger_geometry.boxPanels(spec['boxtype'], spec['length'], spec['width'], spec['height'], spec['thickness'],
+                                           spec['fingersL'], spec['fingersW'], spec['fingersH'], spec['overhang'])
+        self._panels[key] = panels
+        return panels, False
+
+
+class BatchReport:
+    def __init__(self):
+        self.boxes = []
+        self.notes = []
+        self._start = time.perf_counter()
+
+    def add(self, name, seconds, error=None, cached=False):
+        self.boxes.append((name, seconds, error, cached))
+
+    def note(self, text):
+        self.notes.append(text)
+
+    @property
+    def failures(self):
+        return [box for box in self.boxes if box[2]]
+
+    def summary(self):
+        return '{} boxes built, {} failed in {:.1f} s'.format(
+            len(self.boxes) - len(self.failures), len(self.failures), time.perf_counter() - self._start)
+
+    def text(self):
+        lines = [self.summary(), '']
+        for name, seconds, error, cached in self.boxes:
+            status = 'FAILED: ' + error if error else ('built (cached outlines)' if cached else 'built')
+            lines.append('{:<24} {:8.2f} s  {}'.format(name, seconds, status))
+        if self.notes:
+            lines += [''] + self.notes
+        return '\n'.join(lines) + '\n'
+
+    def write(self, file):
+        with open(file, 'w') as f:
+            f.write(self.text())
+
+
+def exportFlatPattern(file, boxes, report):
+    '''Write the flat pattern of the (name, panels) boxes if the batch file
+    asks for one, noting the outcome in the report.'''
+    start = time.perf_counter()
+    try:
+        settings = exportSettings(file)
+        if not settings or not boxes:
+            return
+        files, sheets = flat_pattern.export(boxes, settings['folder'], settings['sheetWidth'], settings['sheetHeight'],
+                                            settings['kerf'], settings['spacing'], settings['format'])
+        report.note('Flat pattern: {} sheets, {:.0%} used, {:.1f} s, in {}'.format(
+            len(files), flat_pattern.utilization(sheets), time.perf_counter() - start, settings['folder']))
+    except Exception as error:
+        report.note('Flat pattern FAILED: ' + str(error))
+
+
+def dryRun(file):
+    '''Read and validate a batch file, compute its outlines and export its
+    flat pattern, without Fusion. Returns the report.'''
+    report = BatchReport()
+    cache = PanelCache()
+    built = []
+    for k, row in enumerate(readSpecs(file)):
+        name = row.get('name') or 'Box {}'.format(k + 1)
+        start = time.perf_counter()
+        try:
+            panels, cached = cache.panels(boxSpec(row))
+            report.add(name, time.perf_counter() - start, cached=cached)
+            built.append((name, panels))
+        except Exception as error:
+            report.add(name, time.perf_counter() - start, error=str(error))
+    exportFlatPattern(file, built, report)
+    return report
@@ -12,12 +12,16 @@
 ## The user will input the Length, Height and Width of the box.
 ## They will also input the thickness of the material and the number of fingers on each edge
 ##
-## Each side creating sub routine will create a new sketch and draw the side then model it.
+## The outline of each side is computed in finger_geometry.py, createBox then draws all of them on
+## one sketch and models them. With 'Patterned fingers' createPatternBox cuts one notch per edge and
+## patterns it instead, which keeps the model small for many fingers. 'Shared components' makes each
+## distinct panel a component and places its copies as occurrences (createAssembly).
 ##
 ###################################################################################################
 
 import adsk.core, adsk.fusion, adsk.cam, traceback
-import math
+import math, os, time
+from . import box_batch, finger_fit, finger_geometry, flat_pattern, live_preview, panel_assembly, parametric_box, sketch_builder
 
 # Globals
 _app = adsk.core.Application.cast(None)
@@ -39,10 +43,25 @@ _fingersL = adsk.core.ValueCommandInput.cast(None)
 _thickness = adsk.core.ValueCommandInput.cast(None)
 _fingersH = adsk.core.ValueCommandInput.cast(None)
 _overhang = adsk.core.TextBoxCommandInput.cast(None)
+_flatPattern = adsk.core.DropDownCommandInput.cast(None)
+_sheetWidth = adsk.core.ValueCommandInput.cast(None)
+_sheetHeight = adsk.core.ValueCommandInput.cast(None)
+_kerf = adsk.core.ValueCommandInput.cast(None)
+_cutter = adsk.core.ValueCommandInput.cast(None)
+_buildMode = adsk.core.DropDownCommandInput.cast(None)
+_useSuggested = adsk.core.BoolValueCommandInput.cast(None)
+_suggested = None
 _errMessage = adsk.core.TextBoxCommandInput.cast(None)
 
 _handlers = []
 
+# Live preview of the panel outlines while the dialog is open.
+_previewEventId = 'FingerJointPreview'
+_previewEvent = None
+_previewState = live_preview.PreviewState()
+_previewGroups = {}
+_previewDebouncer = None
+
 def run(context):
     try:
         global _app, _ui
@@ -50,6 +69,14 @@ def run(context):
         _app = adsk.core.Application.get()
         _ui  = _app.userInterface
 
+        # Headless batch mode: build every box of the spec file instead of
+        # showing the dialog.
+        batchFile = os.environ.get('FINGER_JOINT_BATCH')
+        if batchFile:
+            report = runBatch(batchFile)
+            _ui.messageBox(report.summary() + '\nReport: ' + batchReportFile(batchFile))
+            return
+
         cmdDef = _ui.commandDefinitions.itemById('adskFingerJointScript')
         if not cmdDef:
             # Create a command definition.
@@ -77,6 +104,12 @@ class FingerJointCommandDestroyHandler(adsk.core.CommandEventHandler):
         try:
             eventArgs = adsk.core.CommandEventArgs.cast(args)
 
+            clearPreview()
+            if _previewDebouncer:
+                _previewDebouncer.cancel()
+            if _previewEvent:
+                _app.unregisterCustomEvent(_previewEventId)
+
             # when the command is done, terminate the script
             # this will release all globals which will remove all event handlers
             adsk.terminate()
@@ -181,6 +214,7 @@ class FingerJointCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             inputs = cmd.commandInputs
 
             global _boxtype, _length, _width, _pitch, _height, _fingersL, _thickness, _fingersH, _overhang, _fingersW, _imgInputOpen, _imgInputClosed, _errMessage
+            global _flatPattern, _sheetWidth, _sheetHeight, _kerf, _cutter, _useSuggested, _buildMode
 
             # Define the command dialog.
             # This is where we list all the inputs
@@ -217,6 +251,30 @@ class FingerJointCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
 
             _overhang = inputs.addValueInput('overhang', 'Overhang', _units, adsk.core.ValueInput.createByReal(float(overhang)))
 
+            # A parametric box is driven by user parameters and resized by
+            # editing them.
+            _buildMode = inputs.addDropDownCommandInput('buildMode', 'Build', adsk.core.DropDownStyles.TextListDropDownStyle)
+            _buildMode.listItems.add('Fixed outline', True)
+            _buildMode.listItems.add('Patterned fingers', False)
+            _buildMode.listItems.add('User parameters', False)
+            _buildMode.listItems.add('Shared components', False)
+
+            # Fingers narrower than the cutter can't be cut.
+            _cutter = inputs.addValueInput('cutter', 'Cutter diameter', _units, adsk.core.ValueInput.createByReal(0.0))
+            _useSuggested = inputs.addBoolValueInput('useSuggested', 'Use suggested fingers', False, '', False)
+
+            # Optionally write the panels as a nested flat pattern for laser cutting.
+            _flatPattern = inputs.addDropDownCommandInput('flatPattern', 'Flat pattern', adsk.core.DropDownStyles.TextListDropDownStyle)
+            _flatPattern.listItems.add('None', True)
+            _flatPattern.listItems.add('SVG', False)
+            _flatPattern.listItems.add('DXF', False)
+
+            _sheetWidth = inputs.addValueInput('sheetWidth', 'Sheet width', _units, adsk.core.ValueInput.createByReal(60.0))
+            _sheetHeight = inputs.addValueInput('sheetHeight', 'Sheet height', _units, adsk.core.ValueInput.createByReal(40.0))
+            _kerf = inputs.addValueInput('kerf', 'Kerf', _units, adsk.core.ValueInput.createByReal(0.02))
+            for sheetInput in (_sheetWidth, _sheetHeight, _kerf):
+                sheetInput.isVisible = False
+
             _errMessage = inputs.addTextBoxCommandInput('errMessage', '', '', 2, True)
             _errMessage.isFullWidth = True
 
@@ -236,6 +294,16 @@ class FingerJointCommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             onDestroy = FingerJointCommandDestroyHandler()
             cmd.destroy.add(onDestroy)
             _handlers.append(onDestroy)
+
+            # The preview is redrawn from a custom event, fired once the
+            # inputs have been still for a moment.
+            global _previewEvent, _previewDebouncer
+            _previewEvent = _app.registerCustomEvent(_previewEventId)
+            onPreview = FingerJointPreviewHandler()
+            _previewEvent.add(onPreview)
+            _handlers.append(onPreview)
+            _previewDebouncer = live_preview.Debouncer(0.2, lambda: _app.fireCustomEvent(_previewEventId))
+            _previewDebouncer.trigger()
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
@@ -249,6 +317,10 @@ class FingerJointCommandExecuteHandler(adsk.core.CommandEventHandler):
         try:
             eventArgs = adsk.core.CommandEventArgs.cast(args)
 
+            if _previewDebouncer:
+                _previewDebouncer.cancel()
+            clearPreview()
+
             if _boxtype.selectedItem.name == 'Open':
                 width = _width.value
             elif _boxtype.selectedItem.name == 'Closed':
@@ -277,38 +349,21 @@ class FingerJointCommandExecuteHandler(adsk.core.CommandEventHandler):
             fingersW = int(_fingersW.value)
             overhang = _overhang.value
 
-##################################################################################################################################
-##
-## Now lets calculate the finger widths that we need
-##
-##################################################################################################################################
-            fingerwidthL = (length-(2*thickness))/((fingersL*2)+1)
-            fingerwidthW = (width-(2*thickness))/((fingersW*2)+1)
-            if boxtype == 'Closed':
-                fingerwidthH = (height-(2*thickness))/((fingersH*2)+1)
-            else:
-                fingerwidthH = (height - thickness)/((fingersH*2)+1)
-#################################################################################################################################
-# And the finger height which is the thickness + extra length (overhang) that we enter
-# If there is overhang, we should increase the box dimensions to compensate for this
-#################################################################################################################################
-            if overhang > 0:
-                finger_height = thickness + overhang
-                height = height + (2*overhang)
-                width = width + (2*overhang)
-                length = length + (2*overhang)
-            else:
-                finger_height = thickness
-
-            if boxtype == 'Closed':
-                CreateType1(length,height,fingerwidthL,fingerwidthH,fingersL,fingersH, finger_height,thickness)
-                CreateType2(boxtype,length,width,fingerwidthL,fingerwidthW,fingersL,fingersW, finger_height,thickness)
-                CreateType3(height,width,fingerwidthH,fingerwidthW,fingersH,fingersW, finger_height,thickness)
+            # The panel outlines are computed without Fusion; here they are
+            # only sketched and extruded.
+            panels = finger_geometry.boxPanels(boxtype, length, width, height, thickness, fingersL, fingersW, fingersH, overhang)
+            values = {'length': length, 'width': width, 'height': height, 'thickness': thickness,
+                      'overhang': overhang, 'fingersL': fingersL, 'fingersW': fingersW, 'fingersH': fingersH}
+            if _buildMode.selectedItem.name == 'User parameters':
+                createParametricBox(des, boxtype, values)
+            elif _buildMode.selectedItem.name == 'Patterned fingers':
+                createPatternBox(des.rootComponent, boxtype, values)
+            elif _buildMode.selectedItem.name == 'Shared components':
+                createAssembly(des.rootComponent, [('Finger Joint Box', panels, thickness)])
             else:
-                height = height - overhang
-                CreateType4(length,height,fingerwidthL,fingerwidthH,fingersL,fingersH, finger_height,thickness)
-                CreateType2(boxtype,length,width,fingerwidthL,fingerwidthW,fingersL,fingersW, finger_height,thickness)
-                CreateType5(height,width,fingerwidthH,fingerwidthW,fingersH,fingersW, finger_height,thickness)
+                createBox(des.rootComponent, panels, thickness)
+            if _flatPattern.selectedItem.name != 'None':
+                exportFlatPattern([('Box', panels)], _flatPattern.selectedItem.name.lower(), _sheetWidth.value, _sheetHeight.value, _kerf.value)
             #DoStuff(boxtype, height, width, length, thickness, fingersL, fingersH, fingersW, overhang)
 
 
@@ -328,6 +383,13 @@ class FingerJointCommandInputChangedHandler(adsk.core.InputChangedEventHandler):
             changedInput = eventArgs.input
 
             global _units
+            if changedInput.id == 'useSuggested' and _suggested:
+                _fingersL.value, _fingersW.value, _fingersH.value = [float(count) for count in _suggested.counts]
+
+            if changedInput.id == 'flatPattern':
+                for sheetInput in (_sheetWidth, _sheetHeight, _kerf):
+                    sheetInput.isVisible = _flatPattern.selectedItem.name != 'None'
+
             if changedInput.id == 'boxtype':
                 if _boxtype.selectedItem.name == 'Open':
                     _imgInputClosed.isVisible = False
@@ -359,12 +421,26 @@ class FingerJointCommandInputChangedHandler(adsk.core.InputChangedEventHandler):
                 _overhang.value = _overhang.value
                 _boxtype.selectedItem.name = _boxtype.selectedItem.name
 
+            if _previewDebouncer:
+                _previewDebouncer.trigger()
 
         except:
             if _ui:
                 _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
 
 
+# Event handler for the debounced preview event.
+class FingerJointPreviewHandler(adsk.core.CustomEventHandler):
+    def __init__(self):
+        super().__init__()
+    def notify(self, args):
+        try:
+            updatePreview()
+        except:
+            if _ui:
+                _ui.messageBox('Failed:\n{}'.format(traceback.format_exc()))
+
+
 # Event handler for the validateInputs event.
 class FingerJointCommandValidateInputsHandler(adsk.core.ValidateInputsEventHandler):
     def __init__(self):
@@ -375,12 +451,28 @@ class FingerJointCommandValidateInputsHandler(adsk.core.ValidateInputsEventHandl
 
             _errMessage.text = ''
 
-
-
-
-
-
-            des = adsk.fusion.Design.cast(_app.activeProduct)
+            # Check the finger widths of the entered counts and suggest the
+            # counts that fit the thickness and cutter best.
+            global _suggested
+            thickness = _thickness.value
+            cutter = _cutter.value
+            if thickness <= 0:
+                _errMessage.text = 'The thickness must be positive.'
+                eventArgs.areInputsValid = False
+                return
+            spans = finger_geometry.edgeSpans(_boxtype.selectedItem.name, _length.value, _width.value, _height.value, thickness)
+            counts = (int(_fingersL.value), int(_fingersW.value), int(_fingersH.value))
+            errors, warnings = finger_fit.problems(spans, counts, thickness, cutter)
+            _suggested = finger_fit.bestCounts(spans, thickness, cutter)
+            lines = errors + warnings
+            if _suggested is None:
+                lines.append('The box is too small for fingers of this thickness and cutter.')
+            elif tuple(_suggested.counts) != counts:
+                lines.append('Suggested fingers: ' + _suggested.describe(thickness))
+            _useSuggested.isEnabled = _suggested is not None and tuple(_suggested.counts) != counts
+            _errMessage.text = '\n'.join(lines)
+            if errors or _suggested is None:
+                eventArgs.areInputsValid = False
 
         except:
             if _ui:
@@ -415,665 +507,135 @@ def DoStuff(boxtype, height, width, length, thickness, fingersL, fingersH, finge
     except Exception as error:
         _ui.messageBox("DoStuff Failed : " + str(error))
         return None
-def CreateType1(length,height,fingerwidthL,fingerwidthH,fingercountL,fingercountH, finger_height,thickness):
-
-    product = app.activeProduct
-    design = adsk.fusion.Design.cast(product)
-    if not design:
-        ui.messageBox('It is not supported in current workspace, please change to MODEL workspace and try again.')
-        return
-    currentDesignType = design.designType
-
-    rootComp = design.rootComponent
-    if rootComp is None:
-        ui.messageBox('New component failed to create', 'New Component Failed')
-        return
-
-    sketches = rootComp.sketches
-    #Create a new sketch
-    sketch = sketches.add(rootComp.xYConstructionPlane)
-    # add sketch curves
-    lines = sketch.sketchCurves.sketchLines
-
-    #################################################################################################
-    # Draw the type 1 side geometry
-    # points go x,y,z
-    ################################################################################################
-    heightmfh = height - finger_height
-    numberpointsup = fingercountL * 2
-    numberpointsdown = (fingercountL * 2) + 2
-    numberpointsup = int(numberpointsup)
-    numberpointsdown = int(numberpointsdown)
-    pointleftup = finger_height + fingerwidthL
-    pointleftdown = finger_height
-    pointup = [0]
-    pointdown = [0]
-    pointupB = [0]
-    pointdownB = [0]
-    pointdownC = [0]
-    pointupC = [0]
-    pointupD = [0]
-    pointdownD = [0]
-    # This just loads the lists with enough entries for the box.
-    for x in range (numberpointsdown+5):
-        pointup.append(x)
-        pointdown.append(x)
-        pointupB.append(x)
-        pointdownB.append(x)
-        pointupC.append(x)
-        pointdownC.append(x)
-        pointupD.append(x)
-        pointdownD.append(x)
-        pass
-    pointup[1] = adsk.core.Point3D.create(pointleftup,height,0)
-    pointdown[1] = adsk.core.Point3D.create(pointleftdown,heightmfh,0)
-    pointupB[1] = adsk.core.Point3D.create(pointleftup,0,0)
-    pointdownB[1] = adsk.core.Point3D.create(pointleftdown,finger_height,0)
-    for step in range (2,numberpointsup + 1):
-        link = step - 1
-        pointup[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthL),height,0)
-        pointupB[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthL),0,0)
-        pass
-    for step in range (2,numberpointsdown + 1):
-        link = step - 1
-        pointdown[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthL),heightmfh,0)
-        pointdownB[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthL),finger_height,0)
-        pass
-    for line in range (2,numberpointsup + 2,2):
-        lines.addByTwoPoints(pointup[line - 1], pointup[line])
-        lines.addByTwoPoints(pointup[line- 1],pointdown[line])
-        lines.addByTwoPoints(pointup[line],pointdown[line + 1])
-        lines.addByTwoPoints(pointupB[line - 1], pointupB[line])
-        lines.addByTwoPoints(pointupB[line- 1],pointdownB[line])
-        lines.addByTwoPoints(pointupB[line],pointdownB[line + 1])
-        pass
-    for line in range (2,numberpointsdown + 2,2):
-        lines.addByTwoPoints(pointdown[line - 1], pointdown[line])
-        lines.addByTwoPoints(pointdownB[line - 1], pointdownB[line])
-        pass
-#############################################################################################################
-# Vertical sides next
-#############################################################################################################
-    numberpointsupV = fingercountH * 2
-    numberpointsdownV = (fingercountH * 2) + 2
-    numberpointsupV = int(numberpointsupV)
-    numberpointsdownV = int(numberpointsdownV)
-    pointdownC[1] = pointdownB[1]
-    pointupC[1] = adsk.core.Point3D.create(0,finger_height + fingerwidthH,0)
-    pointdownD[1] = adsk.core.Point3D.create(length - finger_height,finger_height,0)
-    pointupD[1] = adsk.core.Point3D.create(length,finger_height + fingerwidthH,0)
-    for step in range (2,numberpointsupV + 1):
-        link = step - 1
-        pointupC[step] = adsk.core.Point3D.create(0, (finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        #lines.addByTwoPoints(pointupC[step - 1], pointupC[step])
-        pointupD[step] = adsk.core.Point3D.create(length,(finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        pass
-    for step in range (2,numberpointsdownV + 1):
-        link = step - 1
-        pointdownC[step] = adsk.core.Point3D.create(finger_height,pointleftdown + (link*fingerwidthH),0)
-        pointdownD[step] = adsk.core.Point3D.create(length - finger_height,pointleftdown + (link*fingerwidthH),0)
-        pass
-    for line in range (2,numberpointsupV + 2,2):
-        lines.addByTwoPoints(pointupC[line - 1], pointupC[line])
-        lines.addByTwoPoints(pointupC[line- 1],pointdownC[line])
-        lines.addByTwoPoints(pointupC[line],pointdownC[line + 1])
-        lines.addByTwoPoints(pointupD[line - 1], pointupD[line])
-        lines.addByTwoPoints(pointupD[line- 1],pointdownD[line])
-        lines.addByTwoPoints(pointupD[line],pointdownD[line + 1])
-        pass
-    for line in range (2,numberpointsdownV + 2,2):
-        lines.addByTwoPoints(pointdownC[line - 1], pointdownC[line])
-        lines.addByTwoPoints(pointdownD[line - 1], pointdownD[line])
-        pass
-    prof = sketch.profiles.item(0)
-    extrudeSide(prof,thickness)
-    extrudeSide(prof,thickness)
-    return
-def CreateType2(boxtype,length,width,fingerwidthL,fingerwidthW,fingercountL,fingercountW, finger_height,thickness):
-
-    product = app.activeProduct
-    design = adsk.fusion.Design.cast(product)
-    if not design:
-        ui.messageBox('It is not supported in current workspace, please change to MODEL workspace and try again.')
-        return
-    currentDesignType = design.designType
-
-    rootComp = design.rootComponent
-    if rootComp is None:
-        ui.messageBox('New component failed to create', 'New Component Failed')
-        return
-
-    sketches = rootComp.sketches
-    #Create a new sketch
-    sketch = sketches.add(rootComp.xYConstructionPlane)
-    # add sketch curves
-    lines = sketch.sketchCurves.sketchLines
-
-
-    #################################################################################################
-    # Draw the type 2 side geometry
-    # points go x,y,z
-    ################################################################################################
-    widthmfh = width - finger_height
-    numberpointsup = (fingercountL *2) + 4
-    numberpointsdown = (fingercountL *2) + 1
-    numberpointsup = int(numberpointsup)
-    numberpointsdown = int(numberpointsdown)
-    pointleftup = finger_height + fingerwidthL
-    pointleftdown = finger_height + fingerwidthL
-    pointup = [0]
-    pointdown = [0]
-    pointupB = [0]
-    pointdownB = [0]
-    pointdownC = [0]
-    pointupC = [0]
-    pointupD = [0]
-    pointdownD = [0]
-    # This just loads the lists with enough entries for the box.
-    for x in range (numberpointsdown+5):
-        pointup.append(x)
-        pointdown.append(x)
-        pointupB.append(x)
-        pointdownB.append(x)
-        pointupC.append(x)
-        pointdownC.append(x)
-        pointupD.append(x)
-        pointdownD.append(x)
-        pass
-    pointup[1] = adsk.core.Point3D.create(pointleftup,width,0)
-    pointdown[1] = adsk.core.Point3D.create(pointleftdown,widthmfh,0)
-    pointupB[1] = adsk.core.Point3D.create(pointleftup,0,0)
-    pointdownB[1] = adsk.core.Point3D.create(pointleftdown,finger_height,0)
-    pointupS = adsk.core.Point3D.create(0,width,0)
-    pointupS2 = adsk.core.Point3D.create(0,0,0)
-    pointupE = adsk.core.Point3D.create(length,width,0)
-    pointupE2 = adsk.core.Point3D.create(length,0,0)
-    for step in range (2,numberpointsup + 1):
-        link = step - 1
-        pointup[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthL),width,0)
-        pointupB[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthL),0,0)
-        pass
-    for step in range (2,numberpointsdown + 1):
-        link = step - 1
-        pointdown[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthL),widthmfh,0)
-        pointdownB[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthL),finger_height,0)
-        pass
-    lines.addByTwoPoints(pointup[1], pointupS)
-    lines.addByTwoPoints(pointupB[1], pointupS2)
-    lines.addByTwoPoints(pointup[numberpointsup -4], pointupE)
-    lines.addByTwoPoints(pointupB[numberpointsup - 4], pointupE2)
-
-    for line in range (2,numberpointsup -2,2):
-        lines.addByTwoPoints(pointup[line], pointup[line + 1])
-        lines.addByTwoPoints(pointup[line - 1],pointdown[line-1])
-        lines.addByTwoPoints(pointup[line],pointdown[line])
-        lines.addByTwoPoints(pointupB[line], pointupB[line + 1])
-        lines.addByTwoPoints(pointupB[line- 1],pointdownB[line - 1])
-        lines.addByTwoPoints(pointupB[line],pointdownB[line])
-        pass
-    for line in range (2,numberpointsdown,2):
-        lines.addByTwoPoints(pointdown[line - 1], pointdown[line])
-        lines.addByTwoPoints(pointdownB[line - 1], pointdownB[line])
-        pass
-    #############################################################################################################
-    # Vertical sides next
-    #############################################################################################################
-    numberpointsupV = (fingercountW *2) + 4
-    numberpointsdownV = (fingercountW *2) + 1
-    numberpointsupV = int(numberpointsupV)
-    numberpointsdownV = int(numberpointsdownV)
-    pointupC[1] = adsk.core.Point3D.create(0,width,0)
-    pointdownC[1] = adsk.core.Point3D.create(pointleftdown,widthmfh,0)
-    pointupD[1] = adsk.core.Point3D.create(pointleftup,0,0)
-    pointdownD[1] = adsk.core.Point3D.create(pointleftdown,finger_height,0)
-    pointupT = adsk.core.Point3D.create(0,0,0)
-    pointupT2 = adsk.core.Point3D.create(0,width,0)
-    pointupF = adsk.core.Point3D.create(length,0,0)
-    pointupF2 = adsk.core.Point3D.create(length,width,0)
-    for step in range (2,numberpointsupV):
-        link = step - 1
-        pointupC[step] = adsk.core.Point3D.create(0,((link*fingerwidthW) + finger_height),0)
-        pointupD[step] = adsk.core.Point3D.create(length,((link*fingerwidthW)+ finger_height),0)
-        pass
-    for step in range (2,numberpointsdownV + 2):
-        link = step - 1
-        pointdownC[step] = adsk.core.Point3D.create(finger_height,((link*fingerwidthW)+finger_height),0)
-        pointdownD[step] = adsk.core.Point3D.create(length - finger_height,(link*fingerwidthW)+finger_height,0)
-        pass
-    lines.addByTwoPoints(pointupC[2], pointupT)
-    lines.addByTwoPoints(pointupC[numberpointsupV -2], pointupT2)
-    lines.addByTwoPoints(pointupD[2], pointupF)
-    lines.addByTwoPoints(pointupD[numberpointsupV -2], pointupF2)
-    for line in range (3,numberpointsupV -2,2):
-        lines.addByTwoPoints(pointupC[line], pointupC[line +1])
-        lines.addByTwoPoints(pointupC[line - 1],pointdownC[line - 1])
-        lines.addByTwoPoints(pointupC[line],pointdownC[line])
-        lines.addByTwoPoints(pointupD[line], pointupD[line+1])
-        lines.addByTwoPoints(pointupD[line -1],pointdownD[line -1])
-        lines.addByTwoPoints(pointupD[line],pointdownD[line])
-        pass
-    for line in range (3,numberpointsdownV + 2,2):
-        lines.addByTwoPoints(pointdownC[line - 1], pointdownC[line])
-        lines.addByTwoPoints(pointdownD[line - 1], pointdownD[line])
-        pass
-    prof = sketch.profiles.item(0)
-    extrudeSide(prof,thickness)
-    if boxtype == "Closed":
-        extrudeSide(prof,thickness)
-
-
-    return
-
-def CreateType3(height,width,fingerwidthH,fingerwidthW,fingercountH,fingercountW, finger_height,thickness):
-    test="OFF"
-    product = app.activeProduct
-    design = adsk.fusion.Design.cast(product)
-    if not design:
-        ui.messageBox('It is not supported in current workspace, please change to MODEL workspace and try again.')
-        return
-    currentDesignType = design.designType
-
-    rootComp = design.rootComponent
-    if rootComp is None:
-        ui.messageBox('New component failed to create', 'New Component Failed')
-        return
-
-    sketches = rootComp.sketches
-    #Create a new sketch
-    sketch = sketches.add(rootComp.xYConstructionPlane)
-    # add sketch curves
-    lines = sketch.sketchCurves.sketchLines
-    #Test draw a box in the sketch
-    if test == "ON":
-        point0 = adsk.core.Point3D.create(0, 0, 0)
-        point1 = adsk.core.Point3D.create(length, 0, 0)
-        point2 = adsk.core.Point3D.create(length, width, 0)
-        point3 = adsk.core.Point3D.create(0, width, 0)
-        lines.addByTwoPoints(point0, point1)
-        lines.addByTwoPoints(point1, point2)
-        lines.addByTwoPoints(point2, point3)
-        lines.addByTwoPoints(point3, point0)
-        prof = sketch.profiles.item(0)
-        extrudeSide(prof,thickness)
-    #################################################################################################
-    # Draw the type 3 side geometry
-    # points go x,y,z
-    ################################################################################################
-    heightmfh = height - finger_height
-    numberpointsup = fingercountW * 2
-    numberpointsdown = (fingercountW * 2) + 2
-    numberpointsup = int(numberpointsup)
-    numberpointsdown = int(numberpointsdown)
-    pointleftup = finger_height + fingerwidthW
-    pointleftdown = finger_height + fingerwidthW
-    pointup = [0]
-    pointdown = [0]
-    pointupB = [0]
-    pointdownB = [0]
-    pointdownC = [0]
-    pointupC = [0]
-    pointupD = [0]
-    pointdownD = [0]
-    # This just loads the lists with enough entries for the box.
-    for x in range (numberpointsdown+5):
-        pointup.append(x)
-        pointdown.append(x)
-        pointupB.append(x)
-        pointdownB.append(x)
-        pointupC.append(x)
-        pointdownC.append(x)
-        pointupD.append(x)
-        pointdownD.append(x)
-        pass
-    pointup[1] = adsk.core.Point3D.create(pointleftup,height,0)
-    pointdown[1] = adsk.core.Point3D.create(pointleftdown,heightmfh,0)
-    pointupB[1] = adsk.core.Point3D.create(pointleftup,0,0)
-    pointdownB[1] = adsk.core.Point3D.create(pointleftdown,finger_height,0)
-    pointbl = adsk.core.Point3D.create(0,finger_height,0)
-    pointtl = adsk.core.Point3D.create(0,heightmfh,0)
-    pointbr = adsk.core.Point3D.create(width,finger_height)
-    pointtr = adsk.core.Point3D.create(width,heightmfh)
-    for step in range (2,numberpointsup + 1):
-        link = step - 1
-        pointup[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthW),height,0)
-        pointupB[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthW),0,0)
-        pass
-    for step in range (2,numberpointsdown + 1):
-        link = step - 1
-        pointdown[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthW),heightmfh,0)
-        pointdownB[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthW),finger_height,0)
-        pass
-    for line in range (2,numberpointsup + 2,2):
-        lines.addByTwoPoints(pointup[line - 1], pointup[line])
-        lines.addByTwoPoints(pointup[line- 1],pointdown[line -1])
-        lines.addByTwoPoints(pointup[line],pointdown[line])
-        lines.addByTwoPoints(pointupB[line - 1], pointupB[line])
-        lines.addByTwoPoints(pointupB[line- 1],pointdownB[line -1])
-        lines.addByTwoPoints(pointupB[line],pointdownB[line])
-        pass
-    for line in range (2,numberpointsdown,2):
-        lines.addByTwoPoints(pointdown[line], pointdown[line + 1])
-        lines.addByTwoPoints(pointdownB[line], pointdownB[line + 1])
-        pass
-    lines.addByTwoPoints(pointbl,pointdownB[1])
-    lines.addByTwoPoints(pointtl,pointdown[1])
-    lines.addByTwoPoints(pointbr,pointdownB[numberpointsdown - 2])
-    lines.addByTwoPoints(pointtr,pointdown[numberpointsdown - 2])
-    ###################################################################################################
-    # Now lets create the vertical sides
-    ###################################################################################################
-    numberpointsupV = fingercountH * 2
-    numberpointsdownV = (fingercountH * 2) + 2
-    numberpointsupV = int(numberpointsupV)
-    numberpointsdownV = int(numberpointsdownV)
-    pointleftupV = finger_height + fingerwidthH
-    pointleftdownV = finger_height + fingerwidthH
-    pointdownC[1] = adsk.core.Point3D.create(finger_height,finger_height + fingerwidthH,0)
-    pointupC[1] = adsk.core.Point3D.create(0,finger_height + fingerwidthH,0)
-    pointdownD[1] = adsk.core.Point3D.create(width - finger_height,finger_height + fingerwidthH,0)
-    pointupD[1] = adsk.core.Point3D.create(width,finger_height + fingerwidthH,0)
-    for step in range (2,numberpointsupV + 2):
-        link = step - 1
-        pointupC[step] = adsk.core.Point3D.create(0, (finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        pointupD[step] = adsk.core.Point3D.create(width,(finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        pass
-    for step in range (2,numberpointsdownV + 1):
-        link = step - 1
-        pointdownC[step] = adsk.core.Point3D.create(finger_height,pointleftdownV + (link*fingerwidthH),0)
-        pointdownD[step] = adsk.core.Point3D.create(width - finger_height,pointleftdownV + (link*fingerwidthH),0)
-        pass
-    for line in range (2,numberpointsupV + 2,2):
-        lines.addByTwoPoints(pointupC[line], pointupC[line + 1])
-        lines.addByTwoPoints(pointupC[line- 1],pointdownC[line - 1])
-        lines.addByTwoPoints(pointupC[line],pointdownC[line])
-        lines.addByTwoPoints(pointupD[line], pointupD[line + 1])
-        lines.addByTwoPoints(pointupD[line- 1],pointdownD[line - 1])
-        lines.addByTwoPoints(pointupD[line],pointdownD[line])
-        pass
-    for line in range (2,numberpointsdownV,2):
-        lines.addByTwoPoints(pointdownC[line - 1], pointdownC[line])
-        lines.addByTwoPoints(pointdownD[line - 1], pointdownD[line])
-        pass
-    lines.addByTwoPoints(pointbl, pointupC[1])
-    lines.addByTwoPoints(pointbr, pointupD[1])
-    prof = sketch.profiles.item(0)
-    extrudeSide(prof,thickness)
-    extrudeSide(prof,thickness)
-    return
-def CreateType4(length,height,fingerwidthL,fingerwidthH,fingercountL,fingercountH, finger_height,thickness):
-
-    product = app.activeProduct
-    design = adsk.fusion.Design.cast(product)
-    if not design:
-        ui.messageBox('It is not supported in current workspace, please change to MODEL workspace and try again.')
-        return
-    currentDesignType = design.designType
-
-    rootComp = design.rootComponent
-    if rootComp is None:
-        ui.messageBox('New component failed to create', 'New Component Failed')
-        return
-
-    sketches = rootComp.sketches
-    #Create a new sketch
-    sketch = sketches.add(rootComp.xYConstructionPlane)
-    # add sketch curves
-    lines = sketch.sketchCurves.sketchLines
-
-    #################################################################################################
-    # Draw the type 1 side geometry
-    # points go x,y,z
-    ################################################################################################
-    heightmfh = height - finger_height
-    numberpointsup = fingercountL * 2
-    numberpointsdown = (fingercountL * 2) + 2
-    numberpointsup = int(numberpointsup)
-    numberpointsdown = int(numberpointsdown)
-    pointleftup = finger_height + fingerwidthL
-    pointleftdown = finger_height
-    pointup = [0]
-    pointdown = [0]
-    pointupB = [0]
-    pointdownB = [0]
-    pointdownC = [0]
-    pointupC = [0]
-    pointupD = [0]
-    pointdownD = [0]
-    # This just loads the lists with enough entries for the box.
-    for x in range (numberpointsdown+5):
-        pointup.append(x)
-        pointdown.append(x)
-        pointupB.append(x)
-        pointdownB.append(x)
-        pointupC.append(x)
-        pointdownC.append(x)
-        pointupD.append(x)
-        pointdownD.append(x)
-        pass
-    pointup[1] = adsk.core.Point3D.create(pointleftup,height,0)
-    pointdown[1] = adsk.core.Point3D.create(pointleftdown,heightmfh,0)
-    pointupB[1] = adsk.core.Point3D.create(pointleftup,0,0)
-    pointdownB[1] = adsk.core.Point3D.create(pointleftdown,finger_height,0)
-    pointTopFlat1 = adsk.core.Point3D.create(finger_height,height,0)
-    pointTopFlat2 = adsk.core.Point3D.create((length-finger_height),height,0)
-    lines.addByTwoPoints(pointTopFlat1, pointTopFlat2)
-    for step in range (2,numberpointsup + 1):
-        link = step - 1
-        #pointup[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthL),height,0)
-        pointupB[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthL),0,0)
-        pass
-    for step in range (2,numberpointsdown + 1):
-        link = step - 1
-        #pointdown[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthL),heightmfh,0)
-        pointdownB[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthL),finger_height,0)
-        pass
-    for line in range (2,numberpointsup + 2,2):
-        #lines.addByTwoPoints(pointup[line - 1], pointup[line])
-        #lines.addByTwoPoints(pointup[line- 1],pointdown[line])
-        #lines.addByTwoPoints(pointup[line],pointdown[line + 1])
-        lines.addByTwoPoints(pointupB[line - 1], pointupB[line])
-        lines.addByTwoPoints(pointupB[line- 1],pointdownB[line])
-        lines.addByTwoPoints(pointupB[line],pointdownB[line + 1])
-        pass
-    for line in range (2,numberpointsdown + 2,2):
-        #lines.addByTwoPoints(pointdown[line - 1], pointdown[line])
-        lines.addByTwoPoints(pointdownB[line - 1], pointdownB[line])
-        pass
-#############################################################################################################
-# Vertical sides next
-#############################################################################################################
-    numberpointsupV = fingercountH * 2
-    numberpointsdownV = (fingercountH * 2) + 2
-    numberpointsupV = int(numberpointsupV)
-    numberpointsdownV = int(numberpointsdownV)
-    pointdownC[1] = pointdownB[1]
-    pointupC[1] = adsk.core.Point3D.create(0,finger_height + fingerwidthH,0)
-    pointdownD[1] = adsk.core.Point3D.create(length - finger_height,finger_height,0)
-    pointupD[1] = adsk.core.Point3D.create(length,finger_height + fingerwidthH,0)
-    for step in range (2,numberpointsupV + 1):
-        link = step - 1
-        pointupC[step] = adsk.core.Point3D.create(0, (finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        #lines.addByTwoPoints(pointupC[step - 1], pointupC[step])
-        pointupD[step] = adsk.core.Point3D.create(length,(finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        pass
-    for step in range (2,numberpointsdownV + 1):
-        link = step - 1
-        pointdownC[step] = adsk.core.Point3D.create(finger_height,pointleftdown + (link*fingerwidthH),0)
-        pointdownD[step] = adsk.core.Point3D.create(length - finger_height,pointleftdown + (link*fingerwidthH),0)
-        pass
-    for line in range (2,numberpointsupV + 2,2):
-        lines.addByTwoPoints(pointupC[line - 1], pointupC[line])
-        lines.addByTwoPoints(pointupC[line- 1],pointdownC[line])
-        lines.addByTwoPoints(pointupC[line],pointdownC[line + 1])
-        lines.addByTwoPoints(pointupD[line - 1], pointupD[line])
-        lines.addByTwoPoints(pointupD[line- 1],pointdownD[line])
-        lines.addByTwoPoints(pointupD[line],pointdownD[line + 1])
-        pass
-    for line in range (2,numberpointsdownV + 2,2):
-        lines.addByTwoPoints(pointdownC[line - 1], pointdownC[line])
-        lines.addByTwoPoints(pointdownD[line - 1], pointdownD[line])
-        pass
-    prof = sketch.profiles.item(0)
-    extrudeSide(prof,thickness)
-    extrudeSide(prof,thickness)
-    return
-def CreateType5(height,width,fingerwidthH,fingerwidthW,fingercountH,fingercountW, finger_height,thickness):
-    test="OFF"
-    product = app.activeProduct
-    design = adsk.fusion.Design.cast(product)
-    if not design:
-        ui.messageBox('It is not supported in current workspace, please change to MODEL workspace and try again.')
-        return
-    currentDesignType = design.designType
-
-    rootComp = design.rootComponent
-    if rootComp is None:
-        ui.messageBox('New component failed to create', 'New Component Failed')
+def createBox(rootComp, panels, thickness):
+    # Lay all panels out side by side on one sketch and extrude them with one
+    # feature. The panels the box needs twice are then patterned along y.
+    gap = thickness * 4
+    offsets = finger_geometry.rowLayout(panels, gap)
+    return sketch_builder.buildPanels(rootComp, panels, offsets, gap, thickness, adsk.core, adsk.fusion)
+
+def createPatternBox(rootComp, boxtype, values):
+    # Cut one notch per edge and pattern it, so the number of sketches and
+    # features doesn't grow with the finger counts.
+    box = parametric_box.PatternBox(rootComp, adsk.core, adsk.fusion)
+    box.createParameters(boxtype, values)
+    box.build(boxtype)
+    return box
+
+def createAssembly(rootComp, boxes):
+    # Model each distinct panel of the (name, panels, thickness) boxes once
+    # and place all copies as occurrences of it.
+    plan = panel_assembly.AssemblyPlan()
+    for name, panels, thickness in boxes:
+        plan.add(name, panels, thickness)
+    def drawPanel(component, panel, thickness):
+        sketch_builder.buildPanel(component, panel.outline, thickness, adsk.core, adsk.fusion)
+    panel_assembly.build(rootComp, plan, adsk.core, drawPanel)
+    return plan
+
+def createParametricBox(des, boxtype, values):
+    # Build the box into a new component from features driven by a fresh
+    # set of user parameters (fj1_length, fj1_width, ...).
+    prefix = parametric_box.freePrefix(des)
+    occurrence = des.rootComponent.occurrences.addNewComponent(adsk.core.Matrix3D.create())
+    occurrence.component.name = 'Finger Joint Box ' + prefix.strip('_')
+    box = parametric_box.ParametricBox(des, occurrence.component, adsk.core, adsk.fusion, prefix)
+    box.createParameters(boxtype, values)
+    box.build(boxtype)
+    return box
+
+def batchReportFile(batchFile):
+    return os.path.splitext(batchFile)[0] + '.report.txt'
+
+def runBatch(batchFile):
+    # Build every box of the batch file into its own component, placed in a
+    # row along x, and write the report next to the file. In assembly mode
+    # the boxes are only planned here and built together at the end.
+    des = adsk.fusion.Design.cast(_app.activeProduct)
+    rootComp = des.rootComponent
+    report = box_batch.BatchReport()
+    cache = box_batch.PanelCache()
+    assembly = box_batch.assemblyMode(batchFile)
+    built = []
+    x = 0.0
+    for k, row in enumerate(box_batch.readSpecs(batchFile)):
+        name = row.get('name') or 'Box {}'.format(k + 1)
+        start = time.perf_counter()
+        try:
+            spec = box_batch.boxSpec(row)
+            panels, cached = cache.panels(spec)
+            if not assembly:
+                transform = adsk.core.Matrix3D.create()
+                transform.translation = adsk.core.Vector3D.create(x, 0, 0)
+                occurrence = rootComp.occurrences.addNewComponent(transform)
+                occurrence.component.name = name
+                createBox(occurrence.component, panels, spec['thickness'])
+                gap = spec['thickness'] * 4
+                x += finger_geometry.rowLayout(panels, gap)[-1] + panels[-1].width + gap * 4
+            report.add(name, time.perf_counter() - start, cached=cached)
+            built.append((name, panels, spec['thickness']))
+        except Exception as error:
+            report.add(name, time.perf_counter() - start, error=str(error))
+
+    if assembly and built:
+        start = time.perf_counter()
+        try:
+            plan = createAssembly(rootComp, built)
+            report.note('Assembly: {}, built in {:.1f} s'.format(plan.summary(), time.perf_counter() - start))
+        except Exception as error:
+            report.note('Assembly FAILED: ' + str(error))
+    box_batch.exportFlatPattern(batchFile, [(name, panels) for name, panels, thickness in built], report)
+    report.write(batchReportFile(batchFile))
+    return report
+
+def exportFlatPattern(boxes, fileFormat, sheetWidth, sheetHeight, kerf):
+    # Ask for a folder and write the nested panels of the boxes into it.
+    folderDialog = _ui.createFolderDialog()
+    folderDialog.title = 'Flat pattern folder'
+    if folderDialog.showDialog() != adsk.core.DialogResults.DialogOK:
         return
-
-    sketches = rootComp.sketches
-    #Create a new sketch
-    sketch = sketches.add(rootComp.xYConstructionPlane)
-    # add sketch curves
-    lines = sketch.sketchCurves.sketchLines
-    #Test draw a box in the sketch
-    if test == "ON":
-        point0 = adsk.core.Point3D.create(0, 0, 0)
-        point1 = adsk.core.Point3D.create(length, 0, 0)
-        point2 = adsk.core.Point3D.create(length, width, 0)
-        point3 = adsk.core.Point3D.create(0, width, 0)
-        lines.addByTwoPoints(point0, point1)
-        lines.addByTwoPoints(point1, point2)
-        lines.addByTwoPoints(point2, point3)
-        lines.addByTwoPoints(point3, point0)
-        prof = sketch.profiles.item(0)
-        extrudeSide(prof,thickness)
-    #################################################################################################
-    # Draw the type 3 side geometry
-    # points go x,y,z
-    ################################################################################################
-    heightmfh = height - finger_height
-    numberpointsup = fingercountW * 2
-    numberpointsdown = (fingercountW * 2) + 2
-    numberpointsup = int(numberpointsup)
-    numberpointsdown = int(numberpointsdown)
-    pointleftup = finger_height + fingerwidthW
-    pointleftdown = finger_height + fingerwidthW
-    pointup = [0]
-    pointdown = [0]
-    pointupB = [0]
-    pointdownB = [0]
-    pointdownC = [0]
-    pointupC = [0]
-    pointupD = [0]
-    pointdownD = [0]
-    # This just loads the lists with enough entries for the box.
-    for x in range (numberpointsdown+5):
-        pointup.append(x)
-        pointdown.append(x)
-        pointupB.append(x)
-        pointdownB.append(x)
-        pointupC.append(x)
-        pointdownC.append(x)
-        pointupD.append(x)
-        pointdownD.append(x)
-        pass
-    pointup[1] = adsk.core.Point3D.create(pointleftup,height,0)
-    pointdown[1] = adsk.core.Point3D.create(pointleftdown,heightmfh,0)
-    pointupB[1] = adsk.core.Point3D.create(pointleftup,0,0)
-    pointdownB[1] = adsk.core.Point3D.create(pointleftdown,finger_height,0)
-    pointbl = adsk.core.Point3D.create(0,finger_height,0)
-    pointtl = adsk.core.Point3D.create(0,heightmfh,0)
-    pointbr = adsk.core.Point3D.create(width,finger_height)
-    pointtr = adsk.core.Point3D.create(width,heightmfh)
-    pointTopFlat3 = adsk.core.Point3D.create(0,height,0)
-    pointTopFlat4 = adsk.core.Point3D.create(width,height,0)
-    lines.addByTwoPoints(pointTopFlat3, pointTopFlat4)
-    for step in range (2,numberpointsup + 1):
-        link = step - 1
-        #pointup[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthW),height,0)
-        pointupB[step] = adsk.core.Point3D.create(pointleftup + (link*fingerwidthW),0,0)
-        pass
-    for step in range (2,numberpointsdown + 1):
-        link = step - 1
-        #pointdown[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthW),heightmfh,0)
-        pointdownB[step] = adsk.core.Point3D.create(pointleftdown + (link*fingerwidthW),finger_height,0)
-        pass
-    for line in range (2,numberpointsup + 2,2):
-        #lines.addByTwoPoints(pointup[line - 1], pointup[line])
-        #lines.addByTwoPoints(pointup[line- 1],pointdown[line -1])
-        #lines.addByTwoPoints(pointup[line],pointdown[line])
-        lines.addByTwoPoints(pointupB[line - 1], pointupB[line])
-        lines.addByTwoPoints(pointupB[line- 1],pointdownB[line -1])
-        lines.addByTwoPoints(pointupB[line],pointdownB[line])
-        pass
-    for line in range (2,numberpointsdown,2):
-        #lines.addByTwoPoints(pointdown[line], pointdown[line + 1])
-        lines.addByTwoPoints(pointdownB[line], pointdownB[line + 1])
-        pass
-    lines.addByTwoPoints(pointbl,pointdownB[1])
-    #lines.addByTwoPoints(pointtl,pointdown[1])
-    lines.addByTwoPoints(pointbr,pointdownB[numberpointsdown - 2])
-    #lines.addByTwoPoints(pointtr,pointdown[numberpointsdown - 2])
-    ###################################################################################################
-    # Now lets create the vertical sides
-    ###################################################################################################
-    numberpointsupV = fingercountH * 2
-    numberpointsdownV = (fingercountH * 2) + 2
-    numberpointsupV = int(numberpointsupV)
-    numberpointsdownV = int(numberpointsdownV)
-    pointleftupV = finger_height + fingerwidthH
-    pointleftdownV = finger_height + fingerwidthH
-    pointdownC[1] = adsk.core.Point3D.create(finger_height,finger_height + fingerwidthH,0)
-    pointupC[1] = adsk.core.Point3D.create(0,finger_height + fingerwidthH,0)
-    pointdownD[1] = adsk.core.Point3D.create(width - finger_height,finger_height + fingerwidthH,0)
-    pointupD[1] = adsk.core.Point3D.create(width,finger_height + fingerwidthH,0)
-    for step in range (2,numberpointsupV + 2):
-        link = step - 1
-        pointupC[step] = adsk.core.Point3D.create(0, (finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        pointupD[step] = adsk.core.Point3D.create(width,(finger_height+fingerwidthH )+ (link*fingerwidthH),0)
-        pass
-    for step in range (2,numberpointsdownV + 1):
-        link = step - 1
-        pointdownC[step] = adsk.core.Point3D.create(finger_height,pointleftdownV + (link*fingerwidthH),0)
-        pointdownD[step] = adsk.core.Point3D.create(width - finger_height,pointleftdownV + (link*fingerwidthH),0)
-        pass
-    for line in range (2,numberpointsupV + 2,2):
-        lines.addByTwoPoints(pointupC[line], pointupC[line + 1])
-        lines.addByTwoPoints(pointupC[line- 1],pointdownC[line - 1])
-        lines.addByTwoPoints(pointupC[line],pointdownC[line])
-        lines.addByTwoPoints(pointupD[line], pointupD[line + 1])
-        lines.addByTwoPoints(pointupD[line- 1],pointdownD[line - 1])
-        lines.addByTwoPoints(pointupD[line],pointdownD[line])
-        pass
-    for line in range (2,numberpointsdownV,2):
-        lines.addByTwoPoints(pointdownC[line - 1], pointdownC[line])
-        lines.addByTwoPoints(pointdownD[line - 1], pointdownD[line])
-        pass
-    lines.addByTwoPoints(pointbl, pointupC[1])
-    lines.addByTwoPoints(pointbr, pointupD[1])
-    prof = sketch.profiles.item(0)
-    extrudeSide(prof,thickness)
-    extrudeSide(prof,thickness)
-    return
-def extrudeSide(prof,thickness):
-    # We will extrude the shapes once we complete the sketches
-    product = app.activeProduct
-    design = adsk.fusion.Design.cast(product)
-    if not design:
-        ui.messageBox('It is not supported in current workspace, please change to MODEL workspace and try again.')
+    files, sheets = flat_pattern.export(boxes, folderDialog.folder, sheetWidth, sheetHeight, kerf, kerf + 0.2, fileFormat)
+    _ui.messageBox('{} sheets written, {:.0%} of the material used.'.format(len(files), flat_pattern.utilization(sheets)))
+
+def updatePreview():
+    # Draw the panel outlines laid out as createBox lays them out, redrawing
+    # only the panels whose outline changed.
+    des = adsk.fusion.Design.cast(_app.activeProduct)
+    if not des:
         return
-    currentDesignType = design.designType
-    rootComp = design.rootComponent
-    if rootComp is None:
-        ui.messageBox('New component failed to create', 'New Component Failed')
+    thickness = _thickness.value
+    spans = finger_geometry.edgeSpans(_boxtype.selectedItem.name, _length.value, _width.value, _height.value, thickness)
+    counts = (int(_fingersL.value), int(_fingersW.value), int(_fingersH.value))
+    if thickness <= 0 or min(spans) <= 0 or min(counts) < 1:
+        clearPreview()
         return
-
-    profile = prof
-    extrudes = rootComp.features.extrudeFeatures
-    ext_input = extrudes.createInput(profile, adsk.fusion.FeatureOperations.NewBodyFeatureOperation)
-    distance = adsk.core.ValueInput.createByReal(thickness)
-    ext_input.setDistanceExtent(False, distance)
-    ext_input.isSolid = True
-    extrudes.add(ext_input)
-    return
\ No newline at end of file
+    panels = finger_geometry.boxPanels(_boxtype.selectedItem.name, _length.value, _width.value, _height.value, thickness,
+                                       counts[0], counts[1], counts[2], _overhang.value)
+    offsets = finger_geometry.rowLayout(panels, thickness * 4)
+    redraw, move, remove = _previewState.update(panels, offsets)
+    groups = des.rootComponent.customGraphicsGroups
+    for name in remove + redraw:
+        group = _previewGroups.pop(name, None)
+        if group and group.isValid:
+            group.deleteMe()
+    byName = {panel.name: (panel, offset) for panel, offset in zip(panels, offsets)}
+    for name in redraw:
+        panel, offset = byName[name]
+        group = groups.add()
+        coordinates = adsk.fusion.CustomGraphicsCoordinates.create(live_preview.lineStrip(panel.outline))
+        lines = group.addLines(coordinates, [], True)
+        lines.color = adsk.fusion.CustomGraphicsSolidColorEffect.create(adsk.core.Color.create(255, 0, 0, 255))
+        _previewGroups[name] = group
+    for name in redraw + move:
+        transform = adsk.core.Matrix3D.create()
+        transform.translation = adsk.core.Vector3D.create(byName[name][1], 0, 0)
+        _previewGroups[name].transform = transform
+    if redraw or move or remove:
+        _app.activeViewport.refresh()
+
+def clearPreview():
+    for group in _previewGroups.values():
+        if group.isValid:
+            group.deleteMe()
+    _previewGroups.clear()
+    _previewState.clear()
@@ -0,0 +1,100 @@
+#Description-Finger count optimizer for finger joint boxes
+
+# Searches the finger counts of the length, width and height edges for
+# fingers close to a target width (a ratio of the material thickness) and
+# alike on all edges, never narrower than the cutter can cut: an inside
+# notch is as wide as a finger, so a router bit's diameter is the minimum.
+# Each edge's best count follows from its span; the search scores every
+# combination within a small window around those. That takes about a
+# millisecond, and in the benchmark below finds the same counts as trying
+# all of them.
+
+import itertools
+
+class Fit:
+    '''Finger counts and widths of the length, width and height edges.'''
+    def __init__(self, counts, widths, score):
+        self.counts = counts
+        self.widths = widths
+        self.score = score
+
+    def describe(self, thickness):
+        return 'L {}, W {}, H {} (fingers {:.2f} to {:.2f} x thickness)'.format(
+            self.counts[0], self.counts[1], self.counts[2], min(self.widths) / thickness, max(self.widths) / thickness)
+
+
+def fingerWidth(span, fingers):
+    return span / (2 * fingers + 1)
+
+def maxFingers(span, minWidth, limit=200):
+    '''Most fingers an edge can have without getting narrower than minWidth.'''
+    if minWidth <= 0:
+        return limit
+    return min(limit, int((span / minWidth - 1) // 2))
+
+def score(widths, target, uniformity):
+    # Squared relative error from the target width, plus how much the
+    # widths differ between edges.
+    mean = sum(widths) / len(widths)
+    error = sum(((width - target) / target) ** 2 for width in widths)
+    spread = sum((width - mean) ** 2 for width in widths) / len(widths) / target ** 2
+    return error + uniformity * spread
+
+def _candidates(span, target, minWidth, window, limit):
+    most = maxFingers(span, minWidth, limit)
+    if most < 1:
+        return []
+    best = int(round((span / target - 1) / 2))
+    return list(range(max(1, min(best, most) - window), min(most, max(best, 1) + window) + 1))
+
+def bestCounts(spans, thickness, minWidth=0.0, ratio=2.0, uniformity=1.0, window=3, limit=200):
+    '''Best Fit for the edge spans, fingers about ratio * thickness wide and
+    at least minWidth. window=None tries every count up to limit. None if
+    an edge is too short for a single finger.'''
+    target = ratio * thickness
+    if window is None:
+        ranges = [list(range(1, maxFingers(span, minWidth, limit) + 1)) for span in spans]
+    else:
+        ranges = [_candidates(span, target, minWidth, window, limit) for span in spans]
+    if not all(ranges):
+        return None
+    widthTables = [{count: fingerWidth(span, count) for count in counts} for span, counts in zip(spans, ranges)]
+    best = None
+    for counts in itertools.product(*ranges):
+        widths = [table[count] for table, count in zip(widthTables, counts)]
+        value = score(widths, target, uniformity)
+        if best is None or value < best.score:
+            best = Fit(counts, widths, value)
+    return best
+
+def problems(spans, counts, thickness, minWidth=0.0, ratio=2.0, tolerance=0.5):
+    '''(errors, warnings) about the given counts: fingers that can't be cut
+    are errors, fingers far from the target width warnings.'''
+    errors = []
+    warnings = []
+    for name, span, count in zip(('Length', 'Width', 'Height'), spans, counts):
+        width = fingerWidth(span, count) if count >= 1 else 0
+        if count < 1 or width <= 0:
+            errors.append('{}: needs at least one finger'.format(name))
+        elif width < minWidth:
+            errors.append('{}: fingers {:.2f} narrower than the cutter'.format(name, width))
+        elif abs(width / (ratio * thickness) - 1) > tolerance:
+            warnings.append('{}: fingers {:.1f} x thickness'.format(name, width / thickness))
+    return errors, warnings
+
+
+if __name__ == '__main__':
+    import random, time
+    random.seed(1)
+    boxes = [(random.uniform(5, 60), random.uniform(5, 60), random.uniform(3, 40), random.choice((0.3, 0.5, 0.6)), random.choice((0, 0.32, 0.64)))
+             for _ in range(200)]
+    for mode, window in (('window', 3), ('exhaustive', None)):
+        start = time.perf_counter()
+        fits = [bestCounts((l - 2 * t, w - 2 * t, h - 2 * t), t, cutter, window=window, limit=30) for l, w, h, t, cutter in boxes]
+        seconds = (time.perf_counter() - start) / len(boxes)
+        print('{}: {:.2f} ms per box'.format(mode, seconds * 1000))
+        if window is None:
+            for fit, windowed in zip(fits, previous):
+                assert (fit is None) == (windowed is None)
+                assert fit is None or abs(fit.score - windowed.score) < 1e-12, (fit.counts, windowed.counts)
+        previous = fits
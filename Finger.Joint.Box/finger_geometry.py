@@ -0,0 +1,230 @@
+#Description-Finger joint box panel outlines, independent of Fusion
+
+# Computes the closed outline of every panel of a finger joint box as a
+# flat array of x, y coordinates, so the Fusion side only has to push the
+# points into a sketch and extrude them. Each fingered edge is split into
+# 2 * fingers + 1 segments between the corners; 'tabs' edges reach the
+# outside of the panel on the odd segments (the fingers) and 'notches'
+# edges on the even ones, so a tabs edge mates with a notches edge.
+
+import array
+
+TABS = 1
+NOTCHES = 0
+
+class Panel:
+    '''Outline of one panel type, extruded copies times.'''
+    def __init__(self, name, width, height, outline, copies):
+        self.name = name
+        self.width = width
+        self.height = height
+        # x0, y0, x1, y1, ... of the closed outline, counterclockwise.
+        self.outline = outline
+        self.copies = copies
+
+    def __len__(self):
+        return len(self.outline) // 2
+
+    def points(self):
+        '''(x, y) tuples of the outline vertices.'''
+        outline = self.outline
+        return [(outline[k], outline[k + 1]) for k in range(0, len(outline), 2)]
+
+    def area(self):
+        return outlineArea(self.outline)
+
+
+def fingerEdge(start, fingerWidth, fingers, kind):
+    '''(start, end, outside) of the 2 * fingers + 1 segments of an edge.'''
+    return [(start + k * fingerWidth, start + (k + 1) * fingerWidth, k % 2 == kind)
+            for k in range(2 * fingers + 1)]
+
+def panelOutline(width, height, fingerHeight, bottom, right, top, left):
+    '''Closed outline of a width x height panel from its edges, walked
+    counterclockwise from the bottom left corner. Each edge is a list of
+    fingerEdge segments, measured from the bottom left along x and y; an
+    inside segment is fingerHeight in from the panel's border. A top edge
+    of None is flat along the full height (open box). Corners are cut
+    unless both adjacent edges reach the outside there.'''
+    def depth(segment):
+        return 0.0 if segment[2] else fingerHeight
+
+    def corner(x, y, first, second):
+        if first[2] and second[2]:
+            return (x, y)
+        return (fingerHeight if x == 0 else width - fingerHeight,
+                fingerHeight if y == 0 else height - fingerHeight)
+
+    points = []
+    points.append(corner(0, 0, left[0], bottom[0]))
+    for a, b, outside in bottom:
+        d = depth((a, b, outside))
+        points += [(a, d), (b, d)]
+    points.append(corner(width, 0, bottom[-1], right[0]))
+    for a, b, outside in right:
+        d = depth((a, b, outside))
+        points += [(width - d, a), (width - d, b)]
+    if top is not None:
+        points.append(corner(width, height, right[-1], top[-1]))
+        for a, b, outside in reversed(top):
+            d = depth((a, b, outside))
+            points += [(b, height - d), (a, height - d)]
+        points.append(corner(0, height, top[0], left[-1]))
+    for a, b, outside in reversed(left):
+        d = depth((a, b, outside))
+        points += [(d, b), (d, a)]
+    return _simplify(points)
+
+def _simplify(points, tolerance=1e-9):
+    # Drop repeated vertices and vertices in the middle of a straight run.
+    clean = []
+    for point in points:
+        if not clean or abs(point[0] - clean[-1][0]) > tolerance or abs(point[1] - clean[-1][1]) > tolerance:
+            clean.append(point)
+    if len(clean) > 1 and abs(clean[0][0] - clean[-1][0]) <= tolerance and abs(clean[0][1] - clean[-1][1]) <= tolerance:
+        clean.pop()
+    changed = True
+    while changed and len(clean) > 3:
+        changed = False
+        for k in range(len(clean)):
+            p, q, r = clean[k - 1], clean[k], clean[(k + 1) % len(clean)]
+            if abs((q[0] - p[0]) * (r[1] - q[1]) - (q[1] - p[1]) * (r[0] - q[0])) <= tolerance:
+                del clean[k]
+                changed = True
+                break
+    outline = array.array('d')
+    for x, y in clean:
+        outline.append(x)
+        outline.append(y)
+    return outline
+
+def translate(outline, dx, dy):
+    '''Copy of the flat outline moved by dx, dy.'''
+    moved = array.array('d', outline)
+    for k in range(0, len(moved), 2):
+        moved[k] += dx
+        moved[k + 1] += dy
+    return moved
+
+def rowLayout(panels, gap):
+    '''x offsets that place the panels side by side, gap apart.'''
+    offsets = []
+    x = 0.0
+    for panel in panels:
+        offsets.append(x)
+        x += panel.width + gap
+    return offsets
+
+def outlineArea(outline):
+    '''Signed area of a flat outline, positive counterclockwise.'''
+    n = len(outline) // 2
+    area = 0.0
+    for k in range(n):
+        j = (k + 1) % n
+        area += outline[2 * k] * outline[2 * j + 1] - outline[2 * j] * outline[2 * k + 1]
+    return area / 2.0
+
+def isSimple(outline):
+    '''Whether the closed axis aligned outline never crosses or touches itself.'''
+    n = len(outline) // 2
+    edges = [(outline[2 * k], outline[2 * k + 1], outline[2 * ((k + 1) % n)], outline[2 * ((k + 1) % n) + 1])
+             for k in range(n)]
+    for k in range(n):
+        for j in range(k + 2, n):
+            if k == 0 and j == n - 1:
+                continue
+            a, b = edges[k], edges[j]
+            if (min(a[0], a[2]) <= max(b[0], b[2]) and min(b[0], b[2]) <= max(a[0], a[2]) and
+                    min(a[1], a[3]) <= max(b[1], b[3]) and min(b[1], b[3]) <= max(a[1], a[3])):
+                return False
+    return True
+
+
+def edgeSpans(boxtype, length, width, height, thickness):
+    '''Fingered lengths of the length, width and height edges: all but the
+    corners, and an open box has no top corner.'''
+    if boxtype == 'Closed':
+        return (length - 2 * thickness, width - 2 * thickness, height - 2 * thickness)
+    return (length - 2 * thickness, width - 2 * thickness, height - thickness)
+
+def boxPanels(boxtype, length, width, height, thickness, fingersL, fingersW, fingersH, overhang):
+    '''Panel outlines of a 'Closed' or 'Open' box, in the order they are
+    built: the length x height sides, the length x width bottom (and top),
+    then the width x height ends.'''
+    fingersL, fingersW, fingersH = int(fingersL), int(fingersW), int(fingersH)
+    spanL, spanW, spanH = edgeSpans(boxtype, length, width, height, thickness)
+    fingerwidthL = spanL / (fingersL * 2 + 1)
+    fingerwidthW = spanW / (fingersW * 2 + 1)
+    fingerwidthH = spanH / (fingersH * 2 + 1)
+    # The fingers stick out by the overhang, which grows the box with them.
+    if overhang > 0:
+        fingerHeight = thickness + overhang
+        height += 2 * overhang
+        width += 2 * overhang
+        length += 2 * overhang
+    else:
+        fingerHeight = thickness
+    if boxtype != 'Closed':
+        height -= overhang
+
+    def edge(fingerWidth, fingers, kind):
+        return fingerEdge(fingerHeight, fingerWidth, fingers, kind)
+
+    bottom = Panel('Bottom', length, width, panelOutline(
+        length, width, fingerHeight,
+        edge(fingerwidthL, fingersL, NOTCHES), edge(fingerwidthW, fingersW, NOTCHES),
+        edge(fingerwidthL, fingersL, NOTCHES), edge(fingerwidthW, fingersW, NOTCHES)),
+        2 if boxtype == 'Closed' else 1)
+    if boxtype == 'Closed':
+        side = Panel('Side', length, height, panelOutline(
+            length, height, fingerHeight,
+            edge(fingerwidthL, fingersL, TABS), edge(fingerwidthH, fingersH, TABS),
+            edge(fingerwidthL, fingersL, TABS), edge(fingerwidthH, fingersH, TABS)), 2)
+        end = Panel('End', width, height, panelOutline(
+            width, height, fingerHeight,
+            edge(fingerwidthW, fingersW, TABS), edge(fingerwidthH, fingersH, NOTCHES),
+            edge(fingerwidthW, fingersW, TABS), edge(fingerwidthH, fingersH, NOTCHES)), 2)
+    else:
+        # No top panel: the sides and ends are flat along the top and their
+        # vertical edges run up to it.
+        side = Panel('Side', length, height, panelOutline(
+            length, height, fingerHeight,
+            edge(fingerwidthL, fingersL, TABS), edge(fingerwidthH, fingersH, TABS),
+            None, edge(fingerwidthH, fingersH, TABS)), 2)
+        end = Panel('End', width, height, panelOutline(
+            width, height, fingerHeight,
+            edge(fingerwidthW, fingersW, TABS), edge(fingerwidthH, fingersH, NOTCHES),
+            None, edge(fingerwidthH, fingersH, NOTCHES)), 2)
+    return [side, bottom, end]
+
+
+def check():
+    '''Every outline is closed, simple and counterclockwise, and without
+    overhang the panels fill exactly the walls of the box.'''
+    for boxtype in ('Closed', 'Open'):
+        for fingers in ((1, 1, 1), (6, 4, 4), (3, 7, 2)):
+            length, width, height, thickness = 12.0, 8.0, 6.0, 0.5
+            panels = boxPanels(boxtype, length, width, height, thickness, *fingers, 0)
+            for panel in panels:
+                assert isSimple(panel.outline), (boxtype, fingers, panel.name)
+                assert panel.area() > 0, (boxtype, fingers, panel.name)
+            volume = sum(panel.area() * panel.copies * thickness for panel in panels)
+            if boxtype == 'Closed':
+                inside = (length - 2 * thickness) * (width - 2 * thickness) * (height - 2 * thickness)
+            else:
+                inside = (length - 2 * thickness) * (width - 2 * thickness) * (height - thickness)
+            assert abs(volume - (length * width * height - inside)) < 1e-9, (boxtype, fingers, volume)
+            overhung = boxPanels(boxtype, length, width, height, thickness, *fingers, 0.05)
+            assert all(isSimple(panel.outline) for panel in overhung), (boxtype, fingers)
+            # Laid out side by side, the panels don't overlap.
+            offsets = rowLayout(overhung, thickness)
+            for k in range(1, len(overhung)):
+                moved = translate(overhung[k].outline, offsets[k], 0)
+                assert min(moved[0::2]) > max(translate(overhung[k - 1].outline, offsets[k - 1], 0)[0::2])
+    return True
+
+
+if __name__ == '__main__':
+    check()
+    for panel in boxPanels('Closed', 12, 8, 6, 0.5, 6, 4, 4, 0.05):
+        print('{}: {} x {}, {} vertices, {} copies'.format(panel.name, panel.width, panel.height, len(panel), panel.copies))
@@ -0,0 +1,189 @@
+#Description-Flat pattern export of finger joint panels for laser cutting
+
+# Writes the computed panel outlines straight to SVG or DXF, one file per
+# stock sheet, without going through the model. The cut path is offset out
+# by half the kerf so the panels come out at their nominal size, and the
+# panels of any number of boxes are nested on the sheets by shelf packing:
+# tallest first, each on the first shelf with room left, each shelf on the
+# first sheet with room left. Coordinates are in cm like the rest of the
+# script; the files are written in mm.
+
+import array, os, time
+
+class Piece:
+    '''One panel to cut, with its kerf offset outline moved to the origin.'''
+    def __init__(self, name, outline, area):
+        self.name = name
+        self.outline = outline
+        self.area = area
+        self.width = max(outline[0::2])
+        self.height = max(outline[1::2])
+
+class Sheet:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        # Placed (piece, outline) pairs, outlines in sheet coordinates.
+        self.placed = []
+        # [y, height, used width] of each shelf.
+        self.shelves = []
+
+    @property
+    def freeHeight(self):
+        return self.height - sum(shelf[1] for shelf in self.shelves)
+
+
+def kerfOutline(outline, kerf):
+    '''The axis aligned counterclockwise outline offset out by kerf / 2,
+    moved so its bounding box starts at the origin.'''
+    n = len(outline) // 2
+    d = kerf / 2.0
+    moved = array.array('d')
+    for k in range(n):
+        x, y = outline[2 * k], outline[2 * k + 1]
+        px, py = outline[2 * (k - 1)], outline[2 * (k - 1) + 1]
+        nx, ny = outline[2 * ((k + 1) % n)], outline[2 * ((k + 1) % n) + 1]
+        # The outward normal of a counterclockwise edge (dx, dy) is (dy, -dx);
+        # at a right angle corner the vertex moves along both normals.
+        moved.append(x + d * (_sign(y - py) + _sign(ny - y)))
+        moved.append(y + d * (_sign(px - x) + _sign(x - nx)))
+    minX, minY = min(moved[0::2]), min(moved[1::2])
+    for k in range(n):
+        moved[2 * k] -= minX
+        moved[2 * k + 1] -= minY
+    return moved
+
+def _sign(value):
+    return (value > 1e-12) - (value < -1e-12)
+
+def rotated(outline, height):
+    '''The outline turned a quarter counterclockwise, kept at the origin.'''
+    turned = array.array('d', outline)
+    for k in range(0, len(turned), 2):
+        turned[k], turned[k + 1] = height - outline[k + 1], outline[k]
+    return turned
+
+def pieces(boxes, kerf):
+    '''Pieces of every copy of every panel of (box name, panels) pairs.'''
+    result = []
+    for boxName, panels in boxes:
+        for panel in panels:
+            outline = kerfOutline(panel.outline, kerf)
+            area = panel.area()
+            for copy in range(panel.copies):
+                name = '{} {}'.format(boxName, panel.name) + (' {}'.format(copy + 1) if panel.copies > 1 else '')
+                result.append(Piece(name, outline, area))
+    return result
+
+def nest(pieces, sheetWidth, sheetHeight, spacing):
+    '''Place the pieces on as few sheetWidth x sheetHeight sheets as shelf
+    packing allows, spacing apart. Raises ValueError for a piece that fits
+    no sheet either way round.'''
+    oriented = []
+    for piece in pieces:
+        outline, width, height = piece.outline, piece.width, piece.height
+        # Lie the piece on its long side when that fits; it keeps shelves low.
+        if (height > width and height <= sheetWidth and width <= sheetHeight) or \
+           (width > sheetWidth or height > sheetHeight):
+            outline, width, height = rotated(outline, height), height, width
+        if width > sheetWidth or height > sheetHeight:
+            raise ValueError('{} ({:.1f} x {:.1f} cm) does not fit on the sheet'.format(piece.name, width, height))
+        oriented.append((piece, outline, width, height))
+    oriented.sort(key=lambda entry: entry[3], reverse=True)
+
+    sheets = []
+    for piece, outline, width, height in oriented:
+        target = None
+        for sheet in sheets:
+            for shelf in sheet.shelves:
+                if shelf[1] >= height and shelf[2] + width <= sheet.width:
+                    target = (sheet, shelf)
+                    break
+            if target:
+                break
+        if not target:
+            sheet = next((sheet for sheet in sheets if sheet.freeHeight >= height), None)
+            if not sheet:
+                sheet = Sheet(sheetWidth, sheetHeight)
+                sheets.append(sheet)
+            shelf = [sheet.height - sheet.freeHeight, min(height + spacing, sheet.freeHeight), 0.0]
+            sheet.shelves.append(shelf)
+            target = (sheet, shelf)
+        sheet, shelf = target
+        placed = array.array('d', outline)
+        for k in range(0, len(placed), 2):
+            placed[k] += shelf[2]
+            placed[k + 1] += shelf[0]
+        shelf[2] += width + spacing
+        sheet.placed.append((piece, placed))
+    return sheets
+
+def utilization(sheets):
+    '''Panel area over the area of the sheets used.'''
+    used = sum(sheet.width * sheet.height for sheet in sheets)
+    return sum(piece.area for sheet in sheets for piece, _ in sheet.placed) / used if used else 0.0
+
+
+def writeSvg(file, sheet):
+    # SVG's y axis points down; flip so the sheet looks like the sketch.
+    mm = 10.0
+    width, height = sheet.width * mm, sheet.height * mm
+    with open(file, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" width="{0:.3f}mm" height="{1:.3f}mm" viewBox="0 0 {0:.3f} {1:.3f}">\n'.format(width, height))
+        for piece, outline in sheet.placed:
+            points = ' '.join('{:.4f},{:.4f}'.format(outline[k] * mm, height - outline[k + 1] * mm)
+                              for k in range(0, len(outline), 2))
+            f.write('<polygon id="{}" points="{}" fill="none" stroke="red" stroke-width="0.1"/>\n'.format(
+                piece.name.replace(' ', '_'), points))
+        f.write('</svg>\n')
+
+def writeDxf(file, sheet):
+    # Minimal R12 DXF: one closed POLYLINE per piece on the CUT layer, in mm.
+    mm = 10.0
+    lines = ['0', 'SECTION', '2', 'HEADER', '9', '$ACADVER', '1', 'AC1009', '9', '$INSUNITS', '70', '4', '0', 'ENDSEC',
+             '0', 'SECTION', '2', 'ENTITIES']
+    for piece, outline in sheet.placed:
+        lines += ['0', 'POLYLINE', '8', 'CUT', '66', '1', '10', '0.0', '20', '0.0', '30', '0.0', '70', '1']
+        for k in range(0, len(outline), 2):
+            lines += ['0', 'VERTEX', '8', 'CUT', '10', '{:.4f}'.format(outline[k] * mm), '20', '{:.4f}'.format(outline[k + 1] * mm), '30', '0.0']
+        lines += ['0', 'SEQEND', '8', 'CUT']
+    lines += ['0', 'ENDSEC', '0', 'EOF']
+    with open(file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+writers = {'svg': writeSvg, 'dxf': writeDxf}
+
+def export(boxes, folder, sheetWidth, sheetHeight, kerf=0.02, spacing=0.2, format='svg', prefix='FlatPattern'):
+    '''Nest the panels of (box name, panels) pairs and write one file per
+    sheet into folder. Returns (files, sheets).'''
+    write = writers[format.lower()]
+    sheets = nest(pieces(boxes, kerf), sheetWidth, sheetHeight, spacing)
+    os.makedirs(folder, exist_ok=True)
+    files = []
+    for k, sheet in enumerate(sheets):
+        file = os.path.join(folder, '{}_sheet{:03d}.{}'.format(prefix, k + 1, format.lower()))
+        write(file, sheet)
+        files.append(file)
+    return files, sheets
+
+
+if __name__ == '__main__':
+    import tempfile
+    from finger_geometry import boxPanels, isSimple
+    boxes = [('Box {}'.format(k + 1), boxPanels('Closed' if k % 3 else 'Open', 6.0 + k % 7, 4.0 + k % 5, 3.0 + k % 4, 0.3, 4, 3, 2, 0))
+             for k in range(60)]
+    for fileFormat in ('svg', 'dxf'):
+        start = time.perf_counter()
+        files, sheets = export(boxes, tempfile.mkdtemp(), 60.0, 40.0, format=fileFormat)
+        seconds = time.perf_counter() - start
+        count = sum(len(sheet.placed) for sheet in sheets)
+        print('{}: {} panels on {} sheets, {:.0%} used, {:.2f} s'.format(fileFormat, count, len(sheets), utilization(sheets), seconds))
+    for sheet in sheets:
+        boxesOnSheet = [(min(outline[0::2]), min(outline[1::2]), max(outline[0::2]), max(outline[1::2])) for _, outline in sheet.placed]
+        assert all(0 <= a[0] and 0 <= a[1] and a[2] <= sheet.width + 1e-9 and a[3] <= sheet.height + 1e-9 for a in boxesOnSheet)
+        for i in range(len(boxesOnSheet)):
+            for j in range(i + 1, len(boxesOnSheet)):
+                a, b = boxesOnSheet[i], boxesOnSheet[j]
+                assert a[2] <= b[0] or b[2] <= a[0] or a[3] <= b[1] or b[3] <= a[1], 'overlap'
+        assert all(isSimple(outline) for _, outline in sheet.placed)
@@ -0,0 +1,78 @@
+#Description-Bookkeeping of the live finger joint box preview
+
+# While the dialog is open the panel outlines are drawn as custom graphics,
+# one group per panel. Typing fires an input changed event per keystroke,
+# so rebuilds are debounced: the preview is redrawn once the inputs have
+# been still for a moment. A redraw only recreates the lines of panels
+# whose outline changed; panels that merely moved along the row get a new
+# transform.
+
+import threading
+
+class Debouncer:
+    '''Calls fire() once, delay seconds after the last trigger(). fire runs
+    on a timer thread; in Fusion it fires a custom event, whose handler
+    then runs on the main thread.'''
+    def __init__(self, delay, fire):
+        self._delay = delay
+        self._fire = fire
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def trigger(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+            self._timer = threading.Timer(self._delay, self._run)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+
+    def _run(self):
+        with self._lock:
+            self._timer = None
+        self._fire()
+
+
+class PreviewState:
+    '''Outlines and offsets of the panels on screen.'''
+    def __init__(self):
+        self.outlines = {}
+        self.offsets = {}
+
+    def update(self, panels, offsets):
+        '''Record the new panels at their offsets. Returns the names of the
+        panels to (redraw, move, remove).'''
+        redraw = []
+        move = []
+        names = set()
+        for panel, offset in zip(panels, offsets):
+            names.add(panel.name)
+            if self.outlines.get(panel.name) != panel.outline:
+                redraw.append(panel.name)
+            elif self.offsets.get(panel.name) != offset:
+                move.append(panel.name)
+            self.outlines[panel.name] = panel.outline
+            self.offsets[panel.name] = offset
+        remove = [name for name in self.outlines if name not in names]
+        for name in remove:
+            del self.outlines[name]
+            del self.offsets[name]
+        return redraw, move, remove
+
+    def clear(self):
+        self.outlines = {}
+        self.offsets = {}
+
+
+def lineStrip(outline, z=0.0):
+    '''Flat x, y, z coordinates of the outline as a closed line strip.'''
+    coordinates = []
+    for k in range(0, len(outline), 2):
+        coordinates += [outline[k], outline[k + 1], z]
+    return coordinates + coordinates[:3]
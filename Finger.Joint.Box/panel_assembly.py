@@ -0,0 +1,123 @@
+#Description-Assembly of finger joint boxes that share identical panels
+
+# Shelving and drawer systems repeat the same panels many times: every box
+# has two of most panels, and boxes of one size have all of them in common.
+# The assembly models each distinct panel once, as a component of its own,
+# and places every other copy as an occurrence of it. Boxes whose panels
+# are all alike share one box component the same way. The model then grows
+# with the distinct panels instead of all of them.
+#
+# Panels are laid out as createBox lays them out: side by side along x,
+# the second copy above the first, and the boxes in a row along x.
+
+class AssemblyPlan:
+    def __init__(self):
+        # Panel key -> (name, panel, thickness) of its first use.
+        self.panels = {}
+        # Box key -> [(panel key, x, y)] inside the box.
+        self.boxes = {}
+        # (name, box key, x) of every box.
+        self.placements = []
+        self._x = 0.0
+
+    def add(self, name, panels, thickness):
+        '''Place a box of panels after the ones added so far.'''
+        gap = thickness * 4
+        spacing = max(panel.height for panel in panels) + gap
+        layout = []
+        x = 0.0
+        for panel in panels:
+            key = panelKey(panel, thickness)
+            self.panels.setdefault(key, ('{} {}'.format(name, panel.name), panel, thickness))
+            layout += [(key, x, copy * spacing) for copy in range(panel.copies)]
+            x += panel.width + gap
+        boxKey = tuple(layout)
+        self.boxes.setdefault(boxKey, layout)
+        self.placements.append((name, boxKey, self._x))
+        self._x += x + gap * 3
+
+    @property
+    def panelCount(self):
+        return sum(len(self.boxes[boxKey]) for name, boxKey, x in self.placements)
+
+    def summary(self):
+        return '{} boxes ({} distinct), {} panels ({} distinct)'.format(
+            len(self.placements), len(self.boxes), self.panelCount, len(self.panels))
+
+
+def panelKey(panel, thickness):
+    # Rounded, so panels computed from equal sizes in different units match.
+    return (round(thickness, 6),) + tuple(round(value, 6) for value in panel.outline)
+
+def build(rootComp, plan, core, drawPanel):
+    '''Create the plan's components under rootComp. drawPanel(component,
+    panel, thickness) models one panel at the component's origin; core is
+    adsk.core. Returns the box components by box key.'''
+    panelComponents = {}
+    boxComponents = {}
+    for name, boxKey, x in plan.placements:
+        if boxKey in boxComponents:
+            rootComp.occurrences.addExistingComponent(boxComponents[boxKey], translation(core, x, 0.0))
+            continue
+        box = rootComp.occurrences.addNewComponent(translation(core, x, 0.0)).component
+        box.name = name
+        boxComponents[boxKey] = box
+        for panelKey, panelX, panelY in plan.boxes[boxKey]:
+            if panelKey in panelComponents:
+                box.occurrences.addExistingComponent(panelComponents[panelKey], translation(core, panelX, panelY))
+                continue
+            panelName, panel, thickness = plan.panels[panelKey]
+            component = box.occurrences.addNewComponent(translation(core, panelX, panelY)).component
+            component.name = panelName
+            drawPanel(component, panel, thickness)
+            panelComponents[panelKey] = component
+    return boxComponents
+
+def translation(core, x, y):
+    transform = core.Matrix3D.create()
+    transform.translation = core.Vector3D.create(x, y, 0.0)
+    return transform
+
+
+def benchmark(boxCount=24):
+    '''Counts and ms of building a drawer unit of boxCount boxes in three
+    sizes against stand_in_api, once as a component of bodies per box and
+    once as an assembly of shared panels.'''
+    import time
+    import stand_in_api
+    from finger_geometry import boxPanels, rowLayout
+    from sketch_builder import buildPanel, buildPanels
+    sizes = [(40.0, 30.0, 10.0), (40.0, 30.0, 15.0), (40.0, 30.0, 20.0)]
+    boxes = []
+    for k in range(boxCount):
+        length, width, height = sizes[k % len(sizes)]
+        boxes.append(('Drawer {}'.format(k + 1), boxPanels('Open', length, width, height, 1.2, 8, 6, 2, 0.0), 1.2))
+    def drawPanel(component, panel, thickness):
+        buildPanel(component, panel.outline, thickness, stand_in_api.core, stand_in_api.fusion)
+    results = []
+    for mode in ('per box', 'shared'):
+        design = stand_in_api.Design()
+        rootComp = design.rootComponent
+        start = time.perf_counter()
+        if mode == 'per box':
+            x = 0.0
+            for name, panels, thickness in boxes:
+                component = rootComp.occurrences.addNewComponent(translation(stand_in_api.core, x, 0.0)).component
+                gap = thickness * 4
+                offsets = rowLayout(panels, gap)
+                buildPanels(component, panels, offsets, gap, thickness, stand_in_api.core, stand_in_api.fusion)
+                x += offsets[-1] + panels[-1].width + gap * 4
+        else:
+            plan = AssemblyPlan()
+            for name, panels, thickness in boxes:
+                plan.add(name, panels, thickness)
+            build(rootComp, plan, stand_in_api.core, drawPanel)
+        results.append((mode, design.counts, time.perf_counter() - start))
+    return results
+
+
+if __name__ == '__main__':
+    print('mode     API calls  components  occurrences  sketches  curves  features  bodies  ms')
+    for mode, counts, seconds in benchmark():
+        print('{:8} {:9} {:11} {:12} {:9} {:7} {:9} {:7} {:5.1f}'.format(
+            mode, counts.calls, counts.components, counts.occurrences, counts.sketches, counts.curves, counts.features, counts.bodies, seconds * 1000))
@@ -0,0 +1,365 @@
+#Description-Finger joint box driven by user parameters
+
+# Instead of baking the outline into sketch lines, a parametric box creates
+# named user parameters (prefix + length, width, height, thickness,
+# overhang, fingersL/W/H and the finger widths derived from them) and
+# builds every panel from features that refer to them: a dimensioned
+# rectangle extruded by the thickness, one dimensioned notch per edge cut
+# and patterned along the edge by the finger count, and the corner cuts.
+# Editing a parameter then recomputes the box instead of rebuilding it.
+#
+# A PatternBox builds the same features from fixed values, without
+# parameters or dimensions. Drawing the outline takes a sketch line per
+# finger side, so its sketch grows with the finger counts; a pattern box
+# always has the same sketches and features, only the pattern quantities
+# change. benchmark() compares the two against stand_in_api.
+#
+# The Fusion modules are passed in (core and fusion), so the builder also
+# runs against stand-ins.
+
+# Base parameters and their units; lengths are given in cm.
+baseParameters = (
+    ('length', 'cm'), ('width', 'cm'), ('height', 'cm'), ('thickness', 'cm'), ('overhang', 'cm'),
+    ('fingersL', ''), ('fingersW', ''), ('fingersH', ''),
+)
+
+def derivedParameters(boxtype):
+    '''(name, expression, units) of the parameters derived from the base
+    ones, with {} standing for the prefix. They follow the outline
+    formulas of finger_geometry.boxPanels.'''
+    if boxtype == 'Closed':
+        outerHeight = '{0}height + 2 * {0}overhang'
+        spanH = '{0}height - 2 * {0}thickness'
+    else:
+        outerHeight = '{0}height + {0}overhang'
+        spanH = '{0}height - {0}thickness'
+    return (
+        ('fingerHeight', '{0}thickness + {0}overhang', 'cm'),
+        ('outerLength', '{0}length + 2 * {0}overhang', 'cm'),
+        ('outerWidth', '{0}width + 2 * {0}overhang', 'cm'),
+        ('outerHeight', outerHeight, 'cm'),
+        ('fingerwidthL', '({0}length - 2 * {0}thickness) / (2 * {0}fingersL + 1)', 'cm'),
+        ('fingerwidthW', '({0}width - 2 * {0}thickness) / (2 * {0}fingersW + 1)', 'cm'),
+        ('fingerwidthH', '(' + spanH + ') / (2 * {0}fingersH + 1)', 'cm'),
+        ('gap', '4 * {0}thickness', 'cm'),
+    )
+
+def derivedValues(boxtype, values):
+    '''The values of derivedParameters(boxtype) for the base values.'''
+    length, width, height = values['length'], values['width'], values['height']
+    thickness, overhang = values['thickness'], values['overhang']
+    if boxtype == 'Closed':
+        outerHeight = height + 2 * overhang
+        spanH = height - 2 * thickness
+    else:
+        outerHeight = height + overhang
+        spanH = height - thickness
+    return {
+        'fingerHeight': thickness + overhang,
+        'outerLength': length + 2 * overhang,
+        'outerWidth': width + 2 * overhang,
+        'outerHeight': outerHeight,
+        'fingerwidthL': (length - 2 * thickness) / (2 * values['fingersL'] + 1),
+        'fingerwidthW': (width - 2 * thickness) / (2 * values['fingersW'] + 1),
+        'fingerwidthH': spanH / (2 * values['fingersH'] + 1),
+        'gap': 4 * thickness,
+    }
+
+def panelLayout(boxtype):
+    '''(name, width, height, bottom, right, top, left, copies) of each panel,
+    sizes as parameter names and each edge as (tabs, finger width, count)
+    parameter names, or None for the flat top of an open box.'''
+    L = (False, 'fingerwidthL', 'fingersL')
+    W = (False, 'fingerwidthW', 'fingersW')
+    H = (False, 'fingerwidthH', 'fingersH')
+    def tabs(edge):
+        return (True,) + edge[1:]
+    closed = boxtype == 'Closed'
+    return [
+        ('Side', 'outerLength', 'outerHeight', tabs(L), tabs(H), tabs(L) if closed else None, tabs(H), 2),
+        ('Bottom', 'outerLength', 'outerWidth', L, W, L, W, 2 if closed else 1),
+        ('End', 'outerWidth', 'outerHeight', tabs(W), H, tabs(W) if closed else None, H, 2),
+    ]
+
+
+class ParametricBox:
+    def __init__(self, design, component, core, fusion, prefix):
+        self._design = design
+        self._component = component
+        self._core = core
+        self._fusion = fusion
+        self.prefix = prefix
+        self.sketches = 0
+        self.features = 0
+
+    def p(self, name):
+        return self.prefix + name
+
+    def _expression(self, text):
+        return text.format(self.prefix)
+
+    # Sizes and positions are built up from parameters with _add, _subtract
+    # and _multiply, which write expressions here and compute numbers in a
+    # PatternBox; _value and _valueInput turn either into what the API wants.
+    def _add(self, *terms):
+        return ' + '.join(str(term) for term in terms)
+
+    def _subtract(self, term, subtrahend):
+        return '{} - {}'.format(term, subtrahend)
+
+    def _multiply(self, factor, term):
+        return '{} * {}'.format(factor, term)
+
+    def _value(self, expression, units='cm'):
+        return self._design.unitsManager.evaluateExpression(expression, units)
+
+    def _valueInput(self, expression):
+        return self._core.ValueInput.createByString(expression)
+
+    def createParameters(self, boxtype, values):
+        '''Add the base parameters with values (cm and counts) and the
+        derived ones, or update them if the prefix is in use already.'''
+        core = self._core
+        userParameters = self._design.userParameters
+        for name, units in baseParameters:
+            existing = userParameters.itemByName(self.p(name))
+            if existing:
+                existing.value = float(values[name])
+            else:
+                userParameters.add(self.p(name), core.ValueInput.createByReal(float(values[name])), units, 'Finger joint box')
+        for name, expression, units in derivedParameters(boxtype):
+            expression = self._expression(expression)
+            existing = userParameters.itemByName(self.p(name))
+            if existing:
+                existing.expression = expression
+            else:
+                userParameters.add(self.p(name), core.ValueInput.createByString(expression), units, 'Finger joint box')
+
+    def build(self, boxtype):
+        '''Build the panels side by side along x; the panels the box needs
+        twice are patterned along y. Returns the panel bodies.'''
+        fusion = self._fusion
+        component = self._component
+        layout = panelLayout(boxtype)
+        bodies = []
+        doubled = self._core.ObjectCollection.create()
+        offset = self.p('gap')
+        for name, width, height, bottom, right, top, left, copies in layout:
+            body = self._panel(offset, width, height, bottom, right, top, left)
+            bodies.append(body)
+            if copies > 1:
+                doubled.add(body)
+            offset = self._add(offset, self.p(width), self.p('gap'))
+        if doubled.count:
+            patterns = component.features.rectangularPatternFeatures
+            spacing = self._add(self.p('outerWidth'), self.p('outerHeight'), self.p('gap'))
+            patternInput = patterns.createInput(doubled, component.yConstructionAxis, self._core.ValueInput.createByReal(2),
+                                                self._valueInput(spacing), fusion.PatternDistanceType.SpacingPatternDistanceType)
+            patterns.add(patternInput)
+            self.features += 1
+        return bodies
+
+    def _panel(self, x, width, height, bottom, right, top, left):
+        # Everything is placed gap away from the sketch origin, so no
+        # dimension is ever zero.
+        core = self._core
+        fusion = self._fusion
+        y = self.p('gap')
+        width, height, fh = self.p(width), self.p(height), self.p('fingerHeight')
+        thickness = self._valueInput(self.p('thickness'))
+        extrudes = self._component.features.extrudeFeatures
+
+        sketch = self._sketch()
+        self._rectangle(sketch, x, y, width, height)
+        base = extrudes.addSimple(sketch.profiles.item(0), thickness, fusion.FeatureOperations.NewBodyFeatureOperation)
+        self.features += 1
+        body = base.bodies.item(0)
+
+        # One notch per edge, patterned along it. A tabs edge cuts the even
+        # segments (fingers + 1 of them), a notches edge the odd ones.
+        xAxis, yAxis = self._component.xConstructionAxis, self._component.yConstructionAxis
+        def start(origin, edge):
+            return self._add(origin, fh) if edge[0] else self._add(origin, fh, self.p(edge[1]))
+        def count(edge):
+            return self._add(self.p(edge[2]), 1) if edge[0] else self.p(edge[2])
+        edges = [(bottom, start(x, bottom), y, xAxis, True),
+                 (right, self._subtract(self._add(x, width), fh), start(y, right), yAxis, False),
+                 (left, x, start(y, left), yAxis, False)]
+        if top is not None:
+            edges.append((top, start(x, top), self._subtract(self._add(y, height), fh), xAxis, True))
+        for edge, notchX, notchY, axis, horizontal in edges:
+            fingerWidth = self.p(edge[1])
+            if horizontal:
+                self._notches(notchX, notchY, fingerWidth, fh, count(edge), self._multiply(2, fingerWidth), axis, thickness)
+            else:
+                self._notches(notchX, notchY, fh, fingerWidth, count(edge), self._multiply(2, fingerWidth), axis, thickness)
+
+        # Corners are cut unless both edges meeting there reach the outside,
+        # which only notches edges do at their ends.
+        cut = []
+        if bottom[0] or left[0]:
+            cut.append((x, y))
+        if bottom[0] or right[0]:
+            cut.append((self._subtract(self._add(x, width), fh), y))
+        if top is not None:
+            if top[0] or left[0]:
+                cut.append((x, self._subtract(self._add(y, height), fh)))
+            if top[0] or right[0]:
+                cut.append((self._subtract(self._add(x, width), fh), self._subtract(self._add(y, height), fh)))
+        if cut:
+            sketch = self._sketch()
+            for cornerX, cornerY in cut:
+                self._rectangle(sketch, cornerX, cornerY, fh, fh)
+            profiles = core.ObjectCollection.create()
+            for k in range(sketch.profiles.count):
+                profiles.add(sketch.profiles.item(k))
+            extrudes.addSimple(profiles, thickness, fusion.FeatureOperations.CutFeatureOperation)
+            self.features += 1
+        return body
+
+    def _notches(self, x, y, width, height, count, spacing, axis, thickness):
+        # Cut the first notch and pattern the cut along the edge. The pattern
+        # is made even for a single notch, so that raising the count
+        # parameter later adds notches to this edge too.
+        core = self._core
+        fusion = self._fusion
+        sketch = self._sketch()
+        self._rectangle(sketch, x, y, width, height)
+        extrudes = self._component.features.extrudeFeatures
+        notch = extrudes.addSimple(sketch.profiles.item(0), thickness, fusion.FeatureOperations.CutFeatureOperation)
+        self.features += 1
+        patterns = self._component.features.rectangularPatternFeatures
+        features = core.ObjectCollection.create()
+        features.add(notch)
+        patternInput = patterns.createInput(features, axis, self._valueInput(count),
+                                            self._valueInput(spacing), fusion.PatternDistanceType.SpacingPatternDistanceType)
+        patterns.add(patternInput)
+        self.features += 1
+
+    def _sketch(self):
+        self.sketches += 1
+        return self._component.sketches.add(self._component.xYConstructionPlane)
+
+    def _rectangle(self, sketch, x, y, width, height):
+        # A rectangle whose corner, width and height are dimensioned by the
+        # expressions.
+        core = self._core
+        fusion = self._fusion
+        x0, y0 = self._value(x), self._value(y)
+        x1, y1 = x0 + self._value(width), y0 + self._value(height)
+        lines = sketch.sketchCurves.sketchLines.addTwoPointRectangle(core.Point3D.create(x0, y0, 0), core.Point3D.create(x1, y1, 0))
+        corner = None
+        horizontal = None
+        vertical = None
+        for k in range(lines.count):
+            line = lines.item(k)
+            start, end = line.startSketchPoint.geometry, line.endSketchPoint.geometry
+            for point in (line.startSketchPoint, line.endSketchPoint):
+                if abs(point.geometry.x - x0) < 1e-9 and abs(point.geometry.y - y0) < 1e-9:
+                    corner = point
+            if abs(start.y - end.y) < 1e-9 and not horizontal:
+                horizontal = line
+            elif abs(start.x - end.x) < 1e-9 and not vertical:
+                vertical = line
+        dimensions = sketch.sketchDimensions
+        orientations = fusion.DimensionOrientations
+        def dimension(a, b, orientation, expression, textX, textY):
+            added = dimensions.addDistanceDimension(a, b, orientation, core.Point3D.create(textX, textY, 0))
+            added.parameter.expression = expression
+        dimension(sketch.originPoint, corner, orientations.HorizontalDimensionOrientation, x, x0 / 2, y0 - 0.5)
+        dimension(sketch.originPoint, corner, orientations.VerticalDimensionOrientation, y, x0 - 0.5, y0 / 2)
+        dimension(horizontal.startSketchPoint, horizontal.endSketchPoint, orientations.HorizontalDimensionOrientation, width, (x0 + x1) / 2, y1 + 0.5)
+        dimension(vertical.startSketchPoint, vertical.endSketchPoint, orientations.VerticalDimensionOrientation, height, x1 + 0.5, (y0 + y1) / 2)
+
+
+class PatternBox(ParametricBox):
+    '''The same features with fixed values: no user parameters and no
+    dimensions, every sketch is a plain rectangle.'''
+    def __init__(self, component, core, fusion):
+        super().__init__(None, component, core, fusion, '')
+        self.values = {}
+
+    def p(self, name):
+        return self.values[name]
+
+    def _add(self, *terms):
+        return sum(terms)
+
+    def _subtract(self, term, subtrahend):
+        return term - subtrahend
+
+    def _multiply(self, factor, term):
+        return factor * term
+
+    def _value(self, value, units='cm'):
+        return value
+
+    def _valueInput(self, value):
+        return self._core.ValueInput.createByReal(value)
+
+    def createParameters(self, boxtype, values):
+        '''Work out the derived values instead of adding parameters.'''
+        self.values = {name: float(values[name]) for name, units in baseParameters}
+        self.values.update(derivedValues(boxtype, self.values))
+
+    def _rectangle(self, sketch, x, y, width, height):
+        x0, y0 = self._value(x), self._value(y)
+        x1, y1 = x0 + self._value(width), y0 + self._value(height)
+        sketch.sketchCurves.sketchLines.addTwoPointRectangle(self._core.Point3D.create(x0, y0, 0), self._core.Point3D.create(x1, y1, 0))
+
+
+def freePrefix(design, base='fj'):
+    '''First prefix base1_, base2_, ... whose parameters don't exist yet.'''
+    k = 1
+    while design.userParameters.itemByName('{}{}_length'.format(base, k)):
+        k += 1
+    return '{}{}_'.format(base, k)
+
+
+def benchmark(fingerCounts=(2, 8, 32, 128)):
+    '''Counts and ms of building closed boxes with the given number of
+    fingers on every edge against stand_in_api, once drawn as outlines and
+    once as patterned notches.'''
+    import time
+    import stand_in_api
+    from finger_geometry import boxPanels, rowLayout
+    from sketch_builder import buildPanels
+    results = []
+    for fingers in fingerCounts:
+        values = {'length': 4.0 * fingers, 'width': 3.0 * fingers, 'height': 2.0 * fingers, 'thickness': 0.5, 'overhang': 0.0,
+                  'fingersL': fingers, 'fingersW': fingers, 'fingersH': fingers}
+        for mode in ('outline', 'pattern'):
+            design = stand_in_api.Design()
+            start = time.perf_counter()
+            if mode == 'outline':
+                panels = boxPanels('Closed', values['length'], values['width'], values['height'], values['thickness'],
+                                   fingers, fingers, fingers, values['overhang'])
+                gap = values['thickness'] * 4
+                buildPanels(design.rootComponent, panels, rowLayout(panels, gap), gap, values['thickness'],
+                            stand_in_api.core, stand_in_api.fusion)
+            else:
+                box = PatternBox(design.rootComponent, stand_in_api.core, stand_in_api.fusion)
+                box.createParameters('Closed', values)
+                box.build('Closed')
+            results.append((fingers, mode, design.counts, time.perf_counter() - start))
+    return results
+
+
+if __name__ == '__main__':
+    print('fingers mode     API calls  sketches  curves  largest sketch  features  pattern instances  ms')
+    first = None
+    for fingers, mode, counts, seconds in benchmark():
+        print('{:7} {:8} {:9} {:9} {:7} {:15} {:9} {:18} {:5.1f}'.format(
+            fingers, mode, counts.calls, counts.sketches, counts.curves, counts.largestSketch, counts.features, counts.instances, seconds * 1000))
+        if mode == 'pattern':
+            # Only the pattern quantities grow with the fingers.
+            first = first or counts
+            assert (counts.calls, counts.sketches, counts.curves, counts.features) == (first.calls, first.sketches, first.curves, first.features)
+    # The fixed values follow the parameter expressions.
+    import stand_in_api
+    values = {'length': 12.0, 'width': 8.0, 'height': 6.0, 'thickness': 0.5, 'overhang': 0.05, 'fingersL': 6, 'fingersW': 4, 'fingersH': 3}
+    for boxtype in ('Closed', 'Open'):
+        design = stand_in_api.Design()
+        ParametricBox(design, design.rootComponent, stand_in_api.core, stand_in_api.fusion, 'fj1_').createParameters(boxtype, values)
+        for name, value in derivedValues(boxtype, values).items():
+            assert abs(design.userParameters.itemByName('fj1_' + name).value - value) < 1e-12, name
@@ -0,0 +1,210 @@
+#Description-Draws panel outlines into a sketch as connected polylines
+
+# The script used to draw every finger from its own lines, with the sketch
+# recomputing after each of them and every line ending on sketch points of
+# its own, which the solver then has to merge. drawOutline chains the lines
+# of an outline through their sketch points instead, with compute deferred
+# while drawing, so an outline of n vertices has n sketch points and closes
+# into one profile.
+
+import time
+
+def drawOutline(sketch, outline, createPoint):
+    '''Draw the closed flat x, y outline into sketch as lines sharing their
+    sketch points. createPoint is adsk.core.Point3D.create. Returns the
+    lines.'''
+    count = len(outline) // 2
+    if count < 3:
+        return []
+    lines = sketch.sketchCurves.sketchLines
+    deferred = sketch.isComputeDeferred
+    sketch.isComputeDeferred = True
+    try:
+        drawn = [lines.addByTwoPoints(createPoint(outline[0], outline[1], 0), createPoint(outline[2], outline[3], 0))]
+        first = drawn[0].startSketchPoint
+        end = drawn[0].endSketchPoint
+        for k in range(2, count):
+            line = lines.addByTwoPoints(end, createPoint(outline[2 * k], outline[2 * k + 1], 0))
+            end = line.endSketchPoint
+            drawn.append(line)
+        drawn.append(lines.addByTwoPoints(end, first))
+    finally:
+        sketch.isComputeDeferred = deferred
+    return drawn
+
+def drawOutlineFingers(sketch, outline, createPoint):
+    '''Draw the outline the way CreateTypeN used to: each finger's face and
+    then its two sides, alternating with the finger on the opposite edge
+    (six lines per finger pair), then the lines between the fingers, each
+    line on its own and recomputing after it. Kept for the benchmark.'''
+    lines = sketch.sketchCurves.sketchLines
+    points = [createPoint(outline[k], outline[k + 1], 0) for k in range(0, len(outline), 2)]
+    count = len(points)
+    xs = outline[0::2]
+    ys = outline[1::2]
+    # Line k runs from vertex k - 1 to vertex k; a finger's face is a line
+    # on the panel's border.
+    def faces(values, border, along):
+        return sorted((k for k in range(count) if values[k - 1] == border and values[k] == border),
+                      key=lambda k: along[k])
+    drawn = set()
+    def draw(k, start, end):
+        if k not in drawn:
+            drawn.add(k)
+            lines.addByTwoPoints(start, end)
+    def finger(k):
+        draw(k, points[k - 1], points[k])
+        draw((k - 1) % count, points[k - 1], points[k - 2])
+        draw((k + 1) % count, points[k], points[(k + 1) % count])
+    for first, second in ((faces(ys, min(ys), xs), faces(ys, max(ys), xs)),
+                          (faces(xs, min(xs), ys), faces(xs, max(xs), ys))):
+        for j in range(max(len(first), len(second))):
+            for edge in (first, second):
+                if j < len(edge):
+                    finger(edge[j])
+    for k in range(count):
+        draw(k, points[k - 1], points[k])
+
+def buildPanel(component, outline, thickness, core, fusion):
+    '''Draw one outline on a sketch of its own and extrude it into a body.
+    Returns the extrude feature.'''
+    sketch = component.sketches.add(component.xYConstructionPlane)
+    drawOutline(sketch, outline, core.Point3D.create)
+    return component.features.extrudeFeatures.addSimple(sketch.profiles.item(0), core.ValueInput.createByReal(thickness),
+                                                        fusion.FeatureOperations.NewBodyFeatureOperation)
+
+def buildPanels(component, panels, offsets, gap, thickness, core, fusion):
+    '''Draw the panels at their x offsets on one sketch and extrude them
+    with one feature; the panels the box needs twice are then patterned
+    along y, gap above the tallest. core and fusion are adsk.core and
+    adsk.fusion. Returns the extrude feature.'''
+    sketch = component.sketches.add(component.xYConstructionPlane)
+    for panel, offset in zip(panels, offsets):
+        outline = panel.outline[:]
+        for k in range(0, len(outline), 2):
+            outline[k] += offset
+        drawOutline(sketch, outline, core.Point3D.create)
+
+    profiles = core.ObjectCollection.create()
+    for prof in sketch.profiles:
+        profiles.add(prof)
+    extrudes = component.features.extrudeFeatures
+    extrude = extrudes.addSimple(profiles, core.ValueInput.createByReal(thickness), fusion.FeatureOperations.NewBodyFeatureOperation)
+
+    # Every panel outline starts at its offset, which tells the bodies apart.
+    doubled = core.ObjectCollection.create()
+    for body in extrude.bodies:
+        x = body.boundingBox.minPoint.x
+        nearest = min(range(len(panels)), key=lambda k: abs(offsets[k] - x))
+        if panels[nearest].copies > 1:
+            doubled.add(body)
+    if doubled.count:
+        patterns = component.features.rectangularPatternFeatures
+        spacing = max(panel.height for panel in panels) + gap
+        patternInput = patterns.createInput(doubled, component.yConstructionAxis, core.ValueInput.createByReal(2),
+                                            core.ValueInput.createByReal(spacing), fusion.PatternDistanceType.SpacingPatternDistanceType)
+        patterns.add(patternInput)
+    return extrude
+
+
+class StandInSketch:
+    '''Counts API calls like a Fusion sketch: every call on the sketch, its
+    lines and points is one round trip. Points created at the position of
+    an existing sketch point are duplicates the solver has to merge.'''
+    def __init__(self):
+        self.calls = 0
+        self.adds = 0
+        self.pointCalls = 0
+        self.sketchPoints = 0
+        self.duplicates = 0
+        self.recomputes = 0
+        self._positions = set()
+        self._deferred = False
+        self.sketchCurves = self
+        self.sketchLines = self
+
+    @property
+    def isComputeDeferred(self):
+        return self._deferred
+    @isComputeDeferred.setter
+    def isComputeDeferred(self, value):
+        self.calls += 1
+        self._deferred = value
+
+    def createPoint(self, x, y, z):
+        self.pointCalls += 1
+        return (x, y, z)
+
+    def _sketchPoint(self, point):
+        if isinstance(point, StandInSketchPoint):
+            return point
+        self.sketchPoints += 1
+        if point in self._positions:
+            self.duplicates += 1
+        self._positions.add(point)
+        return StandInSketchPoint(self, point)
+
+    def addByTwoPoints(self, start, end):
+        self.calls += 1
+        self.adds += 1
+        if not self._deferred:
+            self.recomputes += 1
+        return StandInLine(self, self._sketchPoint(start), self._sketchPoint(end))
+
+class StandInSketchPoint:
+    def __init__(self, sketch, position):
+        self.sketch = sketch
+        self.position = position
+
+class StandInLine:
+    def __init__(self, sketch, start, end):
+        self._sketch = sketch
+        self._start = start
+        self._end = end
+
+    @property
+    def startSketchPoint(self):
+        self._sketch.calls += 1
+        return self._start
+
+    @property
+    def endSketchPoint(self):
+        self._sketch.calls += 1
+        return self._end
+
+
+def benchmark(fingerCounts=(2, 8, 32, 128)):
+    '''API calls (all, and lines added), sketch points and duplicates of
+    drawing all panels of closed boxes finger by finger as the script used
+    to, and as connected outlines (drawOutline).'''
+    from finger_geometry import boxPanels
+    results = []
+    for fingers in fingerCounts:
+        panels = boxPanels('Closed', 4.0 * fingers, 3.0 * fingers, 2.0 * fingers, 0.5, fingers, fingers, fingers, 0)
+        vertices = sum(len(panel) for panel in panels)
+        for mode, draw in (('fingers', drawOutlineFingers), ('connected', drawOutline)):
+            sketches = [StandInSketch() for _ in panels]
+            start = time.perf_counter()
+            for sketch, panel in zip(sketches, panels):
+                draw(sketch, panel.outline, sketch.createPoint)
+            seconds = time.perf_counter() - start
+            results.append((fingers, vertices, mode,
+                            sum(sketch.calls for sketch in sketches),
+                            sum(sketch.adds for sketch in sketches),
+                            sum(sketch.pointCalls for sketch in sketches),
+                            sum(sketch.sketchPoints for sketch in sketches),
+                            sum(sketch.duplicates for sketch in sketches),
+                            sum(sketch.recomputes for sketch in sketches),
+                            seconds))
+    return results
+
+
+if __name__ == '__main__':
+    print('fingers vertices mode       sketch calls  lines  Point3D  sketch points  duplicates  recomputes  ms')
+    for fingers, vertices, mode, calls, adds, pointCalls, sketchPoints, duplicates, recomputes, seconds in benchmark():
+        print('{:7} {:8} {:10} {:12} {:6} {:8} {:14} {:11} {:11} {:5.1f}'.format(
+            fingers, vertices, mode, calls, adds, pointCalls, sketchPoints, duplicates, recomputes, seconds * 1000))
+        if mode == 'fingers':
+            assert adds == vertices and recomputes == adds and duplicates == vertices
+        if mode == 'connected':
+            assert adds == vertices and sketchPoints == vertices and duplicates == 0 and recomputes == 0
@@ -0,0 +1,310 @@
+#Description-Stand-in for the parts of the Fusion API the box builders use
+
+# Just enough of adsk.core and adsk.fusion for sketch_builder, parametric_box
+# and panel_assembly to run outside Fusion. Nothing is modelled; a Design
+# counts what a build asks of Fusion: API calls on the design's objects,
+# components and occurrences, sketches, sketch curves and dimensions,
+# features, bodies and pattern instances, and the largest sketch, which the
+# solver has to solve as a whole.
+
+import re, types
+
+class ObjectCollection:
+    def __init__(self, items=None):
+        self._items = list(items or [])
+
+    @staticmethod
+    def create():
+        return ObjectCollection()
+
+    def add(self, item):
+        self._items.append(item)
+
+    @property
+    def count(self):
+        return len(self._items)
+
+    def item(self, index):
+        return self._items[index]
+
+    def __iter__(self):
+        return iter(self._items)
+
+class Point3D:
+    def __init__(self, x, y, z):
+        self.x = x
+        self.y = y
+        self.z = z
+
+    @staticmethod
+    def create(x=0.0, y=0.0, z=0.0):
+        return Point3D(x, y, z)
+
+class Vector3D(Point3D):
+    @staticmethod
+    def create(x=0.0, y=0.0, z=0.0):
+        return Vector3D(x, y, z)
+
+class Matrix3D:
+    def __init__(self):
+        self.translation = Vector3D(0.0, 0.0, 0.0)
+
+    @staticmethod
+    def create():
+        return Matrix3D()
+
+class ValueInput:
+    def __init__(self, real=None, expression=None):
+        self.real = real
+        self.expression = expression
+
+    @staticmethod
+    def createByReal(value):
+        return ValueInput(real=value)
+
+    @staticmethod
+    def createByString(expression):
+        return ValueInput(expression=expression)
+
+core = types.SimpleNamespace(ObjectCollection=ObjectCollection, Point3D=Point3D, Vector3D=Vector3D, Matrix3D=Matrix3D, ValueInput=ValueInput)
+fusion = types.SimpleNamespace(
+    FeatureOperations=types.SimpleNamespace(NewBodyFeatureOperation='new', CutFeatureOperation='cut'),
+    PatternDistanceType=types.SimpleNamespace(SpacingPatternDistanceType='spacing'),
+    DimensionOrientations=types.SimpleNamespace(HorizontalDimensionOrientation='horizontal', VerticalDimensionOrientation='vertical'),
+)
+
+
+class Counts:
+    def __init__(self):
+        self.calls = 0
+        self.components = 0
+        self.occurrences = 0
+        self.sketches = 0
+        self.curves = 0
+        self.dimensions = 0
+        self.features = 0
+        self.bodies = 0
+        self.instances = 0
+        self.largestSketch = 0
+
+
+class Design:
+    def __init__(self):
+        self.counts = Counts()
+        self.userParameters = UserParameters(self)
+        self.unitsManager = self
+        self.rootComponent = Component(self)
+
+    def evaluateExpression(self, expression, units='cm'):
+        self.counts.calls += 1
+        return self.evaluate(expression)
+
+    def evaluate(self, expression):
+        # Parameter names are replaced by their values; what is left is
+        # plain arithmetic.
+        parameters = self.userParameters._parameters
+        def value(match):
+            name = match.group(0)
+            return '({!r})'.format(parameters[name].value) if name in parameters else name
+        return float(eval(re.sub(r'[A-Za-z_]\w*', value, expression), {'__builtins__': {}}))
+
+    def real(self, valueInput):
+        return valueInput.real if valueInput.expression is None else self.evaluate(valueInput.expression)
+
+class Parameter:
+    def __init__(self, design, name, expression):
+        self._design = design
+        self.name = name
+        self.expression = expression
+
+    @property
+    def value(self):
+        return self._design.evaluate(self.expression)
+    @value.setter
+    def value(self, value):
+        self.expression = repr(value)
+
+class UserParameters:
+    def __init__(self, design):
+        self._design = design
+        self._parameters = {}
+
+    def itemByName(self, name):
+        self._design.counts.calls += 1
+        return self._parameters.get(name)
+
+    def add(self, name, valueInput, units, comment):
+        self._design.counts.calls += 1
+        expression = valueInput.expression if valueInput.expression is not None else repr(valueInput.real)
+        self._parameters[name] = Parameter(self._design, name, expression)
+        return self._parameters[name]
+
+
+class Component:
+    def __init__(self, design):
+        self._design = design
+        self.name = ''
+        self.xConstructionAxis = 'x'
+        self.yConstructionAxis = 'y'
+        self.xYConstructionPlane = 'xy'
+        self.sketches = self
+        self.features = self
+        self.occurrences = Occurrences(design)
+        self.extrudeFeatures = Extrudes(design)
+        self.rectangularPatternFeatures = Patterns(design)
+
+    def add(self, plane):
+        self._design.counts.calls += 1
+        self._design.counts.sketches += 1
+        return Sketch(self._design)
+
+
+class Occurrence:
+    def __init__(self, component, transform):
+        self.component = component
+        self.transform = transform
+
+class Occurrences:
+    def __init__(self, design):
+        self._design = design
+
+    def addNewComponent(self, transform):
+        self._design.counts.components += 1
+        return self.addExistingComponent(Component(self._design), transform)
+
+    def addExistingComponent(self, component, transform):
+        self._design.counts.calls += 1
+        self._design.counts.occurrences += 1
+        return Occurrence(component, transform)
+
+
+class Sketch:
+    def __init__(self, design):
+        self._design = design
+        self._deferred = False
+        self._loops = []
+        self._curves = 0
+        self.originPoint = SketchPoint(Point3D(0.0, 0.0, 0.0))
+        self.sketchCurves = self
+        self.sketchLines = self
+        self.sketchDimensions = self
+
+    @property
+    def isComputeDeferred(self):
+        return self._deferred
+    @isComputeDeferred.setter
+    def isComputeDeferred(self, value):
+        self._design.counts.calls += 1
+        self._deferred = value
+
+    def _grow(self, curves):
+        counts = self._design.counts
+        counts.calls += 1
+        counts.curves += curves
+        self._curves += curves
+        counts.largestSketch = max(counts.largestSketch, self._curves)
+
+    def addByTwoPoints(self, start, end):
+        # A line starting where the previous line ended extends its loop;
+        # any other line starts a new loop.
+        self._grow(1)
+        if not isinstance(start, SketchPoint):
+            start = SketchPoint(start)
+        if not isinstance(end, SketchPoint):
+            end = SketchPoint(end)
+        loop = self._loops[-1] if self._loops else None
+        if not loop or (start.geometry.x, start.geometry.y) != (loop[-1].x, loop[-1].y):
+            loop = [start.geometry]
+            self._loops.append(loop)
+        loop.append(end.geometry)
+        return Line(self._design, start, end)
+
+    def addTwoPointRectangle(self, corner, opposite):
+        self._grow(4)
+        corners = [Point3D(corner.x, corner.y, 0.0), Point3D(opposite.x, corner.y, 0.0),
+                   Point3D(opposite.x, opposite.y, 0.0), Point3D(corner.x, opposite.y, 0.0)]
+        self._loops.append(corners)
+        points = [SketchPoint(point) for point in corners]
+        return ObjectCollection([Line(self._design, points[k], points[(k + 1) % 4]) for k in range(4)])
+
+    def addDistanceDimension(self, start, end, orientation, textPoint):
+        # Dimensions load the solver like curves do.
+        self._grow(1)
+        self._design.counts.dimensions += 1
+        return Dimension()
+
+    @property
+    def profiles(self):
+        self._design.counts.calls += 1
+        return ObjectCollection([Profile(loop) for loop in self._loops])
+
+class SketchPoint:
+    def __init__(self, geometry):
+        self.geometry = geometry
+
+class Line:
+    def __init__(self, design, start, end):
+        self._design = design
+        self._start = start
+        self._end = end
+
+    @property
+    def startSketchPoint(self):
+        self._design.counts.calls += 1
+        return self._start
+
+    @property
+    def endSketchPoint(self):
+        self._design.counts.calls += 1
+        return self._end
+
+class Dimension:
+    def __init__(self):
+        self.parameter = types.SimpleNamespace(expression='')
+
+class Profile:
+    def __init__(self, points):
+        self.boundingBox = types.SimpleNamespace(minPoint=Point3D(min(point.x for point in points), min(point.y for point in points), 0.0))
+
+
+class Body:
+    def __init__(self, profile):
+        self.boundingBox = profile.boundingBox
+
+class Feature:
+    def __init__(self, bodies):
+        self.bodies = ObjectCollection(bodies)
+
+class Extrudes:
+    def __init__(self, design):
+        self._design = design
+
+    def addSimple(self, profiles, distance, operation):
+        # A new body feature makes a body per profile.
+        counts = self._design.counts
+        counts.calls += 1
+        counts.features += 1
+        if operation != fusion.FeatureOperations.NewBodyFeatureOperation:
+            return Feature([])
+        profiles = list(profiles) if isinstance(profiles, ObjectCollection) else [profiles]
+        counts.bodies += len(profiles)
+        return Feature([Body(profile) for profile in profiles])
+
+class Patterns:
+    def __init__(self, design):
+        self._design = design
+
+    def createInput(self, entities, axis, quantity, distance, distanceType):
+        self._design.counts.calls += 1
+        return (entities, quantity)
+
+    def add(self, patternInput):
+        entities, quantity = patternInput
+        counts = self._design.counts
+        copies = entities.count * (int(round(self._design.real(quantity))) - 1)
+        counts.calls += 1
+        counts.features += 1
+        counts.instances += copies
+        if all(isinstance(entity, Body) for entity in entities):
+            counts.bodies += copies
+        return Feature([])
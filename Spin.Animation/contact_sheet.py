@@ -0,0 +1,61 @@
+#Description-Contact sheet of low resolution preview frames
+
+# A preview renders a sample of the animation's frames at low resolution.
+# The frames are tiled into one PNG in frame order, so the camera framing,
+# range and pacing can be checked at a glance before the full render.
+
+import math, os
+from .frame_writer import readBitmap, writePng
+
+def sampleFrames(frameCount, count):
+    '''Up to count frame numbers spread evenly over frameCount frames, the
+    first and last frame included.'''
+    count = min(count, frameCount)
+    if count <= 0:
+        return []
+    if count == 1:
+        return [0]
+    return sorted(set(int(round(k * (frameCount - 1) / (count - 1))) for k in range(count)))
+
+def scaledSize(width, height, scale):
+    '''Preview size of a width x height render, scale times smaller.'''
+    return max(1, int(width / scale)), max(1, int(height / scale))
+
+def writeContactSheet(file, bitmaps, columns=0, gap=4, background=b'\xff\xff\xff', removeBitmaps=True):
+    '''Tile bitmap files row by row into the PNG file. Every cell has the
+    size of the first bitmap; columns=0 makes the sheet roughly square.'''
+    if not bitmaps:
+        return False
+    frames = [readBitmap(bitmap) for bitmap in bitmaps]
+    cellWidth, cellHeight = frames[0][0], frames[0][1]
+    columns = columns or int(math.ceil(math.sqrt(len(frames))))
+    sheetRows = int(math.ceil(len(frames) / columns))
+    width = columns * cellWidth + (columns + 1) * gap
+    height = sheetRows * cellHeight + (sheetRows + 1) * gap
+    blankLine = background * width
+    gapBytes = background * gap
+    blankCell = background * cellWidth
+
+    rows = [blankLine] * gap
+    for r in range(sheetRows):
+        cells = frames[r * columns:(r + 1) * columns]
+        for y in range(cellHeight):
+            line = bytearray(gapBytes)
+            for c in range(columns):
+                # Crop or pad frames that differ in size from the first.
+                if c < len(cells) and y < cells[c][1]:
+                    line += bytes(cells[c][2][y][:cellWidth * 3]).ljust(cellWidth * 3, background[:1])
+                else:
+                    line += blankCell
+                line += gapBytes
+            rows.append(line)
+        rows.extend([blankLine] * gap)
+    writePng(file, width, height, rows)
+
+    if removeBitmaps:
+        for bitmap in bitmaps:
+            try:
+                os.remove(bitmap)
+            except OSError:
+                pass
+    return True
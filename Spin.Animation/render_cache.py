@@ -0,0 +1,101 @@
+#Description-Persistent cache of rendered animation frames
+
+# Rendered frames are stored under the hash of everything that determines
+# the image: document version and parameters, timeline marker, animated
+# values, camera and resolution. Re-exporting an animation after changing
+# only output settings, or a tail of the timeline, links the cached frames
+# into place instead of rendering them again. The cache is capped in size
+# and evicts the least recently used frames.
+
+import hashlib, json, os, threading
+from .frame_writer import linkFrame
+
+class RenderCache:
+    def __init__(self, folder, maxBytes=2 * 1024 ** 3):
+        self._folder = folder
+        self._maxBytes = maxBytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(folder, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    @property
+    def folder(self):
+        return self._folder
+
+    @property
+    def size(self):
+        return self._size
+
+    def key(self, *state):
+        '''Content address of a frame from its JSON serializable state.'''
+        return hashlib.sha256(json.dumps(state, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key, extension='.png'):
+        return os.path.join(self._folder, key[:2], key + extension)
+
+    def fetch(self, key, target):
+        '''Link the cached frame for key to target. Returns False on a miss.'''
+        cached = self.path(key, os.path.splitext(target)[1])
+        if not os.path.exists(cached):
+            self.misses += 1
+            return False
+        try:
+            linkFrame(cached, target)
+            # The modification time orders the frames for eviction.
+            os.utime(cached)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, file):
+        '''Add the rendered frame file under key, then evict down to the cap.'''
+        cached = self.path(key, os.path.splitext(file)[1])
+        if not os.path.exists(file):
+            return
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        try:
+            linkFrame(file, cached)
+        except OSError:
+            return
+        with self._lock:
+            self._size += os.path.getsize(cached)
+            if self._size > self._maxBytes:
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            for file, _, _ in self._entries():
+                os.remove(file)
+            self._size = 0
+
+    def _entries(self):
+        '''(file, modification time, size) of every cached frame.'''
+        entries = []
+        for directory, _, files in os.walk(self._folder):
+            for name in files:
+                file = os.path.join(directory, name)
+                try:
+                    stat = os.stat(file)
+                except OSError:
+                    continue
+                entries.append((file, stat.st_mtime, stat.st_size))
+        return entries
+
+    def _evict(self):
+        # Remove the least recently used frames until the cache is 10% under
+        # its cap, so eviction doesn't run again on every store.
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _, _, size in entries)
+        target = self._maxBytes * 0.9
+        for file, _, size in entries:
+            if self._size <= target:
+                break
+            try:
+                os.remove(file)
+                self._size -= size
+            except OSError:
+                pass
@@ -1,7 +1,8 @@
 #Author-Amanda Ghassaei
 #Description-Spinning animation of design
 
-import adsk.core, adsk.fusion, traceback, math, os
+import adsk.core, adsk.fusion, traceback, math, os, shutil, tempfile
+from . import contact_sheet, frame_writer, render_cache, trajectory, video_encoder
 
 app = adsk.core.Application.get()
 if app:
@@ -56,6 +57,42 @@ class CommandExecuteHandler(adsk.core.CommandEventHandler):
                     frameRecorder.centerY = input.value
                 elif input.id == 'centerZ':
                     frameRecorder.centerZ = input.value
+                elif input.id == 'writerThreads':
+                    frameRecorder.writerThreads = input.value
+                elif input.id == 'videoFormat':
+                    frameRecorder.videoFormat = input.selectedItem.name
+                elif input.id == 'frameRate':
+                    frameRecorder.frameRate = input.value
+                elif input.id == 'videoCrf':
+                    frameRecorder.videoCrf = input.value
+                elif input.id == 'videoBitrate':
+                    frameRecorder.videoBitrate = input.value
+                elif input.id == 'keepFrames':
+                    frameRecorder.keepFrames = input.value
+                elif input.id == 'tiltX':
+                    frameRecorder.tiltX = input.value
+                elif input.id == 'tiltZ':
+                    frameRecorder.tiltZ = input.value
+                elif input.id == 'helixPitch':
+                    frameRecorder.helixPitch = input.value
+                elif input.id == 'elevationSweep':
+                    frameRecorder.elevationSweep = input.value
+                elif input.id == 'easing':
+                    frameRecorder.easing = input.selectedItem.name
+                elif input.id == 'trajectoryFile':
+                    frameRecorder.trajectoryFile = input.value
+                elif input.id == 'renderCache':
+                    frameRecorder.renderCache = input.value
+                elif input.id == 'renderCacheFolder':
+                    frameRecorder.renderCacheFolder = input.value
+                elif input.id == 'renderCacheSize':
+                    frameRecorder.renderCacheSize = input.value
+                elif input.id == 'preview':
+                    frameRecorder.preview = input.value
+                elif input.id == 'previewFrames':
+                    frameRecorder.previewFrames = input.value
+                elif input.id == 'previewScale':
+                    frameRecorder.previewScale = input.value
 
             frameRecorder.collectFrames()
 
@@ -119,6 +156,37 @@ class CommandCreatedHandler(adsk.core.CommandCreatedEventHandler):
             inputs.addFloatSpinnerCommandInput('centerX', 'Center X', units, neg_infinity, pos_infinity, 0.1, frameRecorder.centerX)
             inputs.addFloatSpinnerCommandInput('centerY', 'Center Y', units, neg_infinity, pos_infinity, 0.1, frameRecorder.centerY)
             inputs.addFloatSpinnerCommandInput('centerZ', 'Center Z', units, neg_infinity, pos_infinity, 0.1, frameRecorder.centerZ)
+            # Trajectory params.
+            inputs.addFloatSpinnerCommandInput('tiltX', 'Axis Tilt X', 'deg', -math.pi / 2, math.pi / 2, math.radians(1), frameRecorder.tiltX)
+            inputs.addFloatSpinnerCommandInput('tiltZ', 'Axis Tilt Z', 'deg', -math.pi / 2, math.pi / 2, math.radians(1), frameRecorder.tiltZ)
+            inputs.addFloatSpinnerCommandInput('helixPitch', 'Helix Pitch', units, neg_infinity, pos_infinity, 0.1, frameRecorder.helixPitch)
+            inputs.addFloatSpinnerCommandInput('elevationSweep', 'Elevation Sweep', 'deg', -math.pi, math.pi, math.radians(1), frameRecorder.elevationSweep)
+            easingInput = inputs.addDropDownCommandInput('easing', 'Easing', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for easing in trajectory.easings:
+                easingInput.listItems.add(easing, easing == frameRecorder.easing)
+            trajectoryFileInput = inputs.addStringValueInput('trajectoryFile', 'Trajectory File', frameRecorder.trajectoryFile)
+            trajectoryFileInput.tooltip = 'Replay this trajectory file if it exists, otherwise save the planned one to it.'
+            # Output params.
+            inputs.addIntegerSpinnerCommandInput('writerThreads', 'Writer Threads', 0, 16, 1, frameRecorder.writerThreads)
+            # Video params.
+            videoFormatInput = inputs.addDropDownCommandInput('videoFormat', 'Encode Video', adsk.core.DropDownStyles.TextListDropDownStyle)
+            for videoFormat in video_encoder.videoFormats:
+                videoFormatInput.listItems.add(videoFormat, videoFormat == frameRecorder.videoFormat)
+            videoFormatInput.tooltip = 'MP4 needs ffmpeg on the PATH and falls back to APNG without it.'
+            inputs.addIntegerSpinnerCommandInput('frameRate', 'Frame Rate', 1, 240, 1, frameRecorder.frameRate)
+            inputs.addIntegerSpinnerCommandInput('videoCrf', 'Video CRF', 0, 51, 1, frameRecorder.videoCrf)
+            inputs.addIntegerSpinnerCommandInput('videoBitrate', 'Video Bitrate (kbps, 0 = CRF)', 0, max_int, 100, frameRecorder.videoBitrate)
+            inputs.addBoolValueInput('keepFrames', 'Keep Frame Images', True, '', frameRecorder.keepFrames)
+            # Frame cache params.
+            renderCacheInput = inputs.addBoolValueInput('renderCache', 'Reuse Cached Frames', True, '', frameRecorder.renderCache)
+            renderCacheInput.tooltip = 'Link frames rendered before from the same saved document version, parameters and camera instead of rendering them again.'
+            inputs.addStringValueInput('renderCacheFolder', 'Frame Cache Folder', frameRecorder.renderCacheFolder)
+            inputs.addIntegerSpinnerCommandInput('renderCacheSize', 'Frame Cache Size (MB)', 1, max_int, 100, frameRecorder.renderCacheSize)
+            # Preview params.
+            previewInput = inputs.addBoolValueInput('preview', 'Preview Contact Sheet', True, '', frameRecorder.preview)
+            previewInput.tooltip = 'Render a sample of the frames at low resolution into one image, then optionally the full animation.'
+            inputs.addIntegerSpinnerCommandInput('previewFrames', 'Preview Frames', 1, 1000, 1, frameRecorder.previewFrames)
+            inputs.addIntegerSpinnerCommandInput('previewScale', 'Preview Scale Down', 1, 64, 1, frameRecorder.previewScale)
 
 
         except:
@@ -136,6 +204,24 @@ class FrameRecorder:
         self._height = 2000
         self._framesPerRotation = 25
         self._numRotations = 1
+        self._writerThreads = 2
+        self._videoFormat = 'None'
+        self._frameRate = 30
+        self._videoCrf = 20
+        self._videoBitrate = 0
+        self._keepFrames = False
+        self._tiltX = 0.0
+        self._tiltZ = 0.0
+        self._helixPitch = 0.0
+        self._elevationSweep = 0.0
+        self._easing = 'Linear'
+        self._trajectoryFile = ''
+        self._renderCache = False
+        self._renderCacheFolder = os.path.expanduser('~/.fusion_render_cache/')
+        self._renderCacheSize = 2048
+        self._preview = False
+        self._previewFrames = 24
+        self._previewScale = 8
 
         viewport = app.activeViewport
         camera = viewport.camera
@@ -213,6 +299,160 @@ class FrameRecorder:
             value = 1
         self._numRotations = value
 
+    @property
+    def writerThreads(self):
+        return self._writerThreads
+    @writerThreads.setter
+    def writerThreads(self, value):
+        if value < 0:
+            value = 0
+        self._writerThreads = value
+
+    @property
+    def videoFormat(self):
+        return self._videoFormat
+    @videoFormat.setter
+    def videoFormat(self, value):
+        self._videoFormat = value
+
+    @property
+    def frameRate(self):
+        return self._frameRate
+    @frameRate.setter
+    def frameRate(self, value):
+        if value < 1:
+            value = 1
+        self._frameRate = value
+
+    @property
+    def videoCrf(self):
+        return self._videoCrf
+    @videoCrf.setter
+    def videoCrf(self, value):
+        self._videoCrf = value
+
+    @property
+    def videoBitrate(self):
+        return self._videoBitrate
+    @videoBitrate.setter
+    def videoBitrate(self, value):
+        self._videoBitrate = value
+
+    @property
+    def keepFrames(self):
+        return self._keepFrames
+    @keepFrames.setter
+    def keepFrames(self, value):
+        self._keepFrames = value
+
+    @property
+    def tiltX(self):
+        return self._tiltX
+    @tiltX.setter
+    def tiltX(self, value):
+        self._tiltX = value
+
+    @property
+    def tiltZ(self):
+        return self._tiltZ
+    @tiltZ.setter
+    def tiltZ(self, value):
+        self._tiltZ = value
+
+    @property
+    def helixPitch(self):
+        return self._helixPitch
+    @helixPitch.setter
+    def helixPitch(self, value):
+        self._helixPitch = value
+
+    @property
+    def elevationSweep(self):
+        return self._elevationSweep
+    @elevationSweep.setter
+    def elevationSweep(self, value):
+        self._elevationSweep = value
+
+    @property
+    def easing(self):
+        return self._easing
+    @easing.setter
+    def easing(self, value):
+        self._easing = value
+
+    @property
+    def trajectoryFile(self):
+        return self._trajectoryFile
+    @trajectoryFile.setter
+    def trajectoryFile(self, value):
+        self._trajectoryFile = value
+
+    @property
+    def renderCache(self):
+        return self._renderCache
+    @renderCache.setter
+    def renderCache(self, value):
+        self._renderCache = value
+
+    @property
+    def renderCacheFolder(self):
+        return self._renderCacheFolder
+    @renderCacheFolder.setter
+    def renderCacheFolder(self, value):
+        self._renderCacheFolder = value
+
+    @property
+    def renderCacheSize(self):
+        return self._renderCacheSize
+    @renderCacheSize.setter
+    def renderCacheSize(self, value):
+        if value < 1:
+            value = 1
+        self._renderCacheSize = value
+
+    @property
+    def preview(self):
+        return self._preview
+    @preview.setter
+    def preview(self, value):
+        self._preview = value
+
+    @property
+    def previewFrames(self):
+        return self._previewFrames
+    @previewFrames.setter
+    def previewFrames(self, value):
+        if value < 1:
+            value = 1
+        self._previewFrames = value
+
+    @property
+    def previewScale(self):
+        return self._previewScale
+    @previewScale.setter
+    def previewScale(self, value):
+        if value < 1:
+            value = 1
+        self._previewScale = value
+
+    def planTrajectory(self):
+        '''Load trajectoryFile if it exists, otherwise plan the orbit (and save it
+        to trajectoryFile if set).'''
+        file = self.trajectoryFile
+        if file and os.path.exists(file):
+            return trajectory.Trajectory.load(file)
+        target = self._cameraTarget
+        offset = self._cameraOffset
+        # The spin pivots around the world origin, tilted away from the y axis if requested.
+        planned = trajectory.planOrbit((target.x, target.y, target.z), (offset.x, offset.y, offset.z),
+                                       self.framesPerRotation * self.numRotations, self.framesPerRotation,
+                                       axis=trajectory.tiltedAxis(self.tiltX, self.tiltZ),
+                                       helixPitch=self.helixPitch, elevationSweep=self.elevationSweep,
+                                       easing=self.easing)
+        if file:
+            planned.save(file)
+        return planned
+
     def updateCamera(self):
         viewport = app.activeViewport
         camera = viewport.camera
@@ -229,36 +469,131 @@ class FrameRecorder:
         viewport.camera = camera
 
     def collectFrames(self):
+        frames = self.planTrajectory()
+        if self.preview:
+            self.renderPreview(frames)
+        else:
+            self.renderAnimation(frames)
+
+    def renderPreview(self, frames):
+        '''Render a sample of the trajectory at low resolution into a contact
+        sheet, then offer to render the same trajectory in full'''
+        sample = contact_sheet.sampleFrames(len(frames), self.previewFrames)
+        width, height = contact_sheet.scaledSize(self.width, self.height, self.previewScale)
+        sheetFile = self.outputPath + 'Spin_Animation_' + self.filename + '_preview.png'
+        previewFolder = tempfile.mkdtemp(prefix='preview_')
+        viewport = app.activeViewport
+        try:
+            bitmaps = []
+            for i in sample:
+                self.applyFrame(viewport, frames, i)
+                bitmap = os.path.join(previewFolder, '{}.bmp'.format(i))
+                if viewport.saveAsImageFile(bitmap, width, height):
+                    bitmaps.append(bitmap)
+            saved = contact_sheet.writeContactSheet(sheetFile, bitmaps)
+        finally:
+            shutil.rmtree(previewFolder, ignore_errors=True)
+
+        if not saved:
+            ui.messageBox('Failed saving the preview contact sheet.')
+            return
+        result = ui.messageBox('Saved {} of {} frames to {}.\nRender the full animation now?'.format(
+                               len(bitmaps), len(frames), sheetFile), 'Preview',
+                               adsk.core.MessageBoxButtonTypes.YesNoButtonType,
+                               adsk.core.MessageBoxIconTypes.QuestionIconType)
+        if result == adsk.core.DialogResults.DialogYes:
+            self.renderAnimation(frames)
+
+    def renderAnimation(self, frames):
+        # Frames are compressed and written by a writer pool while the next one renders.
+        writer = frame_writer.FrameWriter(self.writerThreads)
+        # Finished frames are streamed into the video, if one is requested.
+        encoder = video_encoder.createEncoder(self.videoFormat, self.outputPath + 'Spin_Animation_' + self.filename,
+                                              self.frameRate, self.videoCrf, self.videoBitrate, self.keepFrames)
+        try:
+            self.renderFrames(writer, encoder, frames)
+        finally:
+            try:
+                writer.close()
+            finally:
+                if encoder:
+                    encoder.close()
+
+    def timelineKey(self, cache):
+        '''Cache key of the model: the type, name, suppression and parameter
+        expressions of the timeline items before the marker, chained onto
+        the document's user parameters'''
+        document = app.activeDocument
+        design = adsk.fusion.Design.cast(app.activeProduct)
+        expressions = {}
+        for param in design.allParameters:
+            try:
+                token = param.createdBy.entityToken
+            except:
+                # User parameters aren't created by a timeline item.
+                continue
+            expressions.setdefault(token, []).append([param.name, param.expression])
+        key = cache.key(document.dataFile.id if document.dataFile else document.name,
+                        [[param.name, param.expression] for param in design.userParameters])
+        timeline = design.timeline
+        for i in range(timeline.markerPosition):
+            item = timeline.item(i)
+            try:
+                entity = item.entity
+                itemKey = [type(entity).__name__, item.name, item.isSuppressed, expressions.get(entity.entityToken, [])]
+            except:
+                itemKey = [item.name, item.isSuppressed]
+            key = cache.key(key, itemKey)
+        return key
+
+    def applyFrame(self, viewport, frames, i):
+        '''Move the viewport camera to frame i of the trajectory'''
+        eye, target, upVector = frames.frame(i)
+        camera = viewport.camera
+        camera.target = adsk.core.Point3D.create(*target)
+        camera.eye = adsk.core.Point3D.create(*eye)
+        camera.viewExtents = self._cameraExtents
+        # Set camera property to trigger update.
+        camera.upVector = adsk.core.Vector3D.create(*upVector)
+        viewport.camera = camera
+
+    def renderFrames(self, writer, encoder=None, frames=None):
         width = self.width
         height = self.height
         filename = self.filename
         outputPath = self.outputPath
-        framesPerRotation = self.framesPerRotation
-        numRotations = self.numRotations
+        if frames is None:
+            frames = self.planTrajectory()
 
         viewport = app.activeViewport
 
-        for i in range(0, framesPerRotation * numRotations):
-            camera = viewport.camera
-            camera.target = self._cameraTarget
-            offset = camera.target.copy()
-            offset.translateBy(self._cameraOffset)
-            camera.eye = offset
-            camera.viewExtents = self._cameraExtents
-            # Rotate camera around y axis.
-            angle = math.pi * 2.0 * i / framesPerRotation
-            eye = camera.eye
-            cos = math.cos(angle)
-            sin = math.sin(angle)
-            camera.eye = adsk.core.Point3D.create(eye.x * cos + eye.z * sin, eye.y, - eye.x * sin + eye.z * cos)
-            # Set camera property to trigger update.
-            camera.upVector = adsk.core.Vector3D.create(0, 1, 0)
-            viewport.camera = camera
+        # Frames rendered by earlier runs are reused from the frame cache.
+        cache = None
+        if self.renderCache:
+            cache = render_cache.RenderCache(self.renderCacheFolder, self.renderCacheSize * 1024 * 1024)
+            timelineKey = self.timelineKey(cache)
+
+        for i in range(len(frames)):
+            self.applyFrame(viewport, frames, i)
 
             # Save image.
-            success = app.activeViewport.saveAsImageFile(outputPath + 'Spin_Animation_' + filename + '/' + filename + '_' + str(i) + '.png', width, height)
+            imageFile = outputPath + 'Spin_Animation_' + filename + '/' + filename + '_' + str(i) + '.png'
+            if cache:
+                camera = viewport.camera
+                key = cache.key(timelineKey, [[p.x, p.y, p.z] for p in (camera.eye, camera.target, camera.upVector)],
+                                camera.viewExtents, width, height)
+                success = cache.fetch(key, imageFile)
+                if not success:
+                    success = writer.saveImage(app.activeViewport, imageFile, width, height)
+                    if success:
+                        # Store once written, before a video encoder removes the frame.
+                        writer.after(cache.store, key, imageFile)
+            else:
+                success = writer.saveImage(app.activeViewport, imageFile, width, height)
             if not success:
                 ui.messageBox('Failed saving viewport image.')
+            elif encoder:
+                writer.after(encoder.addFrame, i, imageFile)
 
 
 
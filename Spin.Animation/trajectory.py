@@ -0,0 +1,121 @@
+#Description-Camera trajectory planner for the spin animation
+
+# Precomputes the camera eye, target and up vector of every frame in one
+# pass, so the recorder only applies a table entry per frame. Besides the
+# plain spin around the y axis, the orbit axis can be tilted, the eye can
+# climb along the axis (helix) and sweep its elevation, all with easing.
+# Trajectories can be saved and loaded to re-render the same path.
+
+import array, json, math
+
+def _linear(t):
+    return t
+
+def _easeIn(t):
+    return t * t
+
+def _easeOut(t):
+    return t * (2.0 - t)
+
+def _easeInOut(t):
+    return 0.5 - 0.5 * math.cos(math.pi * t)
+
+easings = {
+    'Linear': _linear,
+    'Ease In': _easeIn,
+    'Ease Out': _easeOut,
+    'Ease In Out': _easeInOut,
+}
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0])
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def _normalize(v):
+    length = math.sqrt(_dot(v, v))
+    return (v[0] / length, v[1] / length, v[2] / length) if length else v
+
+def tiltedAxis(tiltX, tiltZ):
+    '''The y axis tilted by tiltX radians about x, then tiltZ radians about z.'''
+    y, z = math.cos(tiltX), math.sin(tiltX)
+    return (-y * math.sin(tiltZ), y * math.cos(tiltZ), z)
+
+
+class Trajectory:
+    '''Per frame camera eye, target and up vector as flat xyz arrays.'''
+    def __init__(self, eyes, targets, ups):
+        self.eyes = array.array('d', eyes)
+        self.targets = array.array('d', targets)
+        self.ups = array.array('d', ups)
+
+    def __len__(self):
+        return len(self.eyes) // 3
+
+    def frame(self, i):
+        '''(eye, target, up) tuples of frame i.'''
+        return (tuple(self.eyes[i * 3:i * 3 + 3]),
+                tuple(self.targets[i * 3:i * 3 + 3]),
+                tuple(self.ups[i * 3:i * 3 + 3]))
+
+    def save(self, file):
+        with open(file, 'w') as fh:
+            json.dump({'eyes': list(self.eyes), 'targets': list(self.targets), 'ups': list(self.ups)}, fh)
+
+    @classmethod
+    def load(cls, file):
+        with open(file, 'r') as fh:
+            data = json.load(fh)
+        trajectory = cls(data['eyes'], data['targets'], data['ups'])
+        if not (len(trajectory.eyes) == len(trajectory.targets) == len(trajectory.ups)) or len(trajectory.eyes) % 3:
+            raise ValueError('Malformed trajectory file: {}'.format(file))
+        return trajectory
+
+
+def planOrbit(target, offset, frameCount, framesPerRotation, axis=(0.0, 1.0, 0.0), pivot=(0.0, 0.0, 0.0),
+              helixPitch=0.0, elevationSweep=0.0, easing='Linear'):
+    '''Plan frameCount frames orbiting the eye (target + offset) around axis
+    through pivot, one revolution per framesPerRotation frames.
+
+    helixPitch moves the eye along the axis per revolution; elevationSweep
+    (radians) tilts the eye towards the axis over the whole animation. The
+    easing applies to the progress through the animation.'''
+    ease = easings[easing]
+    k = _normalize(axis)
+    v0 = tuple(target[c] + offset[c] - pivot[c] for c in range(3))
+    rotations = frameCount / framesPerRotation if framesPerRotation else 0.0
+    # Progress through the whole animation, eased, for every frame.
+    progress = [ease(i / frameCount) for i in range(frameCount)] if frameCount else []
+    angles = [math.pi * 2.0 * rotations * p for p in progress]
+    coss = list(map(math.cos, angles))
+    sins = list(map(math.sin, angles))
+
+    # Elevation: rotate the start offset towards the axis about the horizontal
+    # direction perpendicular to both.
+    if elevationSweep:
+        side = _normalize(_cross(v0, k))
+        up = _cross(side, v0)
+        along = _dot(side, v0)
+        offsets = []
+        for p in progress:
+            c, s = math.cos(elevationSweep * p), math.sin(elevationSweep * p)
+            offsets.append(tuple(v0[n] * c + up[n] * s + side[n] * along * (1.0 - c) for n in range(3)))
+        crosses = [_cross(k, v) for v in offsets]
+        parallels = [_dot(k, v) for v in offsets]
+    else:
+        offsets = [v0] * frameCount
+        crosses = [_cross(k, v0)] * frameCount
+        parallels = [_dot(k, v0)] * frameCount
+
+    # Rodrigues rotation about k: v cos + (k x v) sin + k (k . v)(1 - cos),
+    # plus the helix climb along k, one component column at a time.
+    eyes = array.array('d', bytes(24 * frameCount))
+    for n in range(3):
+        climb = k[n] * helixPitch * rotations
+        eyes[n::3] = array.array('d', [
+            v[n] * c + w[n] * s + k[n] * d * (1.0 - c) + pivot[n] + climb * p
+            for v, w, d, c, s, p in zip(offsets, crosses, parallels, coss, sins, progress)])
+    targets = array.array('d', tuple(target) * frameCount)
+    ups = array.array('d', k * frameCount)
+    return Trajectory(eyes, targets, ups)